@@ -0,0 +1,340 @@
+'''
+This module implements the community detection backends of the seed communities and of the coordination-aware sweep:
+    - "python-louvain": community_louvain.best_partition on the networkx graph (the original implementation)
+    - "csr": Louvain algorithm on the CSR adjacency matrix of the graph. The local moving phase processes the nodes in random batches:
+      the best move of every node of a batch is computed at once with sparse operations, and the moves are applied together
+      if they increase the modularity (otherwise the half of the moves with the largest gains is tried, and so on).
+      The aggregation phase is a sparse matrix product. As in python-louvain 0.16, the moves maximize the modularity with the resolution
+      on the null model term, while the passes and the levels stop when the quality of python-louvain (see louvain_quality) does not increase
+    - "leiden": Leiden algorithm of the leidenalg package (optional dependency, with igraph), on the same CSR adjacency
+All the backends take the same resolution, warm start partition and random_state, and return a dict node -> community.
+'''
+
+from .lib import my_print
+import community.community_louvain as community_louvain
+import networkx as nx
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+try:
+    import igraph
+    import leidenalg
+except ImportError:
+    leidenalg = None
+
+BACKENDS = ["python-louvain", "csr", "leiden"]
+MIN_INCREASE = 1e-7  # minimum quality increase of a pass or level (as in python-louvain)
+MIN_GAIN = 1e-12  # minimum modularity gain of a move
+
+
+def detect_communities(G, partition=None, resolution=1., random_state=0, backend="python-louvain", check_parity=False):
+    """
+    Compute the communities of a graph.
+    :param G: (networkx.Graph) the graph, with a "weight" edge attribute
+    :param partition: (dict) node -> community used as warm start (None: every node starts in its own community)
+    :param resolution: (float) the resolution parameter of the louvain algorithm
+    :param random_state: (int) seed of the random order of the nodes
+    :param backend: (str) "python-louvain", "csr" or "leiden"
+    :param check_parity: (bool) if True, the partition is compared with the python-louvain partition (see log_parity)
+    :return: (dict) node -> community
+    """
+    if backend == "python-louvain":
+        return community_louvain.best_partition(G, partition=partition, resolution=resolution, randomize=False, random_state=random_state)
+    edges = list(G.edges(data="weight", default=1.))
+    sources = np.array([edge[0] for edge in edges])
+    targets = np.array([edge[1] for edge in edges])
+    weights = np.array([edge[2] for edge in edges], dtype=np.float64)
+    result = edge_communities(np.array(list(G)), sources, targets, weights, partition=partition, resolution=resolution, random_state=random_state, backend=backend)
+    if check_parity:
+        log_parity(G, result, partition, resolution, random_state, backend)
+    return result
+
+
+def edge_communities(nodes, sources, targets, weights, partition=None, resolution=1., random_state=0, backend="csr", check_parity=False):
+    """
+    Compute the communities of the graph given by its edge arrays, without building a networkx graph ("csr" and "leiden" backends).
+    :param nodes: (numpy.ndarray) the nodes of the graph
+    :param sources: (numpy.ndarray) the source node of each edge
+    :param targets: (numpy.ndarray) the target node of each edge
+    :param weights: (numpy.ndarray) the weight of each edge
+    :param partition: (dict) node -> community used as warm start, the nodes missing from it start in their own community
+    :param resolution: (float) the resolution parameter
+    :param random_state: (int) seed of the random order of the nodes
+    :param backend: (str) "csr" or "leiden"
+    :param check_parity: (bool) if True, the partition is compared with the python-louvain partition (see log_parity)
+    :return: (dict) node -> community
+    """
+    if backend not in BACKENDS[1:]:
+        raise ValueError(f"Unknown community detection backend '{backend}' for edge arrays. Possible values: 'csr', 'leiden'.")
+    node_index = pd.Index(nodes)
+    A = adjacency_matrix(len(nodes), node_index.get_indexer(sources), node_index.get_indexer(targets), weights)
+    labels = None
+    if partition is not None:
+        labels = np.array([partition.get(node, -1) for node in node_index.tolist()], dtype=np.int64)
+        missing = labels < 0
+        labels[missing] = labels.max(initial=-1) + 1 + np.arange(missing.sum())
+    if backend == "csr":
+        labels = louvain_csr(A, labels=labels, resolution=resolution, random_state=random_state)
+    else:
+        labels = leiden_csr(A, labels=labels, resolution=resolution, random_state=random_state)
+    # communities numbered in order of first node
+    _, first, labels = np.unique(labels, return_index=True, return_inverse=True)
+    labels = np.argsort(np.argsort(first))[labels]
+    result = dict(zip(node_index.tolist(), labels.tolist()))
+    if check_parity:
+        G = nx.Graph()
+        G.add_nodes_from(node_index.tolist())
+        G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), weights.tolist()))
+        log_parity(G, result, partition, resolution, random_state, backend)
+    return result
+
+
+def log_parity(G, result, partition, resolution, random_state, backend):
+    """
+    Compare a partition computed by a backend with the partition computed by python-louvain on the same graph:
+    the number of communities, the normalized mutual information of the two partitions and their modularity are logged.
+    :return: (dict) the number of communities of the backend and of python-louvain ("communities", "reference_communities"),
+        their normalized mutual information ("nmi") and the modularity difference ("modularity_difference", backend - python-louvain)
+    """
+    reference = community_louvain.best_partition(G, partition=partition, resolution=resolution, randomize=False, random_state=random_state)
+    nodes = list(G)
+    parity = {"communities": len(set(result.values())),
+              "reference_communities": len(set(reference.values())),
+              "nmi": normalized_mutual_information([result[node] for node in nodes], [reference[node] for node in nodes]),
+              "modularity_difference": partition_modularity(G, result, resolution) - partition_modularity(G, reference, resolution)}
+    my_print("Parity {0} vs python-louvain: {1} vs {2} communities, NMI {3:.4f}, modularity difference {4:+.6f}.".format(
+        backend, parity["communities"], parity["reference_communities"], parity["nmi"], parity["modularity_difference"]))
+    return parity
+
+
+def normalized_mutual_information(labels_a, labels_b):
+    """
+    Normalized mutual information of two partitions (mutual information divided by the mean of the entropies).
+    :param labels_a: (list) the community of each node in the first partition
+    :param labels_b: (list) the community of each node in the second partition, in the same order
+    :return: (float) the NMI, between 0 and 1 (1 for identical partitions, including two partitions with a single community)
+    """
+    _, a = np.unique(np.asarray(labels_a), return_inverse=True)
+    _, b = np.unique(np.asarray(labels_b), return_inverse=True)
+    n = len(a)
+    if n == 0:
+        return 1.
+    joint = sp.coo_matrix((np.ones(n), (a.ravel(), b.ravel()))).tocsr()
+    joint.sum_duplicates()
+    p_ab = joint.data / n
+    p_a = np.bincount(a.ravel()) / n
+    p_b = np.bincount(b.ravel()) / n
+    rows, cols = joint.nonzero()
+    mutual = np.sum(p_ab * np.log(p_ab / (p_a[rows] * p_b[cols])))
+    entropy_a = -np.sum(p_a * np.log(p_a))
+    entropy_b = -np.sum(p_b * np.log(p_b))
+    if entropy_a + entropy_b == 0:
+        return 1.
+    return float(max(0., 2 * mutual / (entropy_a + entropy_b)))
+
+
+def partition_modularity(G, partition, resolution=1.):
+    """
+    Modularity of a partition of a networkx graph, with the resolution on the null model term (the objective of the louvain moves).
+    :param G: (networkx.Graph) the graph
+    :param partition: (dict) node -> community
+    :param resolution: (float) the resolution parameter
+    :return: (float) the modularity
+    """
+    if G.number_of_edges() == 0:
+        return 0.
+    communities = pd.Series(list(partition.keys())).groupby(list(partition.values())).agg(list)
+    return nx.community.modularity(G, communities.tolist(), weight="weight", resolution=resolution)
+
+
+def adjacency_matrix(n_nodes, sources, targets, weights):
+    """
+    Build the symmetric CSR adjacency matrix of an undirected graph (self-loops are counted twice in the degree, as in networkx).
+    :param n_nodes: (int) number of nodes
+    :param sources: (numpy.ndarray) index of the source node of each edge
+    :param targets: (numpy.ndarray) index of the target node of each edge
+    :param weights: (numpy.ndarray) weight of each edge
+    :return: (scipy.sparse.csr_matrix) the adjacency matrix
+    """
+    A = sp.csr_matrix((weights, (sources, targets)), shape=(n_nodes, n_nodes), dtype=np.float64)
+    return (A + A.T).tocsr()
+
+
+def modularity_csr(A, labels, resolution=1.):
+    """
+    Modularity of a partition of the graph with adjacency matrix A.
+    :param A: (scipy.sparse.csr_matrix) the adjacency matrix
+    :param labels: (numpy.ndarray) the community of each node
+    :param resolution: (float) the resolution parameter
+    :return: (float) the modularity
+    """
+    two_m = A.sum()
+    if two_m == 0:
+        return 0.
+    coo = A.tocoo()
+    internal = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    totals = np.bincount(labels, weights=np.asarray(A.sum(axis=1)).ravel())
+    return internal / two_m - resolution * np.sum((totals / two_m) ** 2)
+
+
+def louvain_quality(A, labels, resolution=1.):
+    """
+    Quality used by python-louvain 0.16 to stop the passes and the levels: the resolution multiplies the fraction of internal edges
+    instead of the null model term, so it differs from the modularity maximized by the moves when the resolution is not 1
+    (at resolution 1 it is the modularity).
+    :param A: (scipy.sparse.csr_matrix) the adjacency matrix
+    :param labels: (numpy.ndarray) the community of each node
+    :param resolution: (float) the resolution parameter
+    :return: (float) the quality
+    """
+    two_m = A.sum()
+    if two_m == 0:
+        return 0.
+    coo = A.tocoo()
+    internal = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    totals = np.bincount(labels, weights=np.asarray(A.sum(axis=1)).ravel())
+    return resolution * internal / two_m - np.sum((totals / two_m) ** 2)
+
+
+def best_moves(A_off, nodes, labels, degrees, totals, two_m, resolution, priority):
+    """
+    Find the best move of each node of a batch, i.e. the neighbor community with the largest modularity gain
+    (ties are broken by the priority of the communities).
+    :return: (nodes, communities, gains) the nodes with a positive gain, their best community and the gain
+    """
+    rows = A_off[nodes].tocoo()
+    n_labels = len(totals)
+    keys, inverse = np.unique(rows.row.astype(np.int64) * n_labels + labels[rows.col], return_inverse=True)
+    k_in = np.bincount(inverse.ravel(), weights=rows.data)
+    row = keys // n_labels
+    community = keys % n_labels
+    node = nodes[row]
+    own = community == labels[node]
+    # gain (up to a factor 2 / two_m) of joining community after leaving the own community
+    value = k_in - resolution * degrees[node] * (totals[community] - np.where(own, degrees[node], 0.)) / two_m
+    stay = -resolution * degrees[nodes] * (totals[labels[nodes]] - degrees[nodes]) / two_m
+    stay[row[own]] = value[own]
+    gain = 2 * (value - stay[row]) / two_m
+    gain[own] = -np.inf
+    order = np.lexsort((priority[community], -gain, row))
+    best = order[np.r_[True, row[order][1:] != row[order][:-1]]] if len(order) > 0 else order
+    best = best[gain[best] > MIN_GAIN]
+    return node[best], community[best], gain[best]
+
+
+def moves_increase(A_off, labels, nodes, communities, degrees, totals, two_m, resolution):
+    """
+    Modularity increase of moving the nodes to the communities at once, computed on the edges of the moved nodes only.
+    :return: (increase, labels, totals) the modularity increase and the labels and community totals after the moves
+    """
+    new_labels = labels.copy()
+    new_labels[nodes] = communities
+    rows = A_off[nodes].tocoo()
+    i = nodes[rows.row]
+    j = rows.col
+    moved = np.zeros(len(labels), dtype=bool)
+    moved[nodes] = True
+    # the edges between a moved node and a node that did not move are seen once, but count twice in the symmetric adjacency matrix
+    weight = np.where(moved[j], 1., 2.) * rows.data
+    internal = np.sum(weight * ((new_labels[i] == new_labels[j]).astype(np.float64) - (labels[i] == labels[j])))
+    new_totals = totals + np.bincount(communities, weights=degrees[nodes], minlength=len(totals)) - np.bincount(labels[nodes], weights=degrees[nodes], minlength=len(totals))
+    null = np.sum(new_totals ** 2 - totals ** 2)
+    return internal / two_m - resolution * null / two_m ** 2, new_labels, new_totals
+
+
+def local_moving(A, labels, resolution, rng, batches=16):
+    """
+    Local moving phase of the louvain algorithm: the nodes are moved to the neighbor community with the largest modularity gain,
+    in random batches, until a pass over all the nodes does not increase the quality (see louvain_quality) by at least MIN_INCREASE.
+    :return: (labels, quality) the communities of the nodes and the quality
+    """
+    n = A.shape[0]
+    degrees = np.asarray(A.sum(axis=1)).ravel()
+    two_m = degrees.sum()
+    A_off = (A - sp.diags(A.diagonal())).tocsr()
+    A_off.eliminate_zeros()
+    labels = np.unique(labels, return_inverse=True)[1].ravel()
+    totals = np.bincount(labels, weights=degrees, minlength=n)
+    quality = louvain_quality(A, labels, resolution)
+    while True:
+        start_quality = quality
+        priority = rng.random(n)
+        for batch in np.array_split(rng.permutation(n), min(batches, n)):
+            nodes, communities, gains = best_moves(A_off, batch, labels, degrees, totals, two_m, resolution, priority)
+            order = np.argsort(-gains, kind="stable")
+            k = len(order)
+            # moves of neighbor nodes can conflict: if all the moves do not increase the modularity, the moves with the largest gains are tried
+            while k > 0:
+                increase, new_labels, new_totals = moves_increase(A_off, labels, nodes[order[:k]], communities[order[:k]], degrees, totals, two_m, resolution)
+                if increase > 0:
+                    labels, totals = new_labels, new_totals
+                    break
+                k //= 2
+        quality = louvain_quality(A, labels, resolution)
+        if quality - start_quality < MIN_INCREASE:
+            break
+    return labels, quality
+
+
+def louvain_csr(A, labels=None, resolution=1., random_state=0, batches=16):
+    """
+    Louvain algorithm on the adjacency matrix of a graph: local moving phases alternate with the aggregation of the communities
+    in the nodes of a smaller graph, until the quality increase of a level (see louvain_quality) is smaller than MIN_INCREASE.
+    :param A: (scipy.sparse.csr_matrix) the symmetric adjacency matrix
+    :param labels: (numpy.ndarray) the communities used as warm start (None: every node starts in its own community)
+    :param resolution: (float) the resolution parameter
+    :param random_state: (int) seed of the random order of the nodes
+    :param batches: (int) number of batches of nodes moved at once in each pass of the local moving phase
+    :return: (numpy.ndarray) the community of each node
+    """
+    rng = np.random.default_rng(random_state)
+    n = A.shape[0]
+    membership = np.arange(n)
+    if A.nnz == 0:
+        return membership
+    current = membership if labels is None else np.asarray(labels)
+    quality = None
+    while True:
+        current, new_quality = local_moving(A, current, resolution, rng, batches=batches)
+        current = np.unique(current, return_inverse=True)[1].ravel()
+        n_communities = current.max() + 1
+        if quality is not None and new_quality - quality < MIN_INCREASE:
+            break
+        membership = current[membership]
+        quality = new_quality
+        if n_communities == A.shape[0]:
+            break
+        P = sp.csr_matrix((np.ones(len(current)), (np.arange(len(current)), current)), shape=(len(current), n_communities))
+        A = (P.T @ A @ P).tocsr()
+        current = np.arange(n_communities)
+    return membership
+
+
+def leiden_csr(A, labels=None, resolution=1., random_state=0):
+    """
+    Leiden algorithm of the leidenalg package on the adjacency matrix of a graph (RBConfiguration quality, i.e. modularity with resolution).
+    :param A: (scipy.sparse.csr_matrix) the symmetric adjacency matrix
+    :param labels: (numpy.ndarray) the communities used as warm start (None: every node starts in its own community)
+    :param resolution: (float) the resolution parameter
+    :param random_state: (int) seed of the random number generator of leidenalg
+    :return: (numpy.ndarray) the community of each node
+    """
+    if leidenalg is None:
+        raise ImportError("The leidenalg and igraph packages are required by the 'leiden' backend.")
+    upper = sp.triu(A).tocoo()
+    # the diagonal of A counts the self-loops twice
+    data = np.where(upper.row == upper.col, upper.data / 2, upper.data)
+    graph = igraph.Graph(n=A.shape[0], edges=list(zip(upper.row.tolist(), upper.col.tolist())))
+    result = leidenalg.find_partition(graph, leidenalg.RBConfigurationVertexPartition, weights=data.tolist(), resolution_parameter=resolution,
+                                      initial_membership=None if labels is None else np.unique(labels, return_inverse=True)[1].ravel().tolist(), seed=random_state)
+    return np.asarray(result.membership)
+
+
+if __name__ == "__main__":
+    # Input example
+    G = nx.karate_club_graph()
+    # Function call
+    partition = detect_communities(G, resolution=1., random_state=0, backend="csr", check_parity=True)
+    # Output example
+    print(partition)  # {0: 0, 1: 0, 2: 0, 3: 0, 4: 1, ...}
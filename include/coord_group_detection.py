@@ -1,47 +1,406 @@
 from .lib import *
+from .edge_store import load_edge_list
+from .user_index import intern_user_ids
+from .community_detection import BACKENDS, edge_communities
 import networkx as nx
 import numpy as np
 import community as community_louvain
 import jsonlines
 import json
 import pandas as pd
+import scipy.sparse as sp
+import itertools
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import csv
+import os
+import tempfile
 
 def compute_louvain_partitions(node_csv_path, edge_csv_path, louvain_resolution, partitions_path,
-                       quantile_start=0, quantile_stop=1, quantile_steps=101, seed_mod_path=None):
+                       quantile_start=0, quantile_stop=1, quantile_steps=101, seed_mod_path=None,
+                       sweep="fixed", refine_tolerance=0.01, min_quantile_gap=0.0025, backend="python-louvain", check_parity=False,
+                       workers=1, report_path=None, seed_mod=None):
 
-    if seed_mod_path is not None:
+    if quantile_start > quantile_stop:
+        raise ValueError("quantile_start must not be greater than quantile_stop.")
+    if sweep not in ["fixed", "adaptive", "segmented"]:
+        raise ValueError(f"Unknown sweep '{sweep}'. Possible values: 'fixed', 'adaptive', 'segmented'.")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown community detection backend '{backend}'. Possible values: {BACKENDS}.")
+    _, columns = load_edge_list(edge_csv_path)
+    weights = np.asarray(columns["weight"], dtype=np.float64)
+    my_print("Building network...")
+    G, user_ids = load_indexed_graph_from_csvs(node_csv_path, edge_csv_path)
+
+    if seed_mod is None and seed_mod_path is not None:
         my_print("Loading seed partition...")
         with open(seed_mod_path, "r") as handle:
             seed_mod = json.load(handle)
 
+    if seed_mod is not None:
         prev = {}
-        for m, nodes in seed_mod.items():
-            for node in nodes:
-                prev.setdefault(str(node), int(m))
+        _, seed_nodes = intern_user_ids(user_ids, [str(node) for nodes in seed_mod.values() for node in nodes])
+        seed_modularities = [int(m) for m, nodes in seed_mod.items() for node in nodes]
+        for node, m in zip(seed_nodes.tolist(), seed_modularities):
+            prev.setdefault(node, m)
     else:
         prev = None
-    df_edge = pd.read_csv(edge_csv_path, dtype = {
-        "source": str,
-        "target": str
-    })
-    my_print("Building network...")
-    G = load_graph_from_csvs(node_csv_path, edge_csv_path)
+
+    quantiles = np.linspace(quantile_start, quantile_stop, num=quantile_steps)
+    if sweep == "adaptive":
+        partitions = adaptive_louvain_partitions(G, weights, quantiles, prev, louvain_resolution, refine_tolerance, min_quantile_gap,
+                                                 backend=backend, check_parity=check_parity)
+        with jsonlines.open(partitions_path, mode="w") as handle:
+            for quantile in sorted(partitions):
+                threshold, partition = partitions[quantile]
+                handle.write({"quantile": quantile, "threshold": threshold, "communities_raw": reverse_partition(partition, user_ids)})
+        return partitions_path
+
+    thresholds = quantile_thresholds(weights, quantiles)
+    if sweep == "segmented":
+        return segmented_louvain_partitions(G, user_ids, quantiles, thresholds, prev, louvain_resolution, partitions_path, workers,
+                                            backend=backend, check_parity=check_parity, report_path=report_path)
+
+    louvain_sweep = partition_sweep(G, louvain_resolution, backend=backend, check_parity=check_parity)
+    next(louvain_sweep)
 
     with jsonlines.open(partitions_path, mode="w") as handle:
 
-        for i, quantile in enumerate(np.linspace(quantile_start, quantile_stop, num=quantile_steps)):
+        for i, (quantile, threshold) in enumerate(zip(quantiles, thresholds)):
 
             my_print("Computing partition {0}/{1}.".format(i+1, quantile_steps))
-            threshold = df_edge.weight.quantile(quantile)
-            G_filtered = nx.Graph(((source, target, attr) for source, target, attr in G.edges(data=True) if attr['weight'] >= threshold))
-            partition = community_louvain.best_partition(G_filtered, partition=prev, resolution=louvain_resolution, randomize=False, random_state=0)
+            partition = louvain_sweep.send((threshold, prev))
             prev = partition
-            reversed_partition = reverse_partition(partition)
+            reversed_partition = reverse_partition(partition, user_ids)
             handle.write({"quantile": quantile, "threshold": threshold, "communities_raw": reversed_partition})
 
     return partitions_path
 
-def reverse_partition(p):
+
+def segmented_louvain_partitions(G, user_ids, quantiles, thresholds, seed_partition, louvain_resolution, partitions_path, workers,
+                                 backend="python-louvain", check_parity=False, report_path=None):
+    """
+    Approximate parallel version of the threshold sweep: the quantiles are split in a segment per worker, and the segments are swept concurrently by a process pool.
+    The warm start of the first quantile of each segment is a checkpoint computed by a coarse sequential pass over the quantiles preceding the segments
+    (each checkpoint warm-started from the previous one), and the partitions of the segments are stitched in partitions_path.
+    The workers rebuild the graph from its nodes and edges (in the order of G.edges), memory-mapped from a temporary directory next to partitions_path.
+    The partitions generally differ from the sequential sweep: the louvain partitions depend on the warm start, including the values and the order of its labels,
+    so a segment warm-started from a checkpoint is not the continuation of the previous segment, even when the groups are the same.
+    As a diagnostic, each segment also computes the partition of the first quantile of the next segment warm-started from its own last partition,
+    and the fraction of the nodes whose group differs from the first partition of the next segment is logged and saved in report_path.
+    The diagnostic only measures the boundaries of the segments: the partitions at the following quantiles of a segment are not compared with the sequential sweep.
+    :param G: (networkx.Graph) the graph, with int nodes and a "weight" edge attribute
+    :param user_ids: (numpy.ndarray) the user id table, where user_ids[node] is the user id of node
+    :param quantiles: (numpy.ndarray) the quantiles
+    :param thresholds: (numpy.ndarray) the thresholds of the quantiles
+    :param seed_partition: (dict) the warm start of the first quantile (None for no warm start)
+    :param louvain_resolution: (float) the resolution parameter of the louvain algorithm
+    :param partitions_path: (str) the path of the JSONlines file of the partitions
+    :param workers: (int) number of processes (and segments)
+    :param backend: (str) the community detection backend (see include/community_detection.py)
+    :param check_parity: (bool) if True, each partition is compared with the python-louvain partition (see community_detection.log_parity)
+    :param report_path: (str) the path of the csv with the segment boundaries (header: segment, quantile_start, quantile_stop, membership_change), None to only log them
+    :return: (str) partitions_path
+    """
+    segments = [segment for segment in np.array_split(np.arange(len(quantiles)), workers) if len(segment) > 0]
+    my_print("Computing {0} warm start checkpoints...".format(len(segments) - 1))
+    checkpoints = [seed_partition]
+    louvain_sweep = partition_sweep(G, louvain_resolution, backend=backend)
+    next(louvain_sweep)
+    for segment in segments[1:]:
+        checkpoints.append(louvain_sweep.send((thresholds[segment[0] - 1], checkpoints[-1])))
+    louvain_sweep.close()
+
+    my_print("Computing partitions of {0} segments with {1} workers...".format(len(segments), workers))
+    segment_paths = [Path(str(partitions_path) + ".segment{}".format(j)) for j in range(len(segments))]
+    edges = list(G.edges(data="weight"))
+    graph_arrays = {"nodes": np.fromiter(G, dtype=np.int64, count=G.number_of_nodes()),
+                    "source": np.array([edge[0] for edge in edges], dtype=np.int64),
+                    "target": np.array([edge[1] for edge in edges], dtype=np.int64),
+                    "weight": np.array([edge[2] for edge in edges], dtype=np.float64),
+                    "user_ids": np.asarray(user_ids, dtype=str)}
+    del edges
+    try:
+        with tempfile.TemporaryDirectory(dir=Path(partitions_path).parent) as graph_dir:
+            for name, values in graph_arrays.items():
+                np.save(Path(graph_dir) / f"{name}.npy", values)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(louvain_partitions_segment, graph_dir, louvain_resolution, quantiles[segment], thresholds[segment],
+                                           checkpoints[j], segment_paths[j], lookahead=thresholds[segments[j + 1][0]] if j + 1 < len(segments) else None,
+                                           backend=backend, check_parity=check_parity)
+                           for j, segment in enumerate(segments)]
+                results = [future.result() for future in futures]
+
+        with open(partitions_path, "wb") as handle:
+            for segment_path in segment_paths:
+                with open(segment_path, "rb") as segment_handle:
+                    handle.write(segment_handle.read())
+    finally:
+        # the partial segments are removed also when a worker fails
+        for segment_path in segment_paths:
+            if segment_path.exists():
+                os.remove(segment_path)
+
+    rows = []
+    for j in range(1, len(segments)):
+        change = membership_change(results[j - 1][1], results[j][0])
+        rows.append([j, quantiles[segments[j][0]], quantiles[segments[j][-1]], change])
+        my_print("Segment {0} (quantiles {1}-{2}): {3:.4f} of the nodes changed group at its first quantile with respect to the continuation of the previous segment.".format(
+            j, rows[-1][1], rows[-1][2], change))
+    if report_path is not None:
+        with open(report_path, "w") as handle:
+            writer = csv.writer(handle, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(["segment", "quantile_start", "quantile_stop", "membership_change"])
+            writer.writerows(rows)
+    return partitions_path
+
+
+def louvain_partitions_segment(graph_dir, louvain_resolution, quantiles, thresholds, prev, segment_path, lookahead=None,
+                               backend="python-louvain", check_parity=False):
+    """
+    Sweep a segment of the quantiles (in a worker process), saving its partitions in segment_path.
+    The graph is rebuilt from the arrays memory-mapped from graph_dir: adding the nodes in their order, then the edges in the order of G.edges,
+    gives the same order of nodes, neighbors and edges of the graph of the parent process, so the same partitions.
+    :return: (first, next) the partition of the first quantile of the segment, and the partition at the lookahead threshold warm-started from the last partition (None without lookahead)
+    """
+    nodes, sources, targets, weights, user_ids = [np.load(Path(graph_dir) / f"{name}.npy", mmap_mode='r')
+                                                  for name in ["nodes", "source", "target", "weight", "user_ids"]]
+    G = nx.Graph()
+    G.add_nodes_from(nodes.tolist())
+    G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), weights.tolist()))
+    louvain_sweep = partition_sweep(G, louvain_resolution, backend=backend, check_parity=check_parity)
+    next(louvain_sweep)
+    first = None
+    with jsonlines.open(segment_path, mode="w") as handle:
+        for quantile, threshold in zip(quantiles, thresholds):
+            partition = louvain_sweep.send((threshold, prev))
+            first = partition if first is None else first
+            prev = partition
+            handle.write({"quantile": quantile, "threshold": threshold, "communities_raw": reverse_partition(partition, user_ids)})
+    return first, louvain_sweep.send((lookahead, prev)) if lookahead is not None else None
+
+
+def quantile_thresholds(weights, quantiles):
+    """
+    Compute the edge weight thresholds corresponding to the quantiles (NaN when there are no edges, so that no edge passes them).
+    :param weights: (numpy.ndarray) the edge weights
+    :param quantiles: (numpy.ndarray) the quantiles
+    :return: (numpy.ndarray) the thresholds
+    """
+    return np.quantile(weights, quantiles) if len(weights) > 0 else np.full(len(quantiles), np.nan)
+
+
+def adaptive_louvain_partitions(G, weights, quantiles, seed_partition, louvain_resolution, refine_tolerance, min_quantile_gap, backend="python-louvain", check_parity=False):
+    """
+    Adaptive version of the threshold sweep: the partitions are computed on the coarse grid of quantiles, then the midpoint of two
+    consecutive quantiles is added whenever the group memberships of their partitions changed by more than refine_tolerance
+    (see membership_change), until the gap between the quantiles would be smaller than min_quantile_gap.
+    The quantiles are added in passes over increasing thresholds, so each pass updates a single filtered graph (see partition_sweep);
+    the partition of a new quantile is warm-started from the partition of the previous quantile of the grid.
+    :param G: (networkx.Graph) the graph, with int nodes and a "weight" edge attribute
+    :param weights: (numpy.ndarray) the edge weights, used for the thresholds of the quantiles
+    :param quantiles: (numpy.ndarray) the coarse grid of quantiles
+    :param seed_partition: (dict) the partition used as warm start of the first quantile (None for no warm start)
+    :param louvain_resolution: (float) the resolution parameter of the louvain algorithm
+    :param refine_tolerance: (float) maximum membership change between consecutive quantiles of the final grid
+    :param min_quantile_gap: (float) minimum gap between consecutive quantiles of the final grid
+    :param backend: (str) the community detection backend (see include/community_detection.py)
+    :param check_parity: (bool) if True, each partition is compared with the python-louvain partition (see community_detection.log_parity)
+    :return: (dict) the (threshold, partition) of each quantile
+    """
+    partitions = {}
+    pending = [(quantile, previous) for previous, quantile in zip([None] + list(quantiles[:-1]), quantiles)]
+    intervals = list(zip(quantiles[:-1], quantiles[1:]))
+    n_pass = 0
+    while len(pending) > 0:
+        n_pass += 1
+        louvain_sweep = partition_sweep(G, louvain_resolution, backend=backend, check_parity=check_parity)
+        next(louvain_sweep)
+        for i, (quantile, previous) in enumerate(pending):
+            my_print("Computing partition {0}/{1} of pass {2} (quantile {3}).".format(i+1, len(pending), n_pass, quantile))
+            threshold = quantile_thresholds(weights, [quantile])[0]
+            prev = seed_partition if previous is None else partitions[previous][1]
+            partitions[quantile] = (threshold, louvain_sweep.send((threshold, prev)))
+
+        # the midpoints of the intervals to refine are computed in the next pass, and split them in two intervals
+        refined = [(start, stop) for start, stop in intervals if (stop - start) / 2 >= min_quantile_gap and
+                   membership_change(partitions[start][1], partitions[stop][1]) > refine_tolerance]
+        pending = [((start + stop) / 2, start) for start, stop in refined]
+        intervals = [interval for start, stop in refined for interval in [(start, (start + stop) / 2), ((start + stop) / 2, stop)]]
+
+    my_print("Computed {0} partitions in {1} passes.".format(len(partitions), n_pass))
+    return partitions
+
+
+def membership_change(partition, next_partition):
+    """
+    Fraction of the nodes of a partition whose group membership changed in the next partition. Each community is matched to
+    the community of the other partition sharing most of its nodes: the nodes outside the matched communities (split or merged groups)
+    and the nodes missing from the next partition (filtered out) are changed.
+    :param partition: (dict) node -> community
+    :param next_partition: (dict) node -> community
+    :return: (float) the fraction of changed nodes (0. if partition is empty)
+    """
+    if len(partition) == 0:
+        return 0.
+    labels = np.fromiter(partition.values(), dtype=np.int64, count=len(partition))
+    next_labels = np.fromiter((next_partition.get(node, -1) for node in partition), dtype=np.int64, count=len(partition))
+    kept = next_labels >= 0
+    if not kept.any():
+        return 1.
+    pairs, overlaps = np.unique(np.stack([labels[kept], next_labels[kept]]), axis=1, return_counts=True)
+    overlaps = pd.Series(overlaps)
+    matched = min(overlaps.groupby(pairs[0]).max().sum(), overlaps.groupby(pairs[1]).max().sum())
+    return 1. - matched / len(partition)
+
+
+def partition_sweep(G, louvain_resolution, backend="python-louvain", check_parity=False):
+    """
+    Compute the louvain partitions of a graph filtered with increasing edge weight thresholds.
+    The generator is started with next(), then each (threshold, warm start partition) pair is sent to it (thresholds must not decrease)
+    and it yields the partition of the graph filtered with the threshold.
+    With the "python-louvain" backend a single networkx graph is updated along the sweep (see threshold_sweep),
+    the other backends build the CSR adjacency matrix of the edges above the threshold from the edge arrays.
+    :param G: (networkx.Graph) the graph, with int nodes and a "weight" edge attribute
+    :param louvain_resolution: (float) the resolution parameter of the louvain algorithm
+    :param backend: (str) the community detection backend (see include/community_detection.py)
+    :param check_parity: (bool) if True, each partition is compared with the python-louvain partition (see community_detection.log_parity)
+    :return: generator of the partitions (dict node -> community)
+    """
+    partition = None
+    if backend == "python-louvain":
+        # a single filtered graph is updated along the sweep, removing at each step only the edges below the new threshold
+        graph_sweep = threshold_sweep(G)
+        G_filtered = next(graph_sweep)
+        while True:
+            threshold, prev = yield partition
+            graph_sweep.send(threshold)
+            partition = community_louvain.best_partition(G_filtered, partition=prev, resolution=louvain_resolution, randomize=False, random_state=0)
+    edges = list(G.edges(data="weight"))
+    sources = np.array([edge[0] for edge in edges], dtype=np.int64)
+    targets = np.array([edge[1] for edge in edges], dtype=np.int64)
+    weights = np.array([edge[2] for edge in edges], dtype=np.float64)
+    del edges
+    while True:
+        threshold, prev = yield partition
+        kept = weights >= threshold
+        nodes = np.unique(np.concatenate([sources[kept], targets[kept]]))
+        partition = edge_communities(nodes, sources[kept], targets[kept], weights[kept], partition=prev, resolution=louvain_resolution,
+                                     random_state=0, backend=backend, check_parity=check_parity)
+
+
+def threshold_sweep(G):
+    """
+    Filter a graph with increasing edge weight thresholds, updating a single graph.
+    The edges are sorted by weight once, and each threshold removes only the edges below it (and the nodes left without edges).
+    The filtered graph is the same, with the same order of nodes and neighbors, as the graph built from scratch with
+    nx.Graph((source, target, attr) for source, target, attr in G.edges(data=True) if attr['weight'] >= threshold),
+    so the louvain partitions computed on it are the same.
+    The order of the nodes is kept as a sorted list of their keys (their first remaining incident edge), updated only for the endpoints
+    of the removed edges: a step costs O(removed edges * log(nodes)), plus the reinsertion in the graph of the nodes
+    that follow the first node whose position changed.
+    The generator yields the filtered graph, then each threshold is sent to it (thresholds must not decrease): it updates the graph in place.
+    :param G: (networkx.Graph) the graph, with int nodes and a "weight" edge attribute
+    :return: generator of the filtered graph
+    """
+    G_filtered = nx.Graph(G.edges(data=True))
+    edges = list(G.edges(data="weight"))
+    sources = np.array([edge[0] for edge in edges], dtype=np.int64)
+    targets = np.array([edge[1] for edge in edges], dtype=np.int64)
+    order = np.argsort(np.array([edge[2] for edge in edges], dtype=np.float64), kind="stable")
+    sorted_weights = np.array([edges[e][2] for e in order], dtype=np.float64)
+    del edges
+
+    # incident edges of each node in order of iteration of G.edges: a node of the filtered graph comes before another
+    # if its first remaining incident edge comes first (or it is the source of the same edge)
+    n_nodes = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+    endpoints = np.concatenate([sources, targets])
+    incident_edges = np.concatenate([np.arange(len(sources)), np.arange(len(sources))])
+    incident_sides = np.concatenate([np.zeros(len(sources), dtype=np.int64), np.ones(len(sources), dtype=np.int64)])
+    incident_order = np.lexsort((incident_edges, endpoints))
+    incident_edges = incident_edges[incident_order]
+    incident_sides = incident_sides[incident_order]
+    first = np.searchsorted(endpoints[incident_order], np.arange(n_nodes))
+    last = np.searchsorted(endpoints[incident_order], np.arange(n_nodes), side="right")
+    removed = np.zeros(len(sources), dtype=bool)
+    n_removed = 0
+
+    def node_keys(nodes):
+        alive = first[nodes] < last[nodes]
+        positions = np.minimum(first[nodes], len(incident_edges) - 1)
+        return np.where(alive, 2 * incident_edges[positions] + incident_sides[positions], -1)
+
+    keys = np.full(n_nodes, -1, dtype=np.int64)
+    node_order = list(G_filtered)
+    keys[node_order] = node_keys(np.asarray(node_order, dtype=np.int64))
+    order_keys = keys[node_order].tolist()
+
+    while True:
+        threshold = yield G_filtered
+        cut = max(int(np.searchsorted(sorted_weights, threshold, side="left")), n_removed) if not np.isnan(threshold) else len(sorted_weights)
+        removed_edges = order[n_removed:cut]
+        n_removed = cut
+        if len(removed_edges) == 0:
+            continue
+        removed[removed_edges] = True
+        G_filtered.remove_edges_from(zip(sources[removed_edges].tolist(), targets[removed_edges].tolist()))
+
+        # move the first remaining incident edge of the endpoints of the removed edges
+        affected = np.unique(np.concatenate([sources[removed_edges], targets[removed_edges]]))
+        while True:
+            moving = affected[(first[affected] < last[affected]) & removed[incident_edges[np.minimum(first[affected], len(incident_edges) - 1)]]]
+            if len(moving) == 0:
+                break
+            first[moving] += 1
+        new_keys = node_keys(affected)
+        changed = new_keys != keys[affected]
+        if not changed.any():
+            continue
+        G_filtered.remove_nodes_from(affected[new_keys < 0].tolist())
+
+        # the keys only increase: the nodes before the first moved node keep their position, the moved nodes are reinserted after it
+        positions = [bisect.bisect_left(order_keys, key) for key in keys[affected[changed]].tolist()]
+        moved = changed & (new_keys >= 0)
+        start = min([position for position, alive in zip(positions, moved[changed].tolist()) if alive], default=None)
+        if start is not None:
+            start -= sum(position < start for position in positions)
+        for position in sorted(positions, reverse=True):
+            del node_order[position]
+            del order_keys[position]
+        for node, key in zip(affected[moved].tolist(), new_keys[moved].tolist()):
+            position = bisect.bisect_left(order_keys, key)
+            node_order.insert(position, node)
+            order_keys.insert(position, key)
+        keys[affected] = new_keys
+        if start is not None:
+            reorder_nodes(G_filtered, node_order[start:])
+
+
+def reorder_nodes(G, nodes):
+    """
+    Reorder the nodes of a graph in place, keeping its adjacency (networkx iterates the nodes in insertion order,
+    which the louvain algorithm depends on): the given nodes are moved after the other nodes, in the given order.
+    The node and adjacency dicts are reordered in place, so the views of the graph stay valid.
+    :param G: (networkx.Graph) the graph
+    :param nodes: (list) the nodes of G to move (all the nodes of G reorder the whole graph)
+    :return: None
+    """
+    for d in (G._node, G._adj):
+        # a dict (instead of a list of pairs) does not allocate a tuple per node, which would trigger the garbage collector on large graphs
+        items = {node: d.pop(node) for node in nodes}
+        d.update(items)
+
+
+def reverse_partition(p, user_ids=None):
+    """
+    Group the nodes of a partition by community.
+    :param p: (dict) node -> community
+    :param user_ids: (numpy.ndarray) the user id table of the nodes: the communities list the user ids of their nodes (None keeps the nodes)
+    :return: (dict) community -> list of nodes (or user ids)
+    """
+    if user_ids is not None:
+        p = dict(zip(user_ids[list(p.keys())].tolist(), p.values()))
     r = dict()
     for node, modularity in p.items():
         if modularity in r:
@@ -65,25 +424,7 @@ def find_coordinated_groups(partitions, min_cardinality, seed=None, already_foun
         temp_coordinated.setdefault(i, partitions[m])
 
     if seed is not None:
-        correspondences = {}
-        for m in temp_coordinated:
-            intersection = 0
-            correspondence = -1
-            for m_seed in seed:
-                if len(set(temp_coordinated[m]).intersection(seed[m_seed])) > intersection:
-                    intersection = len(set(temp_coordinated[m]).intersection(seed[m_seed]))
-                    correspondence = m_seed
-
-            if correspondence >= 0:
-                if m in correspondences:
-                    if intersection > correspondences[m]["intersection"]:
-                        correspondences[m]["to"] = [correspondence].extend(correspondences[m]["to"])
-                        correspondences[m]["intersection"] = [intersection].extend(correspondences[m]["intersection"])
-                    else:
-                        correspondences[m]["to"].append(correspondence)
-                        correspondences[m]["intersection"].append(intersection)
-                else:
-                    correspondences.setdefault(m, {"to": [correspondence], "intersection": [intersection]})
+        correspondences = match_groups(temp_coordinated, seed)
 
         not_found = 0
         coordinated = {}
@@ -105,6 +446,31 @@ def find_coordinated_groups(partitions, min_cardinality, seed=None, already_foun
     return coordinated, correspondences, already_found
 
 
+def match_groups(groups, seed):
+    """
+    Match each group to the seed group sharing most of its nodes (the first seed group in case of ties).
+    The overlaps of all the (group, seed group) pairs are counted at once in a contingency table, from the group and seed group of each node.
+    :param groups: (dict) group -> list of nodes
+    :param seed: (dict) seed group -> list of nodes (the seed groups are disjoint)
+    :return: (dict) group -> {"to": [seed group], "intersection": [number of shared nodes]}, for the groups sharing at least a node with a seed group
+    """
+    group_keys = list(groups)
+    seed_keys = list(seed)
+    group_sizes = [len(nodes) for nodes in groups.values()]
+    seed_sizes = [len(nodes) for nodes in seed.values()]
+    codes, uniques = pd.factorize(np.asarray(list(itertools.chain.from_iterable(groups.values())) + list(itertools.chain.from_iterable(seed.values()))))
+    seed_labels = np.full(len(uniques), -1, dtype=np.int64)
+    seed_labels[codes[sum(group_sizes):]] = np.repeat(np.arange(len(seed_keys)), seed_sizes)
+    group_labels = np.repeat(np.arange(len(group_keys)), group_sizes)
+    matched_labels = seed_labels[codes[:sum(group_sizes)]]
+    shared = matched_labels >= 0
+    table = sp.coo_matrix((np.ones(shared.sum(), dtype=np.int64), (group_labels[shared], matched_labels[shared])), shape=(len(group_keys), len(seed_keys))).tocsr().tocoo()
+    # largest overlap of each group, the first seed group in case of ties
+    order = np.lexsort((table.col, -table.data, table.row))
+    best = order[np.r_[True, table.row[order][1:] != table.row[order][:-1]]] if len(order) > 0 else order
+    return {group_keys[row]: {"to": [seed_keys[col]], "intersection": [int(overlap)]} for row, col, overlap in zip(table.row[best].tolist(), table.col[best].tolist(), table.data[best].tolist())}
+
+
 def track_coordinated_groups(partitions_path, coordinated_groups_path, min_cardinality):
 
     with jsonlines.open(coordinated_groups_path, mode="w") as output_handle:
@@ -119,11 +485,11 @@ def track_coordinated_groups(partitions_path, coordinated_groups_path, min_cardi
                                                                                       min_cardinality,
                                                                                       seed=seed,
                                                                                       already_found=already_found)
+                seed = coordinated
+
                 partition.setdefault("coordinated_groups", coordinated)
                 partition.setdefault("correspondences", correspondences)
 
-                seed = coordinated
-
                 output_handle.write(partition)
 
     my_print("Total groups found = {}".format(already_found))
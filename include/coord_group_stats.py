@@ -1,12 +1,42 @@
-from .lib import my_print, load_graph_from_csvs
-import networkx as nx
+from .lib import my_print, load_user_ids_from_csvs
+from .edge_store import load_edge_list
+import numpy as np
+import heapq
 import pandas as pd
+import scipy.sparse as sp
 import jsonlines
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
-def cb_network_stats(node_csv_path, edge_csv_path, coord_group_path):
-    my_print("Building graph...")
-    G = load_graph_from_csvs(node_csv_path, edge_csv_path)
-    #G = nx.convert_matrix.from_pandas_edgelist(edges_df, "source", "target", "weight")
+def cb_network_stats(node_csv_path, edge_csv_path, coord_group_path, mode="batch", workers=1):
+    """
+    Compute the network metrics of the coordinated groups at each threshold of the coordination sweep.
+    :param node_csv_path: the path of the csv with the nodes
+    :param edge_csv_path: the path of the edge store (or csv) with the edges
+    :param coord_group_path: the path of the jsonl with the coordinated groups at each threshold
+    :param mode: how the metrics are computed at each threshold:
+        - "batch": on the sparse adjacency matrix of the edges of the groups above the threshold (see groups_network_stats)
+        - "incremental": the triangles, degrees and strengths of the nodes are updated only for the edges that leave (or join) the groups
+          between consecutive thresholds (see incremental_groups_network_stats), faster when the groups change little between the thresholds
+        - (default="batch")
+    :param workers: number of processes. The thresholds are split in a shard of consecutive thresholds per process, the workers memory-map
+                    the edges sorted by weight (saved once in a temporary directory next to coord_group_path) and the rows are merged in the order of the thresholds
+        - (default=1)
+    :return: (pandas.DataFrame) the metrics of each group at each threshold
+    """
+    if mode not in ("batch", "incremental"):
+        raise ValueError(f"Unknown stats mode {mode}")
+    my_print("Loading edges...")
+    user_ids = load_user_ids_from_csvs(node_csv_path, edge_csv_path)
+    user_index = pd.Index(user_ids)
+    _, columns = load_edge_list(edge_csv_path)
+    # the edges are sorted by weight once: the edges above a threshold are a suffix of the sorted edges
+    order = np.argsort(np.asarray(columns["weight"], dtype=np.float64), kind="stable")
+    edges = {"source": np.asarray(columns["source"], dtype=np.int64)[order],
+             "target": np.asarray(columns["target"], dtype=np.int64)[order],
+             "weight": np.asarray(columns["weight"], dtype=np.float64)[order]}
+    del columns, order
     quantiles = []
     thresholds = []
     cb_groups = []
@@ -17,57 +47,393 @@ def cb_network_stats(node_csv_path, edge_csv_path, coord_group_path):
                "weighted_assortativity", "unweighted_assortativity"]
     with jsonlines.open(coord_group_path, "r") as handle:
         for row in handle:
-            quantiles.append(round(row["quantile"],2))
+            quantiles.append(row["quantile"])
             thresholds.append(row["threshold"])
-            cb_groups.append(row["coordinated_groups"])
-    group_labels = sorted(cb_groups[0].keys())
+            cb_groups.append({group: user_index.get_indexer(nodes) for group, nodes in row["coordinated_groups"].items()})
 
-    stats = []
+    # the groups of each threshold: all the groups found so far, sorted by label
+    group_labels = sorted(cb_groups[0].keys()) if len(cb_groups) > 0 else []
+    steps = []
+    for i, threshold in enumerate(thresholds):
+        group_labels = sorted(list(set(group_labels + list(cb_groups[i].keys()))))
+        cut = int(np.searchsorted(edges["weight"], threshold, side="left"))
+        steps.append((cut, group_labels, [cb_groups[i].get(group_label, []) for group_label in group_labels]))
+    del cb_groups
 
+    if workers > 1 and len(steps) > 1:
+        shards = [shard for shard in np.array_split(np.arange(len(steps)), workers) if len(shard) > 0]
+        my_print("Processing {} thresholds in {} shards with {} workers...".format(len(steps), len(shards), workers))
+        with tempfile.TemporaryDirectory(dir=Path(coord_group_path).parent) as edges_dir:
+            for column, values in edges.items():
+                np.save(Path(edges_dir) / f"{column}.npy", values)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(network_stats_shard, edges_dir, len(user_ids), [steps[i] for i in shard], mode) for shard in shards]
+                steps_stats = [group_stats for future in futures for group_stats in future.result()]
+    else:
+        steps_stats = network_stats_steps(edges["source"], edges["target"], edges["weight"], len(user_ids), steps, mode, thresholds=thresholds)
+
+    stats = []
     for i, threshold in enumerate(thresholds):
-        my_print("+"*50)
+        for group_label, group_row in zip(steps[i][1], steps_stats[i]):
+            stats.append([quantiles[i], threshold, group_label] + group_row)
 
-        my_print("Processing threshold {} ({}/{})...".format(threshold, i, len(thresholds)))
+    df_stats = pd.DataFrame(stats, columns = columns)
+    # sizes relative to the size of the group when it is found (the first quantile for the groups of the seed)
+    max_size = df_stats[df_stats["size"] > 0].drop_duplicates("group").set_index("group")["size"]
+    df_stats['size_(%)'] = (df_stats["size"] * 100 / df_stats["group"].map(max_size)).astype(int)
+    df_stats['size_ratio'] = df_stats["size"] / df_stats["group"].map(max_size)
 
-        G_threshold = nx.Graph(((source, target, attr) for source, target, attr in G.edges(data=True)
-                                if attr['weight'] >= threshold))
-        group_labels = sorted(list(set(group_labels + list(cb_groups[i].keys()))))
+    return df_stats
+
+
+def network_stats_steps(sources, targets, weights, n_nodes, steps, mode="batch", thresholds=None):
+    """
+    Compute the network metrics of the groups at consecutive thresholds.
+    :param sources: (numpy.ndarray) the source node (index) of each edge, sorted by weight
+    :param targets: (numpy.ndarray) the target node (index) of each edge, sorted by weight
+    :param weights: (numpy.ndarray) the weight of each edge, sorted
+    :param n_nodes: (int) number of nodes
+    :param steps: (list) the (cut, group labels, groups) of each threshold: the edges above the threshold are the edges from cut on
+    :param mode: "batch" or "incremental" (see cb_network_stats)
+    :param thresholds: (list) the thresholds, only for logging
+    :return: (list) the metrics of the groups at each threshold (see groups_network_stats)
+    """
+    if mode == "incremental":
+        stats_sweep = incremental_groups_network_stats(sources, targets, weights, n_nodes)
+        next(stats_sweep)
+    steps_stats = []
+    for i, (cut, group_labels, groups) in enumerate(steps):
+        if thresholds is not None:
+            my_print("Processing threshold {} ({}/{})...".format(thresholds[i], i, len(thresholds)))
+        if mode == "incremental":
+            steps_stats.append(stats_sweep.send((cut, group_labels, groups)))
+        else:
+            steps_stats.append(groups_network_stats(sources[cut:], targets[cut:], weights[cut:], groups, n_nodes))
+    return steps_stats
+
+
+def network_stats_shard(edges_dir, n_nodes, steps, mode="batch"):
+    """
+    Compute the network metrics of the groups at a shard of consecutive thresholds (in a worker process), on the sorted edges memory-mapped from edges_dir.
+    :return: (list) the metrics of the groups at each threshold of the shard (see network_stats_steps)
+    """
+    sources, targets, weights = [np.load(Path(edges_dir) / f"{column}.npy", mmap_mode='r') for column in ["source", "target", "weight"]]
+    return network_stats_steps(sources, targets, weights, n_nodes, steps, mode)
+
+
+def groups_network_stats(sources, targets, weights, groups, n_nodes):
+    """
+    Compute the network metrics of the subgraphs induced by disjoint groups of nodes, all at once on the sparse adjacency matrix of their edges.
+    The metrics are the same of networkx on the graph of the edges of each group (whose nodes are the nodes of the group with at least an edge in the group):
+    density, average clustering (weighted with the weights normalized by the largest weight of the group, and unweighted) and degree assortativity
+    (with the weighted and unweighted degrees).
+    :param sources: (numpy.ndarray) the source node (index) of each edge
+    :param targets: (numpy.ndarray) the target node (index) of each edge
+    :param weights: (numpy.ndarray) the weight of each edge
+    :param groups: (list) the nodes (indices, -1 for unknown nodes) of each group
+    :param n_nodes: (int) number of nodes
+    :return: (list) for each group, [size, weighted_clustering, unweighted_clustering, density, weighted_assortativity, unweighted_assortativity]
+             (the metrics are None for empty groups and groups without edges)
+    """
+    n_groups = len(groups)
+    sizes = [len(nodes) for nodes in groups]
+    nodes = np.concatenate([np.asarray(nodes, dtype=np.int64) for nodes in groups] + [np.empty(0, dtype=np.int64)])
+    node_groups = np.repeat(np.arange(n_groups), sizes)
+    labels = np.full(n_nodes, -1, dtype=np.int64)
+    labels[nodes[nodes >= 0]] = node_groups[nodes >= 0]
+
+    inside = (labels[sources] >= 0) & (labels[sources] == labels[targets])
+    sources, targets, weights = sources[inside], targets[inside], weights[inside]
+    edge_groups = labels[sources]
+    group_nodes, endpoints = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+    endpoints = endpoints.ravel()
+    local_sources, local_targets = endpoints[:len(sources)], endpoints[len(sources):]
+    local_groups = labels[group_nodes]
+    n_local = len(group_nodes)
+    n_group_edges = np.bincount(edge_groups, minlength=n_groups)
+    n_group_nodes = np.bincount(local_groups, minlength=n_groups)
+
+    def symmetric(values):
+        A = sp.csr_matrix((values, (local_sources, local_targets)), shape=(n_local, n_local))
+        return (A + A.T).tocsr()
+
+    A = symmetric(np.ones(len(sources)))
+    degrees = np.diff(A.indptr).astype(np.float64)
+    strengths = np.asarray(symmetric(weights).sum(axis=1)).ravel()
+    max_weights = np.zeros(n_groups)
+    np.maximum.at(max_weights, edge_groups, weights)
+    C = symmetric(np.cbrt(weights / max_weights[edge_groups])) if len(weights) > 0 else A
+
+    # triangles through each node (counted for both orders of the other two nodes, as networkx)
+    pairs = degrees * (degrees - 1)
+    triangles = np.asarray((A @ A).multiply(A).sum(axis=1)).ravel()
+    weighted_triangles = np.asarray((C @ C).multiply(C).sum(axis=1)).ravel()
+    clustering = np.divide(triangles, pairs, out=np.zeros(n_local), where=triangles > 0)
+    weighted_clustering = np.divide(weighted_triangles, pairs, out=np.zeros(n_local), where=weighted_triangles > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average_clustering = np.bincount(local_groups, weights=clustering, minlength=n_groups) / n_group_nodes
+        average_weighted_clustering = np.bincount(local_groups, weights=weighted_clustering, minlength=n_groups) / n_group_nodes
+        density = np.where(n_group_nodes > 1, n_group_edges / (n_group_nodes * (n_group_nodes - 1.)) * 2, 0.)
+        assortativity = degree_correlation(degrees, local_sources, local_targets, edge_groups, n_groups)
+        weighted_assortativity = degree_correlation(strengths, local_sources, local_targets, edge_groups, n_groups)
+
+    stats = []
+    for group in range(n_groups):
+        if sizes[group] == 0:
+            stats.append([0, None, None, None, None, None])
+        elif n_group_edges[group] == 0:
+            stats.append([sizes[group], None, None, 0., None, None])
+        else:
+            stats.append([sizes[group], float(average_weighted_clustering[group]), float(average_clustering[group]), float(density[group]),
+                          float(weighted_assortativity[group]), float(assortativity[group])])
+    return stats
+
+
+def degree_correlation(degrees, sources, targets, edge_groups, n_groups):
+    """
+    Pearson correlation of the degrees at the two ends of the edges of each group (degree assortativity), with each edge taken in both directions.
+    :return: (numpy.ndarray) the correlation of each group (NaN when the degrees are constant)
+    """
+    x = np.concatenate([degrees[sources], degrees[targets]])
+    y = np.concatenate([degrees[targets], degrees[sources]])
+    pair_groups = np.concatenate([edge_groups, edge_groups])
+    counts = np.bincount(pair_groups, minlength=n_groups)
+    x = x - (np.bincount(pair_groups, weights=x, minlength=n_groups) / counts)[pair_groups]
+    y = y - (np.bincount(pair_groups, weights=y, minlength=n_groups) / counts)[pair_groups]
+    covariance = np.bincount(pair_groups, weights=x * y, minlength=n_groups)
+    norms = np.sqrt(np.bincount(pair_groups, weights=x * x, minlength=n_groups) * np.bincount(pair_groups, weights=y * y, minlength=n_groups))
+    return np.clip(covariance / norms, -1., 1.)
+
+
+def incremental_groups_network_stats(sources, targets, weights, n_nodes):
+    """
+    Compute the network metrics of groups of nodes along a sweep of edge weight thresholds, maintaining the degrees, strengths and triangles
+    of the nodes and the sums of the metrics of each group across the steps (the same metrics of groups_network_stats).
+    The edges of the groups are the edges above the threshold between nodes of the same group: at each step only the edges that leave or join
+    the groups change, i.e. the edges between the previous and the new cut and the edges of the nodes that changed group.
+    With A_old and A_new the adjacency matrices of the edges before and after the step, and D = A_new - A_old the signed changed edges,
+    the triangles through the nodes change by the diagonal of D A_old A_old + A_new D A_old + A_new A_new D, which only involves the rows
+    of the endpoints of the changed edges (the same for the weighted triangles, with the cube roots of the weights).
+    The metrics of each group are read from sums over its nodes and edges (number of nodes and edges, clustering of the nodes, and the moments
+    of the degrees and strengths at the ends of the edges for the assortativity), from which the old contributions of the affected nodes and edges
+    are subtracted and the new ones added; the largest weight of each group is the top of a heap of its edges, whose removed edges are popped lazily.
+    So a step costs O(members of the groups + changed edges * degree), instead of the products of the whole adjacency matrix of the groups.
+    The generator is started with next(), then each (cut, labels, groups) triple is sent to it and it yields the metrics of the groups
+    on the edges sources[cut:], targets[cut:].
+    :param sources: (numpy.ndarray) the source node (index) of each edge, sorted by weight
+    :param targets: (numpy.ndarray) the target node (index) of each edge, sorted by weight
+    :param weights: (numpy.ndarray) the weight of each edge, sorted
+    :param n_nodes: (int) number of nodes
+    :return: generator of the metrics (list) of the groups at each step, as returned by groups_network_stats
+    """
+    n_edges = len(sources)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    # symmetric adjacency of all the edges, with the edge index + 1 as data: the rows of the active edges are sliced from it
+    structure = sp.csr_matrix((np.tile(np.arange(1, n_edges + 1), 2), (np.concatenate([sources, targets]), np.concatenate([targets, sources]))), shape=(n_nodes, n_nodes))
+    structure.sort_indices()
+    cbrt_weights = np.cbrt(weights)
+    ones = np.ones(n_edges)
+
+    active = np.zeros(n_edges, dtype=bool)
+    flipped = np.zeros(n_edges, dtype=bool)
+    # the group (persistent id of the group label, -1 for no group) of each node, before and after the step
+    labels = np.full(n_nodes, -1, dtype=np.int64)
+    next_labels = np.full(n_nodes, -1, dtype=np.int64)
+    members = np.empty(0, dtype=np.int64)
+    cut = n_edges
+    degrees = np.zeros(n_nodes)
+    strengths = np.zeros(n_nodes)
+    # triangles and weighted triangles (with the cube roots of the weights, normalized by the largest weight of the group when the metrics are read)
+    # through each node, counted for both orders of the other two nodes as in groups_network_stats
+    triangles = np.zeros(n_nodes)
+    weighted_triangles = np.zeros(n_nodes)
+    # persistent id of each group label
+    group_ids = {}
+    # sums over the nodes with edges of each group: count, clustering, weighted clustering, and the moments of the degrees (d^2, d^3) and strengths (d s, d s^2)
+    # at the ends of the edges; sums over the edges of each group: count, products of the degrees and of the strengths at their ends.
+    # The drifts are the sums of the absolute contributions added and subtracted since the sums of each group were computed from scratch: they bound the rounding
+    # errors of the sums, which are computed again from the nodes and edges of the group when the bound is no longer small with respect to the sums
+    node_sums = np.zeros((0, 7))
+    edge_sums = np.zeros((0, 3))
+    node_drift = np.zeros((0, 7))
+    edge_drift = np.zeros((0, 3))
+    heaps = []
+    stats = None
+
+    def active_rows(rows, state, values):
+        matrix = structure[rows]
+        edges = matrix.data - 1
+        matrix.data = np.where(state(edges), values[edges], 0.)
+        return matrix
+
+    def triangles_change(endpoints, old, new, edge_values, edge_signs):
+        # the diagonal of D old old and new new D: the common neighbors of the two endpoints of each changed edge, before and after the step
+        first, second = old(endpoints[0]), old(endpoints[1])
+        change = edge_signs * edge_values * np.asarray((first.multiply(second)).sum(axis=1)).ravel()
+        new_first, new_second = new(endpoints[0]), new(endpoints[1])
+        change += edge_signs * edge_values * np.asarray((new_first.multiply(new_second)).sum(axis=1)).ravel()
+        # the diagonal of new D old: the nodes adjacent to one endpoint after the step and to the other endpoint before the step
+        common = (new_first.multiply(second) + new_second.multiply(first)).tocoo()
+        return (np.concatenate([endpoints[0], endpoints[1], common.col]),
+                np.concatenate([change, change, common.data * (edge_signs * edge_values)[common.row]]))
+
+    def node_values(nodes):
+        d, s, t = degrees[nodes], strengths[nodes], triangles[nodes]
+        pairs = d * (d - 1)
+        clustering = np.divide(t, pairs, out=np.zeros(len(nodes)), where=t > 0)
+        weighted_clustering = np.divide(weighted_triangles[nodes], pairs, out=np.zeros(len(nodes)), where=t > 0)
+        return np.stack([np.ones(len(nodes)), clustering, weighted_clustering, d * d, d * d * d, d * s, d * s * s], axis=1)
+
+    def edge_values(edges):
+        s, t = sources[edges], targets[edges]
+        return np.stack([np.ones(len(edges)), degrees[s] * degrees[t], strengths[s] * strengths[t]], axis=1)
+
+    def group_sums(groups, values, n_groups):
+        return np.stack([np.bincount(groups, weights=values[:, column], minlength=n_groups) for column in range(values.shape[1])], axis=1)
+
+    def contributions(nodes, edges, sign):
+        nonlocal node_sums, edge_sums, node_drift, edge_drift
+        nodes = nodes[degrees[nodes] > 0]
+        edges = edges[active[edges]]
+        values, groups = node_values(nodes), labels[nodes]
+        node_sums += sign * group_sums(groups, values, len(node_sums))
+        node_drift += group_sums(groups, np.abs(values), len(node_sums))
+        values, groups = edge_values(edges), labels[sources[edges]]
+        edge_sums += sign * group_sums(groups, values, len(edge_sums))
+        edge_drift += group_sums(groups, np.abs(values), len(edge_sums))
+
+    def group_edges(group_ids, group_nodes):
+        # the edges of the groups, from the rows of their nodes (each edge is found from both its ends)
+        edges = structure[group_nodes].data - 1
+        edges = np.unique(edges[active[edges]])
+        return edges[np.isin(labels[sources[edges]], group_ids)]
+
+    def correlation(count, first, second, cross, values, group_nodes):
+        # Pearson correlation of the values at the two ends of the edges, each edge taken in both directions (see degree_correlation):
+        # the sums of the values and of their squares over both ends are the sums over the nodes of the degree times the value (and its square)
+        n, cross = 2 * count, 2 * cross
+        numerator = n * cross - first * first
+        denominator = n * second - first * first
+        result = np.clip(np.divide(numerator, denominator, out=np.full(len(count), np.nan), where=denominator > 0), -1., 1.)
+        # the groups whose values are almost constant lose the precision of the difference of the moments: their correlation is computed on their edges
+        unstable = np.flatnonzero((count > 0) & (denominator < 1e-3 * first * first))
+        if len(unstable) > 0:
+            edges = group_edges(ids[unstable], np.concatenate([group_nodes[group] for group in unstable.tolist()]))
+            local = np.searchsorted(ids[unstable], labels[sources[edges]], sorter=np.argsort(ids[unstable]))
+            result[unstable] = degree_correlation(values, sources[edges], targets[edges], np.argsort(ids[unstable])[local], len(unstable))
+        return result
+
+    while True:
+        next_cut, group_labels, groups = yield stats
         for group_label in group_labels:
-            my_print("Processing group {0}/{1}.".format(group_label, len(group_labels)))
-            group_nodes = cb_groups[i].get(group_label, [])
-            size = len(group_nodes)
-            if len(group_nodes) > 0:
-
-                G_group = nx.Graph(((source, target, attr) for source, target, attr in G_threshold.edges(data=True)
-                                    if source in group_nodes and target in group_nodes))
-
-                weighted_clustering = nx.average_clustering(G_group, weight="weight")
-                unweighted_clustering = nx.average_clustering(G_group, weight=None)
-                density = nx.density(G_group)
-                weighted_assortativity = nx.degree_pearson_correlation_coefficient(G_group, weight="weight")
-                unweighted_assortativity = nx.degree_pearson_correlation_coefficient(G_group, weight=None)
-            else:
-                weighted_clustering = None
-                unweighted_clustering = None
-                density = None
-                weighted_assortativity = None
-                unweighted_assortativity = None
-
-            stats.append([quantiles[i], threshold, group_label,
-                         size,
-                         weighted_clustering, unweighted_clustering,
-                         density,
-                         weighted_assortativity, unweighted_assortativity])
-
-        df_stats = pd.DataFrame(stats, columns = columns)
-        max_size = {row['group']:row['size'] for i, row in df_stats[df_stats['quantile']==0].iterrows()}
-        df_stats['size_(%)'] = df_stats.apply(lambda row: int((row['size'] * 100) / max_size[row['group']]), axis = 1)
-        df_stats['size_ratio'] = df_stats.apply(lambda row: (row['size']) / max_size[row['group']], axis = 1)
+            if group_label not in group_ids:
+                group_ids[group_label] = len(group_ids)
+                heaps.append([])
+        if len(group_ids) > len(node_sums):
+            node_drift = np.concatenate([node_drift, np.zeros((len(group_ids) - len(node_sums), 7))])
+            edge_drift = np.concatenate([edge_drift, np.zeros((len(group_ids) - len(edge_sums), 3))])
+            node_sums = np.concatenate([node_sums, np.zeros((len(group_ids) - len(node_sums), 7))])
+            edge_sums = np.concatenate([edge_sums, np.zeros((len(group_ids) - len(edge_sums), 3))])
+        ids = np.array([group_ids[group_label] for group_label in group_labels], dtype=np.int64)
+        sizes = [len(nodes) for nodes in groups]
+        nodes = np.concatenate([np.asarray(nodes, dtype=np.int64) for nodes in groups] + [np.empty(0, dtype=np.int64)])
+        node_groups = np.repeat(ids, sizes)
+        next_labels[members] = -1
+        next_labels[nodes[nodes >= 0]] = node_groups[nodes >= 0]
+        candidates = np.concatenate([members, nodes[nodes >= 0]])
+        relabeled = np.unique(candidates[next_labels[candidates] != labels[candidates]])
+        members = nodes[nodes >= 0]
 
-    return df_stats
+        # the edges that may change: the edges between the previous and the new cut, and the edges of the nodes that changed group
+        rows = structure[relabeled]
+        edges = np.unique(np.concatenate([np.arange(min(cut, next_cut), max(cut, next_cut)), rows.data - 1]))
+        cut = next_cut
+        group_sources, group_targets = next_labels[sources[edges]], next_labels[targets[edges]]
+        next_active = (edges >= cut) & (group_sources >= 0) & (group_sources == group_targets)
+        old_groups = np.where(active[edges], labels[sources[edges]], -1)
+        new_groups = np.where(next_active, group_sources, -1)
+        moved = edges[old_groups != new_groups]
+        changed = edges[active[edges] != next_active]
 
+        if len(moved) > 0 or len(relabeled) > 0:
+            flipped[changed] = True
+            signs = np.where(active[changed], -1., 1.)
+            endpoints = (sources[changed], targets[changed])
+            old = lambda edges: active[edges]
+            new = lambda edges: active[edges] ^ flipped[edges]
+            triangle_nodes, triangle_change = triangles_change(endpoints, lambda rows: active_rows(rows, old, ones), lambda rows: active_rows(rows, new, ones),
+                                                               np.ones(len(changed)), signs)
+            weighted_nodes, weighted_change = triangles_change(endpoints, lambda rows: active_rows(rows, old, cbrt_weights),
+                                                               lambda rows: active_rows(rows, new, cbrt_weights), cbrt_weights[changed], signs)
+            # the nodes whose degree, strength, triangles or group change, and the edges (before or after the step) of the nodes whose degree, strength or group change
+            touched = np.unique(np.concatenate([relabeled, endpoints[0], endpoints[1]]))
+            affected_nodes = np.unique(np.concatenate([touched, triangle_nodes, weighted_nodes]))
+            incident = structure[touched].data - 1
+            affected_edges = np.unique(incident[active[incident] | flipped[incident]])
 
+            contributions(affected_nodes, affected_edges, -1.)
+            active[changed] = ~active[changed]
+            flipped[changed] = False
+            labels[relabeled] = next_labels[relabeled]
+            np.add.at(triangles, triangle_nodes, triangle_change)
+            np.add.at(weighted_triangles, weighted_nodes, weighted_change)
+            # no residue of the float updates on the nodes without triangles
+            weighted_triangles[affected_nodes[triangles[affected_nodes] < 0.5]] = 0.
+            np.add.at(degrees, endpoints[0], signs)
+            np.add.at(degrees, endpoints[1], signs)
+            # the strengths of the endpoints are summed again on their rows, so that they do not drift
+            endpoint_rows = np.unique(np.concatenate(endpoints))
+            strengths[endpoint_rows] = np.asarray(active_rows(endpoint_rows, old, weights).sum(axis=1)).ravel()
+            contributions(affected_nodes, affected_edges, 1.)
 
+            # the edges that joined a group are pushed on its heap of the edges by decreasing weight (position)
+            joined = moved[active[moved]]
+            joined_groups = labels[sources[joined]]
+            for group in np.unique(joined_groups).tolist():
+                heap = heaps[group]
+                positions = (-joined[joined_groups == group]).tolist()
+                if len(positions) > len(heap):
+                    heap.extend(positions)
+                    heapq.heapify(heap)
+                else:
+                    for position in positions:
+                        heapq.heappush(heap, position)
 
+        # the sums of the groups whose rounding errors may exceed 1e-14 of their value are computed again from the nodes of the group and their edges
+        group_nodes = [nodes_group[nodes_group >= 0] for nodes_group in (np.asarray(nodes, dtype=np.int64) for nodes in groups)]
+        stale = np.flatnonzero((node_drift[ids] * 1e-2 > np.abs(node_sums[ids])).any(axis=1) | (edge_drift[ids] * 1e-2 > np.abs(edge_sums[ids])).any(axis=1))
+        if len(stale) > 0:
+            stale_ids = ids[stale]
+            stale_nodes = np.concatenate([group_nodes[group] for group in stale.tolist()])
+            node_sums[stale_ids] = node_drift[stale_ids] = edge_sums[stale_ids] = edge_drift[stale_ids] = 0.
+            contributions(stale_nodes, group_edges(stale_ids, stale_nodes), 1.)
+            node_drift[stale_ids] = edge_drift[stale_ids] = 0.
 
+        counts = node_sums[ids]
+        sums = edge_sums[ids]
+        n_group_nodes, n_group_edges = np.rint(counts[:, 0]), np.rint(sums[:, 0])
+        max_weights = np.zeros(len(ids))
+        for group, group_id in enumerate(ids.tolist()):
+            heap = heaps[group_id]
+            # lazy removal of the edges that left the group
+            while len(heap) > 0 and not (active[-heap[0]] and labels[sources[-heap[0]]] == group_id):
+                heapq.heappop(heap)
+            max_weights[group] = weights[-heap[0]] if len(heap) > 0 else 0.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average_clustering = counts[:, 1] / n_group_nodes
+            average_weighted_clustering = counts[:, 2] / n_group_nodes / max_weights
+            density = np.where(n_group_nodes > 1, n_group_edges / (n_group_nodes * (n_group_nodes - 1.)) * 2, 0.)
+            assortativity = correlation(n_group_edges, counts[:, 3], counts[:, 4], sums[:, 1], degrees, group_nodes)
+            weighted_assortativity = correlation(n_group_edges, counts[:, 5], counts[:, 6], sums[:, 2], strengths, group_nodes)
 
+        stats = []
+        for group in range(len(groups)):
+            if sizes[group] == 0:
+                stats.append([0, None, None, None, None, None])
+            elif n_group_edges[group] == 0:
+                stats.append([sizes[group], None, None, 0., None, None])
+            else:
+                stats.append([sizes[group], float(average_weighted_clustering[group]), float(average_clustering[group]), float(density[group]),
+                              float(weighted_assortativity[group]), float(assortativity[group])])
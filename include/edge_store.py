@@ -0,0 +1,250 @@
+'''
+This module implements the binary columnar store of the edge lists exchanged by the stages of the pipeline.
+An edge store is a directory containing:
+    - manifest.json: number of nodes and edges, and dtype of each column
+    - nodes.npy: the user ids, the edges refer to the nodes by their index in this array
+    - source.bin, target.bin: int32 node indices of the edge endpoints
+    - weight.bin, alpha.bin, ...: float64 edge attributes
+The column files are raw little-endian arrays, memory-mapped when the store is loaded.
+Paths with the ".csv" suffix are read and written as csv edge lists (header: source, target, weight[, alpha]),
+which remain available as an export format.
+'''
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import shutil
+import json
+import csv
+import queue
+import threading
+
+MANIFEST = "manifest.json"
+INDEX_COLUMNS = ["source", "target"]
+
+
+def is_csv(path):
+    """
+    Check whether an edge list path refers to a csv file (instead of an edge store).
+    :param path: (str) the path of the edge list
+    :return: (bool) True for csv edge lists
+    """
+    return Path(path).suffix == ".csv"
+
+
+def column_dtype(column):
+    """
+    Dtype of a column of the edge store.
+    :param column: (str) the column name
+    :return: (numpy.dtype) int32 for the node indices, float64 for the edge attributes
+        (the backbone scores are computed in float64 and are compared with the alpha cut, so they are not rounded)
+    """
+    return np.dtype("<i4") if column in INDEX_COLUMNS else np.dtype("<f8")
+
+
+def save_edge_store(store_path, user_ids, blocks):
+    """
+    Save an edge list as an edge store, streaming the edges block by block.
+    The store is written to a temporary directory that replaces store_path at the end,
+    so an edge store can be rewritten while its memory-mapped columns are being read.
+    :param store_path: (str) the path of the edge store directory
+    :param user_ids: (list) the user ids, indexed by the source and target columns
+        (None for the shards of an edge list, whose user ids are saved when the shards are merged)
+    :param blocks: (iterable) dicts of column arrays ("source", "target", "weight", ...) with the same length
+    :return: (str) store_path
+    """
+    tmp_path = Path(str(store_path) + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    if user_ids is not None:
+        np.save(tmp_path / "nodes.npy", np.asarray(user_ids, dtype=str))
+    handles = {}
+    edges = 0
+    try:
+        for block in blocks:
+            for column, values in block.items():
+                if column not in handles:
+                    handles[column] = open(tmp_path / f"{column}.bin", "wb")
+                handles[column].write(np.ascontiguousarray(values, dtype=column_dtype(column)).tobytes())
+            edges += len(block["source"])
+    finally:
+        for handle in handles.values():
+            handle.close()
+    for column in INDEX_COLUMNS + ["weight"]:
+        if column not in handles:
+            open(tmp_path / f"{column}.bin", "wb").close()
+            handles[column] = None
+
+    manifest = {"num_nodes": len(user_ids) if user_ids is not None else None,
+                "num_edges": edges,
+                "columns": {column: column_dtype(column).str for column in handles}}
+    with open(tmp_path / MANIFEST, "w") as handle:
+        json.dump(manifest, handle)
+
+    if Path(store_path).exists():
+        shutil.rmtree(store_path)
+    tmp_path.rename(store_path)
+    return store_path
+
+
+def load_edge_store(store_path, mmap_mode='r'):
+    """
+    Load an edge store, memory-mapping its columns.
+    :param store_path: (str) the path of the edge store directory
+    :param mmap_mode: (str) memory-map mode ('r' read-only, None loads the columns in memory)
+    :return: (user_ids, columns) the array of user ids (None for shards) and a dict of column arrays
+    """
+    with open(Path(store_path) / MANIFEST, "r") as handle:
+        manifest = json.load(handle)
+    user_ids = np.load(Path(store_path) / "nodes.npy") if manifest["num_nodes"] is not None else None
+    columns = {}
+    for column, dtype in manifest["columns"].items():
+        column_path = Path(store_path) / f"{column}.bin"
+        if manifest["num_edges"] == 0:
+            columns[column] = np.empty(0, dtype=dtype)
+        elif mmap_mode is None:
+            columns[column] = np.fromfile(column_path, dtype=dtype)
+        else:
+            columns[column] = np.memmap(column_path, dtype=dtype, mode=mmap_mode, shape=(manifest["num_edges"],))
+    return user_ids, columns
+
+
+def load_edge_list(path, mmap_mode='r'):
+    """
+    Load an edge list from an edge store or from a csv file.
+    For csv files, the user ids are indexed in order of first appearance (source before target).
+    :param path: (str) the path of the edge store directory or of the csv file (header: source, target, weight[, alpha])
+    :param mmap_mode: (str) memory-map mode of the edge store columns
+    :return: (user_ids, columns) the array of user ids and a dict of column arrays
+    """
+    if not is_csv(path):
+        return load_edge_store(path, mmap_mode=mmap_mode)
+
+    df_edge = pd.read_csv(path, dtype={"source": str, "target": str})
+    codes, user_ids = pd.factorize(df_edge[INDEX_COLUMNS].to_numpy().ravel())
+    columns = {"source": codes[0::2].astype(np.int32), "target": codes[1::2].astype(np.int32)}
+    for column in df_edge.columns.drop(INDEX_COLUMNS):
+        columns[column] = df_edge[column].to_numpy()
+    return np.asarray(user_ids, dtype=str), columns
+
+
+def save_edge_list(path, user_ids, blocks):
+    """
+    Save an edge list as an edge store or as a csv file, depending on the path.
+    :param path: (str) the path of the edge store directory or of the csv file
+    :param user_ids: (list) the user ids, indexed by the source and target columns
+    :param blocks: (iterable) dicts of column arrays ("source", "target", "weight", ...) with the same length
+    :return: (str) path
+    """
+    if not is_csv(path):
+        return save_edge_store(path, user_ids, blocks)
+
+    user_ids = np.asarray(user_ids)
+    with open(path, "w") as handle:
+        writer = csv.writer(handle, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+        header = None
+        for block in blocks:
+            if header is None:
+                header = list(block.keys())
+                writer.writerow(header)
+            writer.writerows(zip(user_ids[block["source"]], user_ids[block["target"]],
+                                 *[block[column] for column in header[2:]]))
+        if header is None:
+            writer.writerow(INDEX_COLUMNS + ["weight"])
+    return path
+
+
+def save_edge_lists(paths, user_ids, blocks, prefetch=2):
+    """
+    Save several edge lists computed together, streaming the edges block by block.
+    Each edge list is written by a background thread, which keeps up to prefetch blocks.
+    :param paths: (dict) name -> path of the edge store directory or of the csv file
+    :param user_ids: (list) the user ids, indexed by the source and target columns
+        (None for edge store shards, whose user ids are saved when the shards are merged)
+    :param blocks: (iterable) dicts name -> dict of column arrays (see save_edge_list)
+    :return: (dict) paths
+    """
+    queues = {name: queue.Queue(maxsize=prefetch) for name in paths}
+    errors = []
+
+    def write(name):
+        def name_blocks():
+            while True:
+                block = queues[name].get()
+                if block is None:
+                    return
+                yield block
+        try:
+            save_edge_list(paths[name], user_ids, name_blocks())
+        except Exception as e:
+            errors.append(e)
+            # keep consuming the blocks, so that the producer is not blocked
+            while queues[name].get() is not None:
+                pass
+
+    threads = [threading.Thread(target=write, args=(name,), daemon=True) for name in paths]
+    for thread in threads:
+        thread.start()
+    try:
+        for block in blocks:
+            for name in paths:
+                queues[name].put(block[name])
+    finally:
+        for name in paths:
+            queues[name].put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return paths
+
+
+def iter_edge_blocks(columns, blocksize=1000000):
+    """
+    Iterate over the edges of a loaded edge list in blocks.
+    :param columns: (dict) column arrays
+    :param blocksize: (int) number of edges per block
+    :return: generator of dicts of column arrays
+    """
+    edges = len(columns["source"])
+    for start in range(0, edges, blocksize):
+        yield {column: np.asarray(values[start:start + blocksize]) for column, values in columns.items()}
+
+
+def merge_edge_lists(shard_paths, path, user_ids):
+    """
+    Concatenate edge list shards (edge stores or csv files with header) with the same columns.
+    :param shard_paths: (list) the paths of the shards, in order
+    :param path: (str) the path of the merged edge list, with the same format of the shards
+    :param user_ids: (list) the user ids, indexed by the source and target columns of the shards
+    :return: (str) path
+    """
+    if is_csv(path):
+        with open(path, "w") as handle:
+            for i, shard_path in enumerate(shard_paths):
+                with open(shard_path, "r", newline="") as shard_handle:
+                    header = shard_handle.readline()
+                    if i == 0:
+                        handle.write(header)
+                    shutil.copyfileobj(shard_handle, handle)
+        return path
+
+    def blocks():
+        for shard_path in shard_paths:
+            _, columns = load_edge_store(shard_path)
+            yield from iter_edge_blocks(columns)
+
+    return save_edge_store(path, user_ids, blocks())
+
+
+def export_edge_list_csv(store_path, csv_path):
+    """
+    Export an edge store to a csv file (header: source, target, weight[, alpha]).
+    :param store_path: (str) the path of the edge store directory
+    :param csv_path: (str) the path of the csv file
+    :return: (str) csv_path
+    """
+    user_ids, columns = load_edge_store(store_path)
+    return save_edge_list(csv_path, user_ids, iter_edge_blocks(columns))
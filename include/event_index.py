@@ -0,0 +1,155 @@
+'''
+This module implements the time-sorted index of the retweet events of the users, used by the windowed analysis.
+An event index is a directory containing:
+    - nodes.npy: the user ids, in the order of the parsed sequences (the order of the user id table)
+    - retweets.npy: the retweeted status ids
+    - user.npy, retweet.npy: int32 index of the user and of the retweeted status of each event
+    - timestamp.npy: float64 timestamp of each event
+    - source.json: the path, size and modification time of the parsed sequences the index was built from
+The events are sorted by timestamp (ties keep the order of the parsed sequences), so the events of a time window
+are a contiguous slice found with a binary search. The arrays are memory-mapped when the index is loaded.
+'''
+
+from .lib import *
+from pathlib import Path
+import scipy.sparse as sp
+import json
+
+EVENT_COLUMNS = ["user", "retweet", "timestamp"]
+SOURCE = "source.json"
+
+
+def source_fingerprint(userseq_json_path):
+    """
+    Fingerprint of the parsed sequences an event index is built from, to detect when the file is replaced or updated.
+    :param userseq_json_path: (str) the path of the parsed sequences JSONlines file
+    :return: (dict) the resolved path, the size and the modification time (ns) of the file
+    """
+    stat = Path(userseq_json_path).stat()
+    return {"path": str(Path(userseq_json_path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_event_index(userseq_json_path, index_dir):
+    """
+    Build the event index of the parsed sequences, with a single pass over the file.
+    :param userseq_json_path: (str) the path of the parsed sequences JSONlines file
+    :param index_dir: (str) the directory of the event index
+    :return: (str) index_dir
+    """
+    fingerprint = source_fingerprint(userseq_json_path)
+    user_ids = []
+    users = []
+    retweets = []
+    timestamps = []
+    with jsonlines.open(userseq_json_path, mode="r") as handle:
+        for user in handle:
+            users.append(np.full(len(user["retweeted_status_ids"]), len(user_ids), dtype=np.int32))
+            retweets.extend(user["retweeted_status_ids"])
+            timestamps.extend(user["timestamps"])
+            user_ids.append(user["user_id"])
+
+    retweet, retweet_ids = pd.factorize(np.asarray(retweets, dtype=str))
+    timestamp = np.asarray(timestamps, dtype=np.float64)
+    order = np.argsort(timestamp, kind="stable")
+
+    Path(index_dir).mkdir(parents=True, exist_ok=True)
+    np.save(Path(index_dir) / "nodes.npy", np.asarray(user_ids, dtype=str))
+    np.save(Path(index_dir) / "retweets.npy", np.asarray(retweet_ids, dtype=str))
+    np.save(Path(index_dir) / "user.npy", np.concatenate(users + [np.empty(0, dtype=np.int32)])[order])
+    np.save(Path(index_dir) / "retweet.npy", retweet.astype(np.int32)[order])
+    np.save(Path(index_dir) / "timestamp.npy", timestamp[order])
+    with open(Path(index_dir) / SOURCE, "w") as handle:
+        json.dump(fingerprint, handle)
+    my_print("Event index with {0} events of {1} users saved to {2}.".format(len(order), len(user_ids), index_dir))
+    return index_dir
+
+
+def update_event_index(userseq_json_path, index_dir):
+    """
+    Build the event index of the parsed sequences, unless index_dir already contains the index built from the same file
+    (same path, size and modification time, see source_fingerprint). So the index is rebuilt when the sequences are updated
+    (e.g., by update_user_similarities) or when another file is indexed in the same directory.
+    :param userseq_json_path: (str) the path of the parsed sequences JSONlines file
+    :param index_dir: (str) the directory of the event index
+    :return: (str) index_dir
+    """
+    source_path = Path(index_dir) / SOURCE
+    if source_path.exists() and (Path(index_dir) / "timestamp.npy").exists():
+        with open(source_path, "r") as handle:
+            if json.load(handle) == source_fingerprint(userseq_json_path):
+                return index_dir
+    my_print("Building event index from {}...".format(userseq_json_path))
+    return build_event_index(userseq_json_path, index_dir)
+
+
+def load_event_index(index_dir, mmap_mode='r'):
+    """
+    Load an event index.
+    :param index_dir: (str) the directory of the event index
+    :param mmap_mode: (str) memory-map mode of the event arrays ('r' read-only, None loads them in memory)
+    :return: (user_ids, retweet_ids, events) the user ids, the retweeted status ids and a dict of event arrays ("user", "retweet", "timestamp")
+    """
+    user_ids = np.load(Path(index_dir) / "nodes.npy")
+    retweet_ids = np.load(Path(index_dir) / "retweets.npy")
+    events = {column: np.load(Path(index_dir) / f"{column}.npy", mmap_mode=mmap_mode) for column in EVENT_COLUMNS}
+    return user_ids, retweet_ids, events
+
+
+def window_bounds(t_min, t_max, window, step=None):
+    """
+    Compute the time windows covering [t_min, t_max]. The windows start at multiples of step.
+    :param t_min: (float) timestamp of the first event
+    :param t_max: (float) timestamp of the last event
+    :param window: (float) length of the windows in seconds
+    :param step: (float) distance between the starts of consecutive windows in seconds.
+        None (or step == window) gives tumbling windows, step < window gives overlapping sliding windows
+    :return: (numpy.ndarray) array of shape (windows, 2) with the start (included) and stop (excluded) of each window
+    """
+    step = window if step is None else step
+    if window <= 0 or step <= 0:
+        raise ValueError("window and step must be positive.")
+    starts = np.arange(np.floor(t_min / step) * step, t_max + step, step)
+    starts = starts[(starts <= t_max) & (starts + window > t_min)]
+    return np.stack([starts, starts + window], axis=1)
+
+
+def window_panes(bounds):
+    """
+    Split the time axis into the panes delimited by the starts and stops of all the windows, so that every window
+    is a contiguous range of panes. Overlapping windows share their panes.
+    :param bounds: (numpy.ndarray) the windows (see window_bounds)
+    :return: (cuts, ranges) the pane boundaries (pane p is [cuts[p], cuts[p + 1])) and, for each window, its first and last (excluded) pane
+    """
+    cuts = np.unique(bounds)
+    return cuts, np.searchsorted(cuts, bounds)
+
+
+def pane_counts(events, cuts, shape):
+    """
+    Count the retweets of each user in each pane, scanning every event once.
+    :param events: (dict) the event arrays of the index
+    :param cuts: (numpy.ndarray) the pane boundaries (see window_panes)
+    :param shape: (tuple) (number of users, number of retweeted statuses)
+    :return: (list) one scipy.sparse.csr_matrix of counts (users x retweets) per pane
+    """
+    positions = np.searchsorted(events["timestamp"], cuts, side="left")
+    panes = []
+    for lo, hi in zip(positions[:-1], positions[1:]):
+        users = np.asarray(events["user"][lo:hi])
+        retweets = np.asarray(events["retweet"][lo:hi])
+        panes.append(sp.csr_matrix((np.ones(hi - lo, dtype=np.float64), (users, retweets)), shape=shape))
+    return panes
+
+
+def window_counts(panes, first, last):
+    """
+    Sum the pane counts of a window.
+    :param panes: (list) the pane counts (see pane_counts)
+    :param first: (int) first pane of the window
+    :param last: (int) last pane of the window (excluded)
+    :return: (scipy.sparse.csr_matrix) the counts (users x retweets) of the window
+    """
+    counts = panes[first].copy()
+    for pane in panes[first + 1:last]:
+        counts = counts + pane
+    return counts
@@ -0,0 +1,102 @@
+'''
+This module implements the streaming reader of the raw JSONlines input.
+Lines are read as bytes and decoded with orjson when it is installed (json otherwise).
+Inputs compressed with gzip (".gz") or zstandard (".zst", requires the zstandard package) are decompressed
+in a background thread while the lines are consumed.
+'''
+
+from pathlib import Path
+import threading
+import queue
+import gzip
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def decode_line(line):
+    """
+    Decode a json line.
+    :param line: (bytes) the json line
+    :return: the decoded object
+    """
+    return loads(line)
+
+
+def open_binary(path):
+    """
+    Open an input file in binary mode, decompressing gzip (".gz") and zstandard (".zst") files.
+    :param path: (str) the path of the file
+    :return: a binary file object
+    """
+    suffix = Path(path).suffix
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise ImportError("The zstandard package is required to read {}.".format(path))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def read_lines(path, blocksize=1 << 20, prefetch=8):
+    """
+    Iterate over the lines of a (possibly compressed) JSONlines file.
+    Compressed files are decompressed in a background thread, which keeps up to prefetch blocks ahead of the reader.
+    :param path: (str) the path of the file
+    :param blocksize: (int) size in bytes of the decompressed blocks
+    :param prefetch: (int) number of decompressed blocks buffered by the background thread
+    :return: generator of lines (bytes, without the trailing newline)
+    """
+    if Path(path).suffix not in [".gz", ".zst"]:
+        with open(path, "rb") as handle:
+            for line in handle:
+                yield line.rstrip(b"\r\n")
+        return
+
+    blocks = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def decompress():
+        try:
+            with open_binary(path) as handle:
+                while not stop.is_set():
+                    block = handle.read(blocksize)
+                    blocks.put(block)
+                    if not block:
+                        break
+        except Exception as e:
+            blocks.put(e)
+
+    thread = threading.Thread(target=decompress, daemon=True)
+    thread.start()
+    try:
+        buffer = b""
+        while True:
+            block = blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                break
+            lines = (buffer + block).split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                yield line.rstrip(b"\r")
+        if buffer:
+            yield buffer.rstrip(b"\r")
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
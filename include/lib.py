@@ -1,6 +1,9 @@
 import os
 import sys
 import time
+import calendar
+import datetime
+import functools
 import pickle
 import dateutil.parser as dp
 import pytz
@@ -14,7 +17,8 @@ import pandas as pd
 import networkx as nx
 import csv
 import json
-import community.community_louvain as community_louvain
+from .edge_store import load_edge_list
+from .user_index import intern_user_ids
 
 random.seed(42)
 
@@ -50,6 +54,57 @@ def UTC_to_timestamp(utc):
     return utc.timestamp()
 
 
+TWITTER_MONTHS = {month: i + 1 for i, month in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                                                           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])}
+TIMESTAMP_CACHE_SIZE = 1 << 16
+
+
+def twitter_date_to_timestamp(datestring):
+    """
+    Convert a datestring in the fixed Twitter created_at format (e.g., "Wed Oct 10 20:19:24 +0000 2018") to timestamp.
+    :param datestring: (str) the datestring
+    :return: (float) timestamp in seconds, None if the datestring is not in the Twitter format
+    """
+    parts = datestring.split(" ")
+    if len(parts) != 6 or parts[1] not in TWITTER_MONTHS or len(parts[4]) != 5 or parts[4][0] not in "+-":
+        return None
+    try:
+        hours, minutes, seconds = (int(x) for x in parts[3].split(":"))
+        offset = int(parts[4][1:3]) * 3600 + int(parts[4][3:5]) * 60
+        timestamp = calendar.timegm((int(parts[5]), TWITTER_MONTHS[parts[1]], int(parts[2]), hours, minutes, seconds))
+    except ValueError:
+        return None
+    return float(timestamp - offset if parts[4][0] == "+" else timestamp + offset)
+
+
+@functools.lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def date_string_to_timestamp(datestring):
+    """
+    Convert a datestring to timestamp, with a bounded cache of the converted datestrings.
+    Twitter created_at and ISO-8601 datestrings are parsed directly, other formats are parsed with dateutil.
+    It is equivalent to UTC_to_timestamp(date_string_to_UTC(datestring)).
+    :param datestring: (str) generic datestring
+    :return: (float) timestamp in seconds
+    """
+    timestamp = twitter_date_to_timestamp(datestring)
+    if timestamp is not None:
+        return timestamp
+    try:
+        return datetime.datetime.fromisoformat(datestring).astimezone(pytz.utc).timestamp()
+    except ValueError:
+        return UTC_to_timestamp(date_string_to_UTC(datestring))
+
+
+def date_strings_to_timestamps(datestrings):
+    """
+    Convert an array of datestrings to timestamps, converting each distinct datestring once.
+    :param datestrings: (list) datestrings
+    :return: (numpy.ndarray) float64 timestamps in seconds
+    """
+    timestamps = {datestring: date_string_to_timestamp(datestring) for datestring in dict.fromkeys(datestrings)}
+    return np.array([timestamps[datestring] for datestring in datestrings], dtype=np.float64)
+
+
 def load_pickle(pickle_path):
     """
     Load a pickle serialized object.
@@ -97,35 +152,58 @@ def nested_get_value(dictionary, keys):
 
 
 def load_graph_from_csvs(node_csv_path, edge_csv_path):
+    """
+    Load a networkx graph from the node csv and the edge list, with the user ids as nodes.
+    :param node_csv_path: (str) the path of the csv with the nodes and their attributes (header: user_id, ...)
+    :param edge_csv_path: (str) the path of the edge store directory or of the csv with the edges (header: source, target, weight, ...)
+    :return: (networkx.Graph) the graph
+    """
+    G, user_ids = load_indexed_graph_from_csvs(node_csv_path, edge_csv_path)
+    return nx.relabel_nodes(G, dict(enumerate(user_ids.tolist())))
+
+
+def load_indexed_graph_from_csvs(node_csv_path, edge_csv_path):
+    """
+    Load a networkx graph from the node csv and the edge list, with the int index of the users in the user id table of the edge list as nodes.
+    Nodes are added in the order of the node csv, then edges in the order of the edge list.
+    :param node_csv_path: (str) the path of the csv with the nodes and their attributes (header: user_id, ...)
+    :param edge_csv_path: (str) the path of the edge store directory or of the csv with the edges (header: source, target, weight, ...)
+    :return: (G, user_ids) the graph and the user id table, where user_ids[node] is the user id of node
+    """
     my_print(f"Loading graph...")
     df_node = pd.read_csv(node_csv_path, dtype = {
         "user_id": str
     })
-    df_node = df_node.set_index("user_id")
-    dict_node = df_node.to_dict('index')
-    dict_node = [(n, attr) for n, attr in dict_node.items()] #[(4, {"color": "red"}),(5,{"color": "green"})]
-    df_edge = pd.read_csv(edge_csv_path, dtype = {
-        "source": str,
-        "target": str
-    })
-    df_edge = df_edge.set_index(['source', 'target'])
-    dict_edge = df_edge.to_dict('index')
-    dict_edge = [(s, t, attr) for (s, t), attr in dict_edge.items()] # [(1, 2, {'color': 'blue'}), (2, 3, {'weight': 8})]
+    user_ids, columns = load_edge_list(edge_csv_path)
+    user_ids, node_indices = intern_user_ids(user_ids, df_node["user_id"])
+    node_attributes = df_node.columns.drop("user_id")
+    dict_node = zip(node_indices.tolist(), df_node[node_attributes].to_dict('records') if len(node_attributes) > 0 else [{}] * len(df_node)) #[(4, {"color": "red"}),(5,{"color": "green"})]
+    attributes = [column for column in columns if column not in ["source", "target"]]
+    dict_edge = zip(np.asarray(columns["source"]).tolist(), np.asarray(columns["target"]).tolist(),
+                    (dict(zip(attributes, values)) for values in zip(*[np.asarray(columns[a]).tolist() for a in attributes]))) # [(1, 2, {'color': 'blue'}), (2, 3, {'weight': 8})]
     G = nx.Graph()
     G.add_nodes_from(dict_node)
     G.add_edges_from(dict_edge)
 
-    return G
+    return G, user_ids
+
+
+def load_user_ids_from_csvs(node_csv_path, edge_csv_path):
+    """
+    Load the user id table of the graph returned by load_indexed_graph_from_csvs, without loading the graph.
+    :param node_csv_path: (str) the path of the csv with the nodes (header: user_id, ...)
+    :param edge_csv_path: (str) the path of the edge store directory or of the csv with the edges
+    :return: (numpy.ndarray) the user id table
+    """
+    user_ids, _ = load_edge_list(edge_csv_path)
+    df_node = pd.read_csv(node_csv_path, dtype = {"user_id": str}, usecols = ["user_id"])
+    user_ids, _ = intern_user_ids(user_ids, df_node["user_id"])
+    return user_ids
 
 
 def compute_tfidf_tagclouds(ids_to_consider, ids, corpus, dictionary, model):
-    indices = []
-    ids_skipped = 0
-    for id_to_consider in ids_to_consider:
-        try:
-            indices.append(ids.index(id_to_consider))
-        except:
-            ids_skipped += 1
+    indices = pd.Index(ids).get_indexer(ids_to_consider)
+    indices = indices[indices >= 0]
 
     vector = np.zeros(len(dictionary))
 
@@ -141,44 +219,45 @@ def compute_tfidf_tagclouds(ids_to_consider, ids, corpus, dictionary, model):
 
     return {dictionary[k]: tfidf for k, tfidf in enumerate(vector)}
 
-def compute_seed_comm(node_csv_path, edge_csv_path, louvain_resolution, output_node_csv_path):
+def compute_seed_comm(node_csv_path, edge_csv_path, louvain_resolution, output_node_csv_path, backend="python-louvain", check_parity=False):
     """ Extracts the communities with the input louvain_resolution parameter.
         For each user, we save the community of belonging under the column called "modularity_class", in the node_list.csv.
         Here, we extract the communities using networkx and louvain, but one could alternatively extract community using viz softwares (e.g., gephi) that allow to visually see the communities and play with the louvain parameters, and export a csv with the header: user_id, modularity_class.
+        The communities are computed by the backend (see include/community_detection.py), with check_parity the modularity is compared with the python-louvain communities.
     """
-    G = load_graph_from_csvs(node_csv_path, edge_csv_path)
+    # imported here because the community detection module uses the logging of this module
+    from .community_detection import detect_communities
+    G, user_ids = load_indexed_graph_from_csvs(node_csv_path, edge_csv_path)
     my_print("Extracting louvain communities...")
-    user_comm_dict = community_louvain.best_partition(G, resolution = louvain_resolution, randomize=False, random_state=0)
+    user_comm_dict = detect_communities(G, resolution = louvain_resolution, random_state = 0, backend = backend, check_parity = check_parity)
     nx.set_node_attributes(G, values = user_comm_dict, name = 'modularity_class')
     # Create csv file node_csv_path to save node list with community (modularity_class) info
     with open(output_node_csv_path, "w") as handle:
         writer = csv.writer(handle, quotechar = '"', quoting = csv.QUOTE_NONNUMERIC)
         writer.writerow(["user_id", "modularity_class"])
         for v in G.nodes(data = True):
-            writer.writerow([v[0], v[1]['modularity_class']])
+            writer.writerow([user_ids[v[0]], v[1]['modularity_class']])
     my_print(f"Extracted louvain communities with resolution {louvain_resolution} saved to (modularity class) in {output_node_csv_path}")
 
     return output_node_csv_path
 
 
-def parse_seed_comm(node_csv_path, output_path):
+def parse_seed_comm(node_csv_path, output_path, return_seed=False):
     """ Renames the communities such that the name (i.e., number) of the communities is correlated to their size (i.e., number of users).
         For instance, we want the community "0" to be the largest community, and so on.
         This renaming step is needed because, when extracting the communities, the algorithm assigns a name (i.e., number) to different communities depending on the order in which the nodes are considered.
         We save the new name under the column "modularity_def" in the same file.
+        With return_seed=True, the seed communities saved in output_path (dict community -> user ids) are also returned, so that they can be passed in memory to the next stage.
     """
     my_print("Loading seed partition from {}.".format(node_csv_path))
     df = pd.read_csv(node_csv_path, dtype={"user_id": str})
     df_count = df.groupby("modularity_class").size().sort_values(ascending=False).reset_index(name='count')
 
     my_print("Parsing...")
-    seed_mod_dict = dict()
-
-    df["modularity_def"] = -1
-
-    for i, row in df_count.iterrows():
-        seed_mod_dict.setdefault(i, df.loc[df["modularity_class"]==row["modularity_class"], "user_id"].to_list())
-        df.loc[df["modularity_class"]==row["modularity_class"], "modularity_def"] = i
+    # rank of each community by size (same order of the sorted counts, ties included), mapped on all the nodes at once
+    rank = pd.Series(np.arange(len(df_count)), index=df_count["modularity_class"])
+    df["modularity_def"] = df["modularity_class"].map(rank)
+    seed_mod_dict = {int(i): users for i, users in df.groupby("modularity_def", sort=True)["user_id"].agg(list).items()}
 
     df[["user_id","modularity_def"]].to_csv(node_csv_path, index=False, header=True, quoting=csv.QUOTE_NONNUMERIC)
 
@@ -189,5 +268,7 @@ def parse_seed_comm(node_csv_path, output_path):
 
     my_print("Formatted seed partition saved to {}".format(output_path))
 
+    if return_seed:
+        return output_path, seed_mod_dict
     return output_path
 
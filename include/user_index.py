@@ -0,0 +1,51 @@
+'''
+This module implements the user id interning table shared by the stages of the pipeline.
+The table is created when the user vector models are computed: the i-th user id of the table is the user
+of the i-th document of the corpora, and it is referred to by the int32 index i in edge lists, graphs,
+partitions and coordinated groups. User ids are translated back to strings only in the exported files.
+'''
+
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+USER_INDEX = "user_index.npy"
+
+
+def save_user_index(user_ids, user_index_path):
+    """
+    Save the user id table.
+    :param user_ids: (list) the user ids, in order of index
+    :param user_index_path: (str) the path of the .npy file
+    :return: (str) user_index_path
+    """
+    np.save(user_index_path, np.asarray(user_ids, dtype=str))
+    return user_index_path
+
+
+def load_user_index(user_index_path):
+    """
+    Load the user id table.
+    :param user_index_path: (str) the path of the .npy file, or of the directory of the user vector models containing it
+    :return: (numpy.ndarray) the user ids, in order of index
+    """
+    if Path(user_index_path).is_dir():
+        user_index_path = Path(user_index_path) / USER_INDEX
+    return np.load(user_index_path)
+
+
+def intern_user_ids(user_index, user_ids):
+    """
+    Map user ids to their index in the user id table, appending the user ids not in the table.
+    :param user_index: (numpy.ndarray) the user id table
+    :param user_ids: (list) the user ids to map
+    :return: (user_index, indices) the (possibly extended) user id table and the int32 indices of user_ids
+    """
+    user_ids = np.asarray(user_ids, dtype=str)
+    indices = pd.Index(user_index).get_indexer(user_ids)
+    missing = indices < 0
+    if missing.any():
+        new_ids = pd.unique(user_ids[missing])
+        indices[missing] = len(user_index) + pd.Index(new_ids).get_indexer(user_ids[missing])
+        user_index = np.concatenate([np.asarray(user_index, dtype=str), new_ids.astype(str)])
+    return user_index, indices.astype(np.int32)
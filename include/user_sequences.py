@@ -2,71 +2,177 @@
 from .lib import *
 import jsonlines
 from concurrent.futures import ProcessPoolExecutor
-from itertools import repeat
+from .json_stream import decode_line, read_lines
+from collections import deque
+from pathlib import Path
+
+
+@functools.lru_cache(maxsize=None)
+def split_key_path(key_path):
+    """
+    Split a dot-separated key path (e.g., "entities.hashtags.text") into the path of the list and the key of its items.
+    :param key_path: (str) the key path
+    :return: (tuple) the keys leading to the list (e.g., ("entities", "hashtags")) and the item key (e.g., "text")
+    """
+    keys = key_path.split(".")
+    return tuple(keys[:-1]), keys[-1]
 
 
 def handle_sources(tweet, source_keys):
 
     sequences = []
     for skl in source_keys:
-        seq = []
+        seq = set()
         for sk in skl:
-            k = sk.split(".")
-            seq.extend([str(item[k[-1]]).lower() for item in nested_get_value(tweet, k[:-1])])
-
-        sequences.append(sorted(list(set(seq))))
+            path, key = split_key_path(sk)
+            items = tweet
+            try:
+                # only the subtrees along the key path are visited
+                for k in path:
+                    items = items[k]
+            except KeyError:
+                continue
+            seq.update(str(item[key]).lower() for item in items)
+
+        sequences.append(sorted(seq))
 
     return sequences
 
 
-def parse_raw_sequences(raw_sequences_path, output_path):
-    """
-    Parse raw sequences to extract proper vectors and save them to output_path.
-    :param raw_sequences_path: [str] the path to the raw sequences JSONlines file
-    :param output_path: [str] output path
-    :return: None
-    """
-    hashtag_keys = ["entities.hashtags.text",
-                    "extended_tweet.entities.hashtags.text",
-                    "retweeted_status.entities.hashtags.text",
-                    "retweeted_status.extended_tweet.entities.hashtags.text"]
-
-    mention_keys = ["entities.user_mentions.id",
-                    "extended_tweet.entities.user_mentions.id",
-                    "retweeted_status.entities.user_mentions.id",
-                    "retweeted_status.extended_tweet.entities.user_mentions.id"]
-
-    url_keys = ["entities.urls.expanded_url",
-                "extended_tweet.entities.urls.expanded_url",
-                "retweeted_status.entities.urls.expanded_url",
-                "retweeted_status.extended_tweet.entities.urls.expanded_url"]
-
-    with jsonlines.open(raw_sequences_path, "r") as input_handle:
-        with jsonlines.open(output_path, "w") as output_handle:
-            for i, user in enumerate(input_handle):
-                to_write = dict()
-                to_write["user_id"] = user["user_id"]
-                to_write["timestamps"] = user["timestamps"]
-                to_write["retweeted_status_ids"] = [t["retweeted_status"]["id_str"] for t in user["raw_sequences"]]
-                to_write["retweeted_status_timestamps"] = [UTC_to_timestamp(date_string_to_UTC(t["retweeted_status"]["created_at"])) for t in user["raw_sequences"]]
-                hashtags, mentions, urls = zip(*[x for x in ProcessPoolExecutor().map(handle_sources, user["raw_sequences"], repeat([hashtag_keys, mention_keys, url_keys]))])
-                to_write["retweeted_status_user_ids"] = [t["retweeted_status"]["user"]["id_str"] for t in user["raw_sequences"]]
-                to_write["hashtags"] = list(hashtags)
-                to_write["mentions"] = list(mentions)
-                to_write["urls"] = list(urls)
-                output_handle.write(to_write)
-                my_print("{} users processed.".format(i+1))
-
-
-
-
-
-
-
-
-
+HASHTAG_KEYS = ["entities.hashtags.text",
+                "extended_tweet.entities.hashtags.text",
+                "retweeted_status.entities.hashtags.text",
+                "retweeted_status.extended_tweet.entities.hashtags.text"]
 
+MENTION_KEYS = ["entities.user_mentions.id",
+                "extended_tweet.entities.user_mentions.id",
+                "retweeted_status.entities.user_mentions.id",
+                "retweeted_status.extended_tweet.entities.user_mentions.id"]
 
+URL_KEYS = ["entities.urls.expanded_url",
+            "extended_tweet.entities.urls.expanded_url",
+            "retweeted_status.entities.urls.expanded_url",
+            "retweeted_status.extended_tweet.entities.urls.expanded_url"]
 
+def parse_user(user):
+    """
+    Parse the raw sequence of a user.
+    :param user: (dict) the user, with "user_id", "timestamps" and "raw_sequences"
+    :return: (dict) the parsed user
+    """
+    to_write = dict()
+    to_write["user_id"] = user["user_id"]
+    to_write["timestamps"] = user["timestamps"]
+    to_write["retweeted_status_ids"] = [t["retweeted_status"]["id_str"] for t in user["raw_sequences"]]
+    to_write["retweeted_status_timestamps"] = date_strings_to_timestamps([t["retweeted_status"]["created_at"] for t in user["raw_sequences"]]).tolist()
+    hashtags, mentions, urls = zip(*[handle_sources(t, [HASHTAG_KEYS, MENTION_KEYS, URL_KEYS]) for t in user["raw_sequences"]]) if user["raw_sequences"] else ((), (), ())
+    to_write["retweeted_status_user_ids"] = [t["retweeted_status"]["user"]["id_str"] for t in user["raw_sequences"]]
+    to_write["hashtags"] = list(hashtags)
+    to_write["mentions"] = list(mentions)
+    to_write["urls"] = list(urls)
+    return to_write
+
+
+def parse_user_lines(lines):
+    """
+    Parse a chunk of users from the lines of the raw sequences file.
+    :param lines: (list) json lines, one per user
+    :return: (list) the parsed users, in the same order
+    """
+    return [parse_user(decode_line(line)) for line in lines]
 
 
+def read_user_chunks(raw_sequences_path, chunksize):
+    """
+    Read the raw sequences file (plain, gzip or zstandard compressed) in chunks of users.
+    :param raw_sequences_path: (str) the path to the raw sequences JSONlines file
+    :param chunksize: (int) number of users per chunk
+    :return: generator of lists of json lines
+    """
+    chunk = []
+    for line in read_lines(raw_sequences_path):
+        if line.strip():
+            chunk.append(line)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_raw_sequences(raw_sequences_path, output_path, workers=1, chunksize=64, log_every=1000):
+    """
+    Parse raw sequences to extract proper vectors and save them to output_path.
+    The users are read in chunks that are parsed by a single pool of worker processes, keeping the input order.
+    :param raw_sequences_path: [str] the path to the raw sequences JSONlines file (".gz" and ".zst" files are decompressed)
+    :param output_path: [str] output path
+    :param workers: [int] number of worker processes (1 parses in the current process)
+    :param chunksize: [int] number of users sent to a worker at once
+    :param log_every: [int] number of users between two progress messages
+    :return: None
+    """
+    chunks = read_user_chunks(raw_sequences_path, chunksize)
+    processed = 0
+    with jsonlines.open(output_path, "w") as output_handle:
+
+        def write(users):
+            nonlocal processed
+            output_handle.write_all(users)
+            if (processed + len(users)) // log_every > processed // log_every:
+                my_print("{} users processed.".format(processed + len(users)))
+            processed += len(users)
+
+        if workers == 1:
+            for chunk in chunks:
+                write(parse_user_lines(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # at most 2 chunks per worker are in flight, so that the input is not read in memory at once
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(parse_user_lines, chunk))
+                    if len(pending) >= 2 * workers:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+
+    if processed % log_every != 0:
+        my_print("{} users processed.".format(processed))
+
+
+SEQUENCE_FIELDS = ["timestamps", "retweeted_status_ids", "retweeted_status_timestamps", "retweeted_status_user_ids",
+                   "hashtags", "mentions", "urls"]
+
+
+def merge_user_sequences(sequences_path, new_sequences_path):
+    """
+    Merge new parsed sequences into a parsed sequences file, in place.
+    The new tweets of existing users are appended to their sequences, and new users are appended at the end of the file,
+    in order of first appearance. The new sequences must only contain tweets that are not already in sequences_path.
+    :param sequences_path: (str) the path of the parsed sequences JSONlines file
+    :param new_sequences_path: (str) the path of the new parsed sequences JSONlines file
+    :return: (list) the new users, in the order they are appended
+    """
+    new_users = {}
+    with jsonlines.open(new_sequences_path, "r") as handle:
+        for user in handle:
+            user_id = str(user["user_id"])
+            if user_id in new_users:
+                for field in SEQUENCE_FIELDS:
+                    new_users[user_id][field].extend(user[field])
+            else:
+                new_users[user_id] = user
+
+    tmp_path = Path(str(sequences_path) + ".tmp")
+    with jsonlines.open(tmp_path, "w") as output_handle:
+        with jsonlines.open(sequences_path, "r") as input_handle:
+            for user in input_handle:
+                new_user = new_users.pop(str(user["user_id"]), None)
+                if new_user is not None:
+                    for field in SEQUENCE_FIELDS:
+                        user[field].extend(new_user[field])
+                output_handle.write(user)
+        output_handle.write_all(new_users.values())
+    tmp_path.replace(sequences_path)
+
+    return list(new_users)
@@ -1,14 +1,22 @@
 from gensim.test.utils import get_tmpfile
 from gensim.similarities import Similarity
+from gensim.matutils import corpus2csc
 from .lib import *
-import csv
+from .edge_store import is_csv, load_edge_list, save_edge_list, save_edge_lists, merge_edge_lists
+from .user_index import load_user_index, intern_user_ids
+from .event_index import load_event_index
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+import scipy.sparse as sp
+import shutil
 
 
-def save_cosine_similarities(ids_path, dct_path, corpus_path, model_path, output_path,
+def save_cosine_similarities(user_index_path, dct_path, corpus_path, model_path, output_path,
                              chunksize=256, shardsize=32768, norm='l2'):
 
     my_print("Loading data from pickles...")
-    ids = load_pickle(ids_path)
+    ids = load_user_index(user_index_path)
     dct = load_pickle(dct_path)
     corpus = load_pickle(corpus_path)
     model = load_pickle(model_path)
@@ -22,24 +30,964 @@ def save_cosine_similarities(ids_path, dct_path, corpus_path, model_path, output
 
     #print(index[model[corpus]])
 
-    my_print("Save similarities:")
-    with open(output_path, "w") as handle:
-        writer = csv.writer(handle, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
-        writer.writerow(["source", "target", "weight"])
+    def blocks():
         for i, similarities in enumerate(index[model[corpus]]):
-            for j, similarity in enumerate(similarities[i+1:]):
-                if similarity > 0:
-                    writer.writerow([ids[i], ids[j+i+1], similarity])
+            j = np.nonzero(similarities[i+1:] > 0)[0] + i + 1
+            yield {"source": np.full(len(j), i), "target": j, "weight": similarities[j]}
             my_print("{0}/{1} user processed.".format(i+1, len(ids)))
 
+    my_print("Save similarities:")
+    return save_edge_list(output_path, ids, blocks())
+
+
+def load_tfidf_matrix(dct_path, corpus_path, model_path, norm='l2'):
+    """
+    Load the TF-IDF user vectors as a row-normalized sparse matrix.
+    :param dct_path: (str) path to the pickled gensim Dictionary
+    :param corpus_path: (str) path to the pickled BoW corpus
+    :param model_path: (str) path to the pickled gensim TfidfModel
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :return: (scipy.sparse.csr_matrix) float32 matrix of shape (users, features)
+    """
+    dct = load_pickle(dct_path)
+    corpus = load_pickle(corpus_path)
+    model = load_pickle(model_path)
+
+    X = corpus2csc(model[corpus], num_terms=len(dct), num_docs=len(corpus), dtype=np.float32).T.tocsr()
+    X.sort_indices()
+    return normalize_rows(X, norm=norm)
+
+
+def normalize_rows(X, norm='l2'):
+    """
+    Normalize the rows of a sparse matrix, leaving empty rows untouched.
+    :param X: (scipy.sparse.csr_matrix) the matrix to normalize
+    :param norm: (str) 'l2' or 'l1'
+    :return: (scipy.sparse.csr_matrix) the normalized matrix
+    """
+    if norm == 'l2':
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1), dtype=np.float64).ravel())
+    elif norm == 'l1':
+        norms = np.asarray(abs(X).sum(axis=1), dtype=np.float64).ravel()
+    else:
+        raise ValueError("Unknown norm '{}'. Possible values: 'l2', 'l1'.".format(norm))
+    norms[norms == 0] = 1.
+    return sp.diags((1. / norms).astype(X.dtype)).dot(X).tocsr()
+
+
+def tfidf_matrix_from_counts(counts, norm='l2', eps=1e-12):
+    """
+    Compute the TF-IDF user vectors from a matrix of counts, with the weighting of the default gensim TfidfModel
+    (tf * log2(users / df), unit length rows), so that it gives the same matrix of load_tfidf_matrix for the same documents.
+    :param counts: (scipy.sparse.csr_matrix) counts of the features (columns) of each user (rows)
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param eps: (float) weights with absolute value below eps are dropped, as in gensim
+    :return: (scipy.sparse.csr_matrix) float32 matrix of shape (users, features)
+    """
+    X = sp.csr_matrix(counts, dtype=np.float64, copy=True)
+    X.sort_indices()
+    df = np.bincount(X.indices, minlength=X.shape[1])
+    idfs = np.log2(X.shape[0] / np.maximum(df, 1))
+    X.data *= np.where(np.abs(idfs) > eps, idfs, 0.)[X.indices]
+    X = normalize_rows(X, norm='l2')
+    X.data[np.abs(X.data) <= eps] = 0.
+    X.eliminate_zeros()
+    return normalize_rows(X.astype(np.float32), norm=norm)
+
+
+def save_matrix_cosine_similarities(ids, X, output_path, chunksize=256, min_weight=0.):
+    """
+    Compute the cosine similarities between the row-normalized user vectors of a matrix in blocks of rows, and save the nonzero pairs
+    (see save_sparse_cosine_similarities).
+    :param ids: (numpy.ndarray) the user ids of the rows
+    :param X: (scipy.sparse.csr_matrix) row-normalized user vectors
+    :param output_path: (str) path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param min_weight: (float) minimum similarity of the edges to save
+    :return: (int) the number of saved edges
+    """
+    XT = X.T.tocsr()
+    counts = {"edges": 0}
+
+    def blocks():
+        for start in range(0, X.shape[0], chunksize):
+            rows, cols, similarities, _ = upper_triangular_block(X, XT, start, min(start + chunksize, X.shape[0]), min_weight=min_weight)
+            counts["edges"] += len(rows)
+            yield {"source": rows, "target": cols, "weight": similarities}
+
+    save_edge_list(output_path, ids, blocks())
+    return counts["edges"]
+
+
+def upper_triangular_block(X, XT, start, stop, min_weight=0., thresholds=None):
+    """
+    Compute the similarities between the users in rows [start, stop) and all the following users.
+    :param X: (scipy.sparse.csr_matrix) row-normalized user vectors
+    :param XT: (scipy.sparse.csr_matrix) transpose of X (features x users), computed once for all the blocks
+    :param start: (int) first row of the block
+    :param stop: (int) last row of the block (excluded)
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param thresholds: (numpy.ndarray) per-user similarity thresholds (see top_k_thresholds): a pair is kept if its similarity
+        reaches the threshold of at least one of the two users. None keeps all the pairs.
+    :return: (rows, cols, similarities, pruned) arrays of the kept nonzero pairs with rows < cols, ordered by row and column,
+        and the number of nonzero pairs discarded by min_weight and thresholds
+    """
+    # the users before start are not multiplied: their pairs with the block are below the diagonal
+    return upper_triangular_pairs(X[start:stop].dot(XT[:, start:]), start, min_weight=min_weight, thresholds=thresholds)
+
+
+def upper_triangular_pairs(block, start, min_weight=0., thresholds=None):
+    """
+    Extract the pairs with rows < cols from a block of rows [start, start + block rows) of the similarity matrix (see upper_triangular_block).
+    :param block: (scipy.sparse matrix) the similarities between the users of the block (rows) and the users from start on (columns),
+        i.e. the column j of the block is the user start + j
+    :param start: (int) first row of the block
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param thresholds: (numpy.ndarray) per-user similarity thresholds (see top_k_thresholds), None keeps all the pairs
+    :return: (rows, cols, similarities, pruned) as upper_triangular_block
+    """
+    block = sp.csr_matrix(block)
+    block.sort_indices()
+    block = block.tocoo()
+    upper = (block.col > block.row) & (block.data > 0)
+    keep = upper & (block.data >= min_weight)
+    if thresholds is not None:
+        keep &= (block.data >= thresholds[block.row + start]) | (block.data >= thresholds[block.col + start])
+    pruned = np.count_nonzero(upper) - np.count_nonzero(keep)
+    keep = np.nonzero(keep)[0]
+    return block.row[keep] + start, block.col[keep] + start, block.data[keep], pruned
+
+
+def top_k_thresholds(rows, similarities, n_rows, top_k):
+    """
+    Compute for each row the similarity of its top_k-th strongest pair, so that the pairs of a row with similarity
+    greater than or equal to the threshold are its top_k strongest ones (ties included).
+    :param rows: (numpy.ndarray) row index (0..n_rows-1) of each pair
+    :param similarities: (numpy.ndarray) similarity (positive) of each pair
+    :param n_rows: (int) number of rows
+    :param top_k: (int) number of pairs to keep for each row
+    :return: (numpy.ndarray) the thresholds, 0 for the rows with less than top_k pairs
+    """
+    pairs = sp.csr_matrix((similarities, (rows, np.arange(len(rows)))), shape=(n_rows, len(rows)))
+    return top_k_rows(pairs, top_k).min(axis=1)
+
+
+def top_k_rows(matrix, top_k, runs_per_value=8):
+    """
+    Select the top_k largest values of each row of a sparse matrix of positive values. The values of the rows with at most top_k values are
+    all selected, while the other rows are sorted by decreasing value. Only the values that can be selected are sorted: the rows with more
+    than runs_per_value * top_k values are split in as many disjoint runs, and the top_k-th largest of the maxima of the runs is a lower bound
+    of the top_k-th largest value of the row, below which the values are discarded.
+    :param matrix: (scipy.sparse.csr_matrix) the matrix
+    :param top_k: (int) number of values to select for each row
+    :param runs_per_value: (int) number of runs per selected value of the lower bounds
+    :return: (numpy.ndarray) the top_k largest values of each row, in no particular order (rows x top_k, padded with 0)
+    """
+    n_rows = matrix.shape[0]
+    counts = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(n_rows), counts)
+    values = matrix.data
+    ranks = np.arange(len(rows)) - matrix.indptr[rows]
+    top = np.zeros((n_rows, top_k), dtype=matrix.dtype)
+    short = counts[rows] <= top_k
+    top[rows[short], ranks[short]] = values[short]
+
+    n_runs = runs_per_value * top_k
+    bounds = np.zeros(n_rows, dtype=values.dtype)
+    bounds[counts <= top_k] = np.inf
+    long = np.nonzero(counts > n_runs)[0]
+    if len(long) > 0:
+        runs = matrix.indptr[long][:, None] + (np.arange(n_runs) * counts[long][:, None]) // n_runs
+        # the last run of a row extends to the next long row: the values of the rows in between are masked
+        masked = np.where(counts[rows] > n_runs, values, -np.inf)
+        maxima = np.maximum.reduceat(masked, runs.ravel()).reshape(len(long), n_runs)
+        bounds[long] = np.partition(maxima, n_runs - top_k, axis=1)[:, n_runs - top_k]
+    keep = np.nonzero(values >= bounds[rows])[0]
+    if len(keep) > 0:
+        rows, values = rows[keep], values[keep]
+        order = np.lexsort((-values, rows))
+        rows, values = rows[order], values[order]
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        kept = ranks < top_k
+        top[rows[kept], ranks[kept]] = values[kept]
+    return top
+
+
+def merge_top_k(first, second):
+    """
+    Merge two arrays of the top_k largest values of the same rows (see top_k_rows).
+    :return: (numpy.ndarray) the top_k largest values of each row, in decreasing order
+    """
+    return -np.sort(-np.concatenate([first, second], axis=1), axis=1)[:, :first.shape[1]]
+
+
+def pruned_block(block, start, offset, min_weight=0.):
+    """
+    Discard the pairs of the users with themselves and the pairs below min_weight from a block of the similarity matrix.
+    :param block: (scipy.sparse matrix) the similarities between the users of rows [start, start + block rows) and the users from offset on (columns)
+    :param start: (int) first row of the block
+    :param offset: (int) user of the first column of the block
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :return: (scipy.sparse.csr_matrix) the block with the positive similarities of the kept pairs
+    """
+    block = sp.csr_matrix(block)
+    rows = np.repeat(np.arange(start, start + block.shape[0]), np.diff(block.indptr))
+    block.data[(block.indices + offset == rows) | (block.data < min_weight)] = 0
+    block.eliminate_zeros()
+    return block
+
+
+def top_k_scan_thresholds(X, XT, chunksize, top_k, min_weight=0.):
+    """
+    Compute the top_k_per_user thresholds of all the users (see top_k_thresholds) in a pass over the blocks of rows of the upper triangular
+    similarity matrix, the same blocks of upper_triangular_block. The block of rows [start, stop) gives the pairs of its users with the users
+    from start on, while their pairs with the previous users were found in the previous blocks: the top_k strongest similarities of each user
+    with the previous blocks are kept in a users x top_k array, so the thresholds need only the products of the upper triangular blocks.
+    :param X: (scipy.sparse.csr_matrix) row-normalized user vectors
+    :param XT: (scipy.sparse.csr_matrix) transpose of X (features x users)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param top_k: (int) number of strongest similarities to keep for each user
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :return: (numpy.ndarray) the thresholds of all the users
+    """
+    n_users = X.shape[0]
+    thresholds = np.zeros(n_users, dtype=X.dtype)
+    best = np.zeros((n_users, top_k), dtype=X.dtype)
+    for start in range(0, n_users, chunksize):
+        stop = min(start + chunksize, n_users)
+        block = pruned_block(X[start:stop].dot(XT[:, start:]), start, start, min_weight=min_weight)
+        thresholds[start:stop] = merge_top_k(top_k_rows(block, top_k), best[start:stop])[:, top_k - 1]
+        # the similarities of the following users with the users of the block, by following user
+        following = block[:, stop - start:].T.tocsr()
+        users = np.nonzero(np.diff(following.indptr))[0]
+        best[stop + users] = merge_top_k(top_k_rows(following[users], top_k), best[stop + users])
+    return thresholds
+
+
+def check_top_k(top_k_per_user):
+    """
+    Check the top_k_per_user parameter of the similarity engines.
+    :param top_k_per_user: (int) number of strongest similarities to keep for each user, or None
+    """
+    if top_k_per_user is not None and top_k_per_user < 1:
+        raise ValueError("top_k_per_user must be at least 1, got {}.".format(top_k_per_user))
+
+
+def save_csr_matrix(X, matrix_dir):
+    """
+    Save the arrays of a CSR matrix as .npy files, so that they can be memory-mapped by other processes.
+    :param X: (scipy.sparse.csr_matrix) the matrix to save
+    :param matrix_dir: (str) the directory where to save data.npy, indices.npy, indptr.npy and shape.npy
+    :return: (str) matrix_dir
+    """
+    Path(matrix_dir).mkdir(parents=True, exist_ok=True)
+    np.save(Path(matrix_dir) / "data.npy", X.data)
+    np.save(Path(matrix_dir) / "indices.npy", X.indices)
+    np.save(Path(matrix_dir) / "indptr.npy", X.indptr)
+    np.save(Path(matrix_dir) / "shape.npy", np.asarray(X.shape))
+    return matrix_dir
+
+
+def load_csr_matrix(matrix_dir, mmap_mode='r'):
+    """
+    Load a CSR matrix saved with save_csr_matrix, memory-mapping its arrays.
+    :param matrix_dir: (str) the directory of the matrix
+    :param mmap_mode: (str) memory-map mode of numpy.load (None loads the arrays in memory)
+    :return: (scipy.sparse.csr_matrix) the matrix
+    """
+    arrays = [np.load(Path(matrix_dir) / f"{name}.npy", mmap_mode=mmap_mode) for name in ["data", "indices", "indptr"]]
+    shape = tuple(np.load(Path(matrix_dir) / "shape.npy"))
+    return sp.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def save_similarity_shard(matrix_dir, start, stop, chunksize, shard_path, min_weight=0., top_k=None):
+    """
+    Compute the similarities of the users in rows [start, stop) from the memory-mapped matrices and save them
+    to an edge list shard. It is run by the workers of save_sparse_cosine_similarities.
+    :param matrix_dir: (str) the directory with the memory-mapped "X/", "XT/" matrices and "ids.npy" (and "thresholds.npy" with top_k)
+    :param start: (int) first row of the shard
+    :param stop: (int) last row of the shard (excluded)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param shard_path: (str) path of the shard (csv file or edge store without user ids)
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param top_k: (int) number of strongest similarities to keep for each user, whose thresholds are memory-mapped from "thresholds.npy"
+        (see top_k_thresholds), None keeps all the pairs
+    :return: (edges, pruned) number of edges saved and discarded
+    """
+    X = load_csr_matrix(Path(matrix_dir) / "X")
+    XT = load_csr_matrix(Path(matrix_dir) / "XT")
+    ids = np.load(Path(matrix_dir) / "ids.npy", mmap_mode='r')
+    thresholds = np.load(Path(matrix_dir) / "thresholds.npy", mmap_mode='r') if top_k is not None else None
+
+    counts = {"edges": 0, "pruned": 0}
+
+    def blocks():
+        for block_start in range(start, stop, chunksize):
+            block_stop = min(block_start + chunksize, stop)
+            rows, cols, similarities, block_pruned = upper_triangular_block(X, XT, block_start, block_stop, min_weight=min_weight, thresholds=thresholds)
+            counts["edges"] += len(rows)
+            counts["pruned"] += block_pruned
+            yield {"source": rows, "target": cols, "weight": similarities}
+
+    save_edge_list(shard_path, ids if is_csv(shard_path) else None, blocks())
+    return counts["edges"], counts["pruned"]
+
+
+def top_k_shard_thresholds(matrix_dir, start, stop, chunksize, top_k, min_weight=0.):
+    """
+    Compute the top_k_per_user thresholds of the users in rows [start, stop) (see top_k_thresholds) from the memory-mapped matrices,
+    with the products of their blocks with all the users, independently of the other rows. It is run by the workers of save_sparse_cosine_similarities.
+    :param matrix_dir: (str) the directory with the memory-mapped "X/" and "XT/" matrices
+    :param start: (int) first row of the shard
+    :param stop: (int) last row of the shard (excluded)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param top_k: (int) number of strongest similarities to keep for each user
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :return: (numpy.ndarray) the thresholds of the users of the shard
+    """
+    X = load_csr_matrix(Path(matrix_dir) / "X")
+    XT = load_csr_matrix(Path(matrix_dir) / "XT")
+    thresholds = []
+    for block_start in range(start, stop, chunksize):
+        block_stop = min(block_start + chunksize, stop)
+        block = pruned_block(X[block_start:block_stop].dot(XT), block_start, 0, min_weight=min_weight)
+        thresholds.append(top_k_rows(block, top_k).min(axis=1))
+    return np.concatenate(thresholds + [np.empty(0, dtype=X.dtype)])
+
+
+def save_sparse_cosine_similarities(user_index_path, dct_path, corpus_path, model_path, output_path,
+                                    chunksize=256, norm='l2', workers=1, min_weight=0., top_k_per_user=None):
+    """
+    Compute the cosine similarities between users as a blocked sparse matrix product and save the nonzero pairs.
+    It gives the same edge list of save_cosine_similarities, but the cost scales with the number of
+    user pairs sharing at least one feature instead of all pairs.
+    With workers > 1, the normalized matrix is saved once as memory-mapped .npy files, shared by a pool of processes.
+    Each process computes a range of rows and writes its own edge shard; the shards are then merged in order,
+    so the edge list is the same as the one computed by a single process.
+    The pairs discarded by min_weight and top_k_per_user are pruned in the blocks, before being written.
+    :param user_index_path: (str) path to the user id table
+    :param dct_path: (str) path to the pickled gensim Dictionary
+    :param corpus_path: (str) path to the pickled BoW corpus
+    :param model_path: (str) path to the pickled gensim TfidfModel
+    :param output_path: (str) path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param workers: (int) number of processes
+    :param min_weight: (float) minimum similarity of the edges to save
+    :param top_k_per_user: (int) if not None, an edge is saved only if it is one of the top_k_per_user strongest edges
+        (ties included) of at least one of its users. The thresholds of all the users are computed in a first pass over the blocks
+        (see top_k_scan_thresholds, and top_k_shard_thresholds with workers > 1),
+        then the blocks are computed again and pruned with the thresholds: the edge list is ordered by source and target as without top_k_per_user.
+    :return: (str) output_path
+    """
+    check_top_k(top_k_per_user)
+    my_print("Loading data from pickles...")
+    ids = load_user_index(user_index_path)
+    X = load_tfidf_matrix(dct_path, corpus_path, model_path, norm=norm)
+    XT = X.T.tocsr()
+
+    if workers > 1:
+        return _save_sparse_cosine_similarities_parallel(ids, X, XT, output_path, chunksize, workers, min_weight, top_k_per_user)
+
+    thresholds = None
+    if top_k_per_user is not None:
+        my_print("Computing the top_k_per_user thresholds...")
+        thresholds = top_k_scan_thresholds(X, XT, chunksize, top_k_per_user, min_weight=min_weight)
+    counts = {"edges": 0, "pruned": 0}
+
+    def blocks():
+        for start in range(0, X.shape[0], chunksize):
+            stop = min(start + chunksize, X.shape[0])
+            rows, cols, similarities, block_pruned = upper_triangular_block(X, XT, start, stop, min_weight=min_weight, thresholds=thresholds)
+            counts["edges"] += len(rows)
+            counts["pruned"] += block_pruned
+            yield {"source": rows, "target": cols, "weight": similarities}
+            my_print("{0}/{1} user processed.".format(stop, len(ids)))
+
+    my_print("Save similarities:")
+    save_edge_list(output_path, ids, blocks())
+
+    my_print("{0} edges saved, {1} edges pruned (min_weight={2}, top_k_per_user={3}).".format(counts["edges"], counts["pruned"], min_weight, top_k_per_user))
+    return output_path
+
+
+def _save_sparse_cosine_similarities_parallel(ids, X, XT, output_path, chunksize, workers, min_weight, top_k_per_user):
+
+    shard_dir = Path(output_path).parent / Path(Path(output_path).stem + "_shards")
+    my_print("Saving memory-mapped matrices to {}...".format(shard_dir))
+    save_csr_matrix(X, shard_dir / "X")
+    save_csr_matrix(XT, shard_dir / "XT")
+    np.save(shard_dir / "ids.npy", ids.astype(str))
+    del X, XT
+
+    # shards are contiguous row ranges, a few per worker to balance the load
+    bounds = np.unique(np.linspace(0, len(ids), num=4 * workers + 1).astype(int))
+    shard_paths = [shard_dir / "shard_{0:05d}{1}".format(i, Path(output_path).suffix) for i in range(len(bounds) - 1)]
+
+    if top_k_per_user is not None:
+        my_print("Computing the top_k_per_user thresholds with {} workers...".format(workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            thresholds = list(executor.map(top_k_shard_thresholds, repeat(shard_dir), bounds[:-1], bounds[1:], repeat(chunksize),
+                                           repeat(top_k_per_user), repeat(min_weight)))
+        np.save(shard_dir / "thresholds.npy", np.concatenate(thresholds))
+        del thresholds
+
+    my_print("Save similarities with {} workers:".format(workers))
+    edges = 0
+    pruned = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, (shard_edges, shard_pruned) in enumerate(executor.map(
+                save_similarity_shard, repeat(shard_dir), bounds[:-1], bounds[1:], repeat(chunksize), shard_paths,
+                repeat(min_weight), repeat(top_k_per_user))):
+            edges += shard_edges
+            pruned += shard_pruned
+            my_print("{0}/{1} user processed.".format(bounds[i + 1], len(ids)))
+
+    my_print("Merging {0} shards into {1}...".format(len(shard_paths), output_path))
+    merge_edge_lists(shard_paths, output_path, ids)
+    shutil.rmtree(shard_dir)
+
+    my_print("{0} edges saved, {1} edges pruned (min_weight={2}, top_k_per_user={3}).".format(edges, pruned, min_weight, top_k_per_user))
+    return output_path
+
+
+def multimodal_similarity_blocks(Xs, XTs, start, stop, chunksize, min_weight=0., fusion_weights=None):
+    """
+    Compute the similarities of the users in rows [start, stop) for several user vector models, with the same row blocks.
+    The multiplex similarity is the weighted sum of the similarity blocks of the models, so it does not require another product.
+    :param Xs: (dict) model -> row-normalized user vectors (scipy.sparse.csr_matrix), with the same users (rows)
+    :param XTs: (dict) model -> transpose of the user vectors
+    :param start: (int) first row
+    :param stop: (int) last row (excluded)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param fusion_weights: (dict) model -> weight of the model in the "multiplex" similarity, None does not compute it
+    :return: generator of dicts model (and "multiplex") -> dict of column arrays ("source", "target", "weight")
+    """
+    for block_start in range(start, stop, chunksize):
+        block_stop = min(block_start + chunksize, stop)
+        products = {name: X[block_start:block_stop].dot(XTs[name][:, block_start:]) for name, X in Xs.items()}
+        if fusion_weights is not None:
+            products["multiplex"] = sum(weight * products[name] for name, weight in fusion_weights.items())
+        blocks = {}
+        for name, product in products.items():
+            rows, cols, similarities, _ = upper_triangular_pairs(product, block_start, min_weight=min_weight)
+            blocks[name] = {"source": rows, "target": cols, "weight": similarities.astype(np.float32)}
+        yield blocks
+
+
+def save_multimodal_similarity_shard(matrix_dir, names, start, stop, chunksize, shard_paths, min_weight=0., fusion_weights=None):
+    """
+    Compute the similarities of the users in rows [start, stop) for several user vector models from the memory-mapped matrices,
+    and save them to an edge list shard per model. It is run by the workers of save_multimodal_cosine_similarities.
+    :param matrix_dir: (str) the directory with the memory-mapped "<model>/X/", "<model>/XT/" matrices and "ids.npy"
+    :param names: (list) the user vector models
+    :param start: (int) first row of the shard
+    :param stop: (int) last row of the shard (excluded)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param shard_paths: (dict) model (and "multiplex") -> path of the shard (csv file or edge store without user ids)
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param fusion_weights: (dict) model -> weight of the model in the "multiplex" similarity, None does not compute it
+    :return: (dict) model (and "multiplex") -> number of edges saved
+    """
+    Xs = {name: load_csr_matrix(Path(matrix_dir) / name / "X") for name in names}
+    XTs = {name: load_csr_matrix(Path(matrix_dir) / name / "XT") for name in names}
+    ids = np.load(Path(matrix_dir) / "ids.npy", mmap_mode='r')
+    edges = {name: 0 for name in shard_paths}
+
+    def blocks():
+        for block in multimodal_similarity_blocks(Xs, XTs, start, stop, chunksize, min_weight=min_weight, fusion_weights=fusion_weights):
+            for name in block:
+                edges[name] += len(block[name]["source"])
+            yield block
+
+    save_edge_lists(shard_paths, ids if is_csv(next(iter(shard_paths.values()))) else None, blocks())
+    return edges
+
+
+def save_multimodal_cosine_similarities(user_index_path, model_paths, output_paths, chunksize=256, norm='l2', workers=1, min_weight=0.,
+                                        fusion_weights=None, fused_output_path=None):
+    """
+    Compute the cosine similarities between users for several user vector models (e.g., retweets, hashtags, mentions, urls) in a single job:
+    the matrices of the models are loaded once, and the similarities of all the models are computed with the same row blocks
+    (see save_sparse_cosine_similarities) and written to an edge list per model.
+    With fusion_weights, the multiplex similarity, i.e. the weighted sum of the similarities of the models, is saved as well,
+    computed from the same blocks.
+    :param user_index_path: (str) path to the user id table
+    :param model_paths: (dict) model -> (dct_path, corpus_path, model_path) pickles of the user vector model
+    :param output_paths: (dict) model -> path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param workers: (int) number of processes, each one computing ranges of rows of all the models
+    :param min_weight: (float) minimum similarity of the edges to save
+    :param fusion_weights: (dict) model -> non-negative weight of the model in the multiplex similarity. None does not compute it
+    :param fused_output_path: (str) path of the multiplex edge list, required with fusion_weights
+    :return: (dict) model (and "multiplex") -> path of the edge list
+    """
+    if fusion_weights is not None:
+        if fused_output_path is None or any(name not in model_paths or weight < 0 for name, weight in fusion_weights.items()):
+            raise ValueError("fusion_weights must give non-negative weights to the computed models, and requires fused_output_path.")
+        output_paths = dict(output_paths, multiplex=fused_output_path)
+
+    my_print("Loading data from pickles...")
+    ids = load_user_index(user_index_path)
+    Xs = {name: load_tfidf_matrix(*paths, norm=norm) for name, paths in model_paths.items()}
+    XTs = {name: X.T.tocsr() for name, X in Xs.items()}
+
+    edges = {name: 0 for name in output_paths}
+    if workers == 1:
+        def blocks():
+            for start in range(0, len(ids), chunksize):
+                for block in multimodal_similarity_blocks(Xs, XTs, start, min(start + chunksize, len(ids)), chunksize,
+                                                          min_weight=min_weight, fusion_weights=fusion_weights):
+                    for name in block:
+                        edges[name] += len(block[name]["source"])
+                    yield block
+                my_print("{0}/{1} user processed.".format(min(start + chunksize, len(ids)), len(ids)))
+
+        my_print("Save similarities of {}:".format(", ".join(output_paths)))
+        save_edge_lists(output_paths, ids, blocks())
+    else:
+        shard_dir = Path(next(iter(output_paths.values()))).parent / Path("similarity_shards")
+        my_print("Saving memory-mapped matrices to {}...".format(shard_dir))
+        for name in Xs:
+            save_csr_matrix(Xs[name], shard_dir / name / "X")
+            save_csr_matrix(XTs[name], shard_dir / name / "XT")
+        np.save(shard_dir / "ids.npy", ids.astype(str))
+        del Xs, XTs
+
+        bounds = np.unique(np.linspace(0, len(ids), num=4 * workers + 1).astype(int))
+        shard_paths = [{name: shard_dir / "shard_{0:05d}_{1}{2}".format(i, name, Path(path).suffix) for name, path in output_paths.items()}
+                       for i in range(len(bounds) - 1)]
+        my_print("Save similarities of {0} with {1} workers:".format(", ".join(output_paths), workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i, shard_edges in enumerate(executor.map(save_multimodal_similarity_shard, repeat(shard_dir), repeat(list(model_paths)), bounds[:-1], bounds[1:],
+                                                         repeat(chunksize), shard_paths, repeat(min_weight), repeat(fusion_weights))):
+                for name in shard_edges:
+                    edges[name] += shard_edges[name]
+                my_print("{0}/{1} user processed.".format(bounds[i + 1], len(ids)))
+
+        for name, path in output_paths.items():
+            my_print("Merging {0} shards into {1}...".format(len(shard_paths), path))
+            merge_edge_lists([paths[name] for paths in shard_paths], path, ids)
+        shutil.rmtree(shard_dir)
+
+    for name in output_paths:
+        my_print("{0}: {1} edges saved (min_weight={2}).".format(name, edges[name], min_weight))
+    return output_paths
+
+
+def update_sparse_cosine_similarities(user_index_path, dct_path, corpus_path, model_path, X_old, edge_path,
+                                      chunksize=256, norm='l2', min_weight=0., tolerance=0.):
+    """
+    Patch the edge list computed by save_sparse_cosine_similarities after the user vector models have been updated
+    with new users and tweets (see update_tf_idf_model). Only the similarities of the users whose vector changed are recomputed:
+    new users, users with new tweets, and users sharing features whose document frequency changed. The edges between
+    the other users are kept, and the similarities are computed by rows as in save_sparse_cosine_similarities,
+    so the patched edge list (ordered by source and target) is the same as the one computed from scratch.
+    Note that when the IDF is refitted (see update_tf_idf_model), new users change the number of documents, hence the IDF of all features:
+    with tolerance=0 all the users are recomputed. With the IDF of the previous model (the default of update_user_similarities), the vectors
+    of the users without new tweets do not change, and only the new users and the users with new tweets are recomputed.
+    :param user_index_path: (str) path to the updated user id table
+    :param dct_path: (str) path to the pickled updated gensim Dictionary
+    :param corpus_path: (str) path to the pickled updated BoW corpus
+    :param model_path: (str) path to the pickled updated gensim TfidfModel
+    :param X_old: (scipy.sparse.csr_matrix) the normalized user vectors before the update (see load_tfidf_matrix)
+    :param edge_path: (str) path of the edge list to patch (edge store directory, or csv file), which is overwritten
+        without the backbone scores: the significance scores must be computed again
+    :param chunksize: (int) number of users (rows) processed at once
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param min_weight: (float) minimum similarity of the recomputed edges to save
+    :param tolerance: (float) a user is recomputed when an entry of its normalized vector changed by more than tolerance.
+        With tolerance > 0 the similarities between users whose vectors changed less than tolerance are not updated.
+    :return: (str) edge_path
+    """
+    my_print("Loading data from pickles...")
+    ids = load_user_index(user_index_path)
+    X = load_tfidf_matrix(dct_path, corpus_path, model_path, norm=norm)
+    XT = X.T.tocsr()
+    n_old = X_old.shape[0]
+    X_old = sp.csr_matrix((X_old.data, X_old.indices, X_old.indptr), shape=(n_old, X.shape[1]))
+
+    changed = np.ones(X.shape[0], dtype=bool)
+    changed[:n_old] = abs(X[:n_old] - X_old).max(axis=1).toarray().ravel() > tolerance
+    affected = np.nonzero(changed)[0]
+    my_print("{0}/{1} users to recompute ({2} new users).".format(len(affected), len(ids), len(ids) - n_old))
+    if len(affected) == len(ids):
+        my_print("The vectors of all the users changed (more than tolerance={}): the update falls back to a full recompute.".format(tolerance))
+
+    my_print("Loading edge list from {}...".format(edge_path))
+    user_ids, columns = load_edge_list(edge_path, mmap_mode=None)
+    _, indices = intern_user_ids(ids, user_ids)
+    source = indices[columns["source"]]
+    target = indices[columns["target"]]
+    keep = ~(changed[source] | changed[target])
+    sources = [np.minimum(source, target)[keep]]
+    targets = [np.maximum(source, target)[keep]]
+    similarities = [np.asarray(columns["weight"], dtype=np.float32)[keep]]
+    kept = np.count_nonzero(keep)
+
+    # pairs (row, col) with row < col: rows of the changed users against all the users...
+    for start in range(0, len(affected), chunksize):
+        rows = affected[start:start + chunksize]
+        block = X[rows].dot(XT).tocsr()
+        block.sort_indices()
+        block = block.tocoo()
+        block_rows = rows[block.row]
+        block_keep = (block.col > block_rows) & (block.data > 0) & (block.data >= min_weight)
+        sources.append(block_rows[block_keep])
+        targets.append(block.col[block_keep])
+        similarities.append(block.data[block_keep])
+        my_print("{0}/{1} changed users processed.".format(min(start + chunksize, len(affected)), len(affected)))
+
+    # ...and rows of the unchanged users sharing features with the changed users, against the following changed users
+    XT_affected = X[affected].T.tocsr()
+    candidates = np.unique(XT[np.unique(X[affected].indices)].indices)
+    candidates = candidates[~changed[candidates]]
+    for start in range(0, len(candidates), chunksize):
+        rows = candidates[start:start + chunksize]
+        block = X[rows].dot(XT_affected).tocoo()
+        block_rows = rows[block.row]
+        block_cols = affected[block.col]
+        block_keep = (block_cols > block_rows) & (block.data > 0) & (block.data >= min_weight)
+        sources.append(block_rows[block_keep])
+        targets.append(block_cols[block_keep])
+        similarities.append(block.data[block_keep])
+
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    similarities = np.concatenate(similarities)
+    order = np.lexsort((targets, sources))
+    save_edge_list(edge_path, ids, [{"source": sources[order], "target": targets[order], "weight": similarities[order]}])
+
+    my_print("{0} edges saved ({1} kept, {2} recomputed).".format(len(order), kept, len(order) - kept))
+    return edge_path
+
+
+def posting_lists(X):
+    """
+    Build the inverted index of the user vectors: the posting list of a feature (e.g., a retweeted status) is the list of the users having it.
+    :param X: (scipy.sparse.csr_matrix) row-normalized user vectors, with sorted indices
+    :return: (XT, positions) the posting lists as the transpose of X (features x users, users sorted in each posting list),
+        and for each nonzero entry of X the position of the same entry in XT
+    """
+    XT = X.T.tocsr()
+    XT.sort_indices()
+    positions = np.empty(X.nnz, dtype=np.int64)
+    positions[np.argsort(X.indices, kind="stable")] = np.arange(X.nnz)
+    return XT, positions
+
+
+def posting_work_report(lengths, posting_cap=None, cap_policy="skip"):
+    """
+    Compute the work of the inverted index engine per posting list size bucket (1, 2-3, 4-7, ...).
+    A posting list of length L generates L * (L - 1) / 2 pair contributions.
+    :param lengths: (numpy.ndarray) the length of each posting list
+    :param posting_cap: (int) the cap of the posting lists (None for no cap)
+    :param cap_policy: (str) "skip" or "downweight" (see save_inverted_index_similarities)
+    :return: (pandas.DataFrame) a row per bucket (header: min_length, max_length, postings, entries, pairs, skipped_pairs)
+    """
+    lengths = lengths[lengths > 0].astype(np.int64)
+    buckets = np.floor(np.log2(lengths)).astype(int) if len(lengths) > 0 else np.empty(0, dtype=int)
+    pairs = lengths * (lengths - 1) // 2
+    skipped = pairs * ((posting_cap is not None) and (cap_policy == "skip")) * (lengths > (posting_cap or 0))
+    n = buckets.max() + 1 if len(buckets) > 0 else 0
+    return pd.DataFrame({"min_length": 2 ** np.arange(n), "max_length": 2 ** np.arange(1, n + 1) - 1,
+                         "postings": np.bincount(buckets, minlength=n), "entries": np.bincount(buckets, weights=lengths, minlength=n).astype(np.int64),
+                         "pairs": np.bincount(buckets, weights=pairs, minlength=n).astype(np.int64),
+                         "skipped_pairs": np.bincount(buckets, weights=skipped, minlength=n).astype(np.int64)})
+
+
+def inverted_index_block(X, XT, positions, start, stop, scale, min_weight=0., accumulator_size=1 << 24):
+    """
+    Compute the similarities between the users in rows [start, stop) and the following users, accumulating the products of the TF-IDF
+    weights only along the posting lists of the features of the users in the block.
+    The contributions are summed in a dense array accumulator (rows x users) when it has at most accumulator_size entries,
+    otherwise in a sorted (hash-like) accumulator of the touched pairs.
+    :param X: (scipy.sparse.csr_matrix) row-normalized user vectors
+    :param XT: (scipy.sparse.csr_matrix) the posting lists (see posting_lists)
+    :param positions: (numpy.ndarray) the position in XT of each entry of X (see posting_lists)
+    :param start: (int) first row of the block
+    :param stop: (int) last row of the block (excluded)
+    :param scale: (numpy.ndarray) weight of the contributions of each feature (0 skips its posting list)
+    :param min_weight: (float) minimum similarity of the pairs to keep
+    :param accumulator_size: (int) maximum size of the dense accumulator
+    :return: (rows, cols, similarities, work) arrays of the kept nonzero pairs with rows < cols, ordered by row and column,
+        and the number of accumulated contributions
+    """
+    lo, hi = X.indptr[start], X.indptr[stop]
+    features = X.indices[lo:hi]
+    rows = np.repeat(np.arange(start, stop), np.diff(X.indptr[start:stop + 1]))
+    values = X.data[lo:hi].astype(np.float64) * scale[features]
+    keep = values != 0
+    features, rows, values = features[keep], rows[keep], values[keep]
+    # the following users of each entry in the posting list of its feature
+    first = positions[lo:hi][keep] + 1
+    lengths = XT.indptr[features + 1] - first
+    entry = np.repeat(np.arange(len(first)), lengths)
+    following = np.arange(len(entry)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + first[entry]
+    cols = XT.indices[following]
+    contributions = values[entry] * XT.data[following]
+
+    keys = (rows[entry] - start).astype(np.int64) * X.shape[0] + cols
+    if (stop - start) * X.shape[0] <= accumulator_size:
+        sums = np.bincount(keys, weights=contributions, minlength=(stop - start) * X.shape[0])
+        keys = np.flatnonzero(sums)
+        sums = sums[keys]
+    else:
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=contributions, minlength=len(keys))
+    similarities = sums.astype(np.float32)
+    keep = (similarities > 0) & (similarities >= min_weight)
+    return keys[keep] // X.shape[0] + start, keys[keep] % X.shape[0], similarities[keep], len(contributions)
+
+
+def save_inverted_index_similarities(user_index_path, dct_path, corpus_path, model_path, output_path,
+                                     chunksize=256, norm='l2', min_weight=0., posting_cap=None, cap_policy="skip", report_path=None):
+    """
+    Compute the cosine similarities between users with an inverted index: each feature (retweeted status) is mapped to the posting list
+    of the users having it, and the products of the TF-IDF weights are accumulated only along the posting lists, so that
+    only the pairs of users sharing at least one feature are touched. Without posting_cap, it gives the edge list of save_sparse_cosine_similarities.
+    The posting lists longer than posting_cap (e.g., viral retweets) generate quadratically many pairs with small contributions:
+    they are skipped (cap_policy="skip") or their contributions are scaled by posting_cap / length (cap_policy="downweight").
+    :param user_index_path: (str) path to the user id table
+    :param dct_path: (str) path to the pickled gensim Dictionary
+    :param corpus_path: (str) path to the pickled BoW corpus
+    :param model_path: (str) path to the pickled gensim TfidfModel
+    :param output_path: (str) path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param chunksize: (int) number of users (rows) processed at once
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param min_weight: (float) minimum similarity of the edges to save
+    :param posting_cap: (int) maximum length of the posting lists processed with their full weight (None for no cap)
+    :param cap_policy: (str) "skip" or "downweight" the posting lists longer than posting_cap
+    :param report_path: (str) path of the csv with the work per posting list size bucket (see posting_work_report), None does not save it
+    :return: (str) output_path
+    """
+    if cap_policy not in ["skip", "downweight"]:
+        raise ValueError("Unknown cap_policy '{}'. Possible values: 'skip', 'downweight'.".format(cap_policy))
+    my_print("Loading data from pickles...")
+    ids = load_user_index(user_index_path)
+    X = load_tfidf_matrix(dct_path, corpus_path, model_path, norm=norm)
+
+    my_print("Building posting lists...")
+    XT, positions = posting_lists(X)
+    lengths = np.diff(XT.indptr)
+    scale = np.ones(X.shape[1], dtype=np.float64)
+    if posting_cap is not None:
+        capped = lengths > posting_cap
+        scale[capped] = 0. if cap_policy == "skip" else posting_cap / lengths[capped]
+        my_print("{0} posting lists longer than {1} ({2}).".format(np.count_nonzero(capped), posting_cap, cap_policy))
+
+    report = posting_work_report(lengths, posting_cap=posting_cap, cap_policy=cap_policy)
+    my_print("Work per posting list size:")
+    for row in report.itertuples():
+        my_print("  length {0}-{1}: {2} postings, {3} entries, {4} pairs ({5} skipped)".format(row.min_length, row.max_length, row.postings,
+                                                                                              row.entries, row.pairs, row.skipped_pairs))
+    if report_path is not None:
+        report.to_csv(report_path, index=False, header=True, quoting=csv.QUOTE_NONNUMERIC)
+
+    counts = {"edges": 0, "work": 0}
+
+    def blocks():
+        for start in range(0, X.shape[0], chunksize):
+            stop = min(start + chunksize, X.shape[0])
+            rows, cols, similarities, work = inverted_index_block(X, XT, positions, start, stop, scale, min_weight=min_weight)
+            counts["edges"] += len(rows)
+            counts["work"] += work
+            yield {"source": rows, "target": cols, "weight": similarities}
+            my_print("{0}/{1} user processed.".format(stop, len(ids)))
+
+    my_print("Save similarities:")
+    save_edge_list(output_path, ids, blocks())
+
+    my_print("{0} edges saved from {1} accumulated contributions (min_weight={2}, posting_cap={3}).".format(counts["edges"], counts["work"], min_weight, posting_cap))
+    return output_path
+
+
+def minhash_signatures(X, num_perm, seed=0):
+    """
+    Compute the MinHash signatures of the sets of features (e.g., retweeted statuses) of the users.
+    The permutations are approximated with the universal hash functions h(x) = (a*x + b) mod p, p = 2^31 - 1.
+    :param X: (scipy.sparse.csr_matrix) user vectors, only the nonzero features are considered
+    :param num_perm: (int) number of hash functions (signature length)
+    :param seed: (int) seed of the random hash functions
+    :return: (numpy.ndarray) uint32 array of shape (users, num_perm), users without features have all values equal to p
+    """
+    prime = np.uint64((1 << 31) - 1)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, prime, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, prime, size=num_perm, dtype=np.uint64)
+
+    features = X.indices.astype(np.uint64)
+    not_empty = np.diff(X.indptr) > 0
+    signatures = np.full((X.shape[0], num_perm), prime, dtype=np.uint32)
+    for p in range(num_perm):
+        hashes = (a[p] * features + b[p]) % prime
+        signatures[not_empty, p] = np.minimum.reduceat(hashes, X.indptr[:-1][not_empty])
+    return signatures
+
+
+def lsh_candidate_pairs(signatures, bands, rows):
+    """
+    Find the candidate pairs of similar users with banded Locality-Sensitive Hashing of the MinHash signatures:
+    two users are candidates if their signatures are identical in at least one band. The probability of being candidates is
+    1 - (1 - J^rows)^bands for two users with Jaccard similarity J, so more bands increase the recall and more rows increase the precision.
+    :param signatures: (numpy.ndarray) MinHash signatures of shape (users, bands * rows)
+    :param bands: (int) number of bands
+    :param rows: (int) number of rows (signature values) per band
+    :return: (sources, targets) arrays of the unique candidate pairs with sources < targets, ordered by source and target
+    """
+    n = signatures.shape[0]
+    users = np.nonzero(signatures[:, 0] < (1 << 31) - 1)[0]  # users without features are never candidates
+    candidates = []
+    for band in range(bands):
+        _, labels = np.unique(signatures[users, band * rows:(band + 1) * rows], axis=0, return_inverse=True)
+        labels = labels.ravel()
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        # users in the same bucket are contiguous in order: pair each user with the ones d positions ahead in the bucket
+        for d in range(1, len(order)):
+            same = np.nonzero(sorted_labels[d:] == sorted_labels[:-d])[0]
+            if len(same) == 0:
+                break
+            u = users[order[same]]
+            v = users[order[same + d]]
+            candidates.append(np.minimum(u, v).astype(np.int64) * n + np.maximum(u, v))
+    candidates = np.unique(np.concatenate(candidates)) if len(candidates) > 0 else np.empty(0, dtype=np.int64)
+    return candidates // n, candidates % n
+
+
+def save_lsh_cosine_similarities(user_index_path, dct_path, corpus_path, model_path, output_path,
+                                 chunksize=256, norm='l2', bands=32, rows=4, seed=0, min_weight=0., top_k_per_user=None):
+    """
+    Approximate version of save_sparse_cosine_similarities for large datasets. The candidate pairs of users are generated
+    with MinHash-LSH on the users' retweet sets, and the exact cosine similarity is computed only for the candidates.
+    The edge list is a subset of the exact one, with the same weights: pairs with low retweet overlap are likely
+    to be missed, while users with a high overlap (the coordinated ones) are found with high probability.
+    :param user_index_path: (str) path to the user id table
+    :param dct_path: (str) path to the pickled gensim Dictionary
+    :param corpus_path: (str) path to the pickled BoW corpus
+    :param model_path: (str) path to the pickled gensim TfidfModel
+    :param output_path: (str) path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param chunksize: (int) number of users (sources) processed at once
+    :param norm: (str) row normalization, 'l2' (cosine similarity) or 'l1'
+    :param bands: (int) number of LSH bands, more bands increase the recall
+    :param rows: (int) number of signature values per band, more rows reduce the candidates
+    :param seed: (int) seed of the MinHash functions
+    :param min_weight: (float) minimum similarity of the edges to save
+    :param top_k_per_user: (int) if not None, an edge is saved only if it is one of the top_k_per_user strongest
+        candidate edges (ties included) of at least one of its users
+    :return: (str) output_path
+    """
+    check_top_k(top_k_per_user)
+    my_print("Loading data from pickles...")
+    ids = load_user_index(user_index_path)
+    X = load_tfidf_matrix(dct_path, corpus_path, model_path, norm=norm)
+
+    my_print("Computing MinHash signatures ({0} bands x {1} rows)...".format(bands, rows))
+    signatures = minhash_signatures(X, bands * rows, seed=seed)
+    my_print("Generating LSH candidate pairs...")
+    sources, targets = lsh_candidate_pairs(signatures, bands, rows)
+    del signatures
+    my_print("{} candidate pairs found.".format(len(sources)))
+
+    my_print("Computing the similarities of the candidate pairs...")
+    bounds = np.searchsorted(sources, np.arange(0, X.shape[0] + chunksize, chunksize))
+    similarities = np.concatenate([np.asarray(X[sources[bounds[i]:bounds[i + 1]]].multiply(X[targets[bounds[i]:bounds[i + 1]]]).sum(axis=1),
+                                              dtype=np.float32).ravel()
+                                   for i in range(len(bounds) - 1)] + [np.empty(0, dtype=np.float32)])
+    positive = similarities > 0
+    keep = positive & (similarities >= min_weight)
+    if top_k_per_user is not None:
+        thresholds = top_k_thresholds(np.concatenate([sources[keep], targets[keep]]),
+                                      np.concatenate([similarities[keep], similarities[keep]]), X.shape[0], top_k_per_user)
+        keep &= (similarities >= thresholds[sources]) | (similarities >= thresholds[targets])
+    pruned = np.count_nonzero(positive) - np.count_nonzero(keep)
+
+    my_print("Save similarities:")
+    keep = np.nonzero(keep)[0]
+    save_edge_list(output_path, ids, [{"source": sources[keep], "target": targets[keep], "weight": similarities[keep]}])
+
+    my_print("{0} edges saved from {1} candidate pairs, {2} edges pruned (min_weight={3}, top_k_per_user={4}).".format(len(keep), len(sources), pruned, min_weight, top_k_per_user))
     return output_path
 
 
+def temporal_coretweet_pairs(users, retweets, timestamps, delta_t):
+    """
+    Find the pairs of users retweeting the same status within delta_t seconds, with a sweep over the retweets of each status sorted by time.
+    The events must be sorted by status and timestamp: the sweep compares each event with the following ones at increasing offsets,
+    and an event stops being compared as soon as the next event is of another status or more than delta_t seconds later,
+    so the cost scales with the number of near-simultaneous retweets instead of all the pairs of retweets of a status.
+    :param users: (numpy.ndarray) user index of each event
+    :param retweets: (numpy.ndarray) retweeted status index of each event
+    :param timestamps: (numpy.ndarray) timestamp of each event
+    :param delta_t: (float) maximum time between two retweets of the same status, in seconds
+    :return: (sources, targets, statuses) arrays of the distinct (user, user, status) co-retweets, with sources < targets
+    """
+    sources = []
+    targets = []
+    statuses = []
+    active = np.arange(len(users) - 1)
+    offset = 1
+    while len(active) > 0:
+        following = active + offset
+        near = (retweets[following] == retweets[active]) & (timestamps[following] - timestamps[active] <= delta_t)
+        active = active[near]
+        following = following[near]
+        distinct = users[active] != users[following]
+        sources.append(np.minimum(users[active], users[following])[distinct])
+        targets.append(np.maximum(users[active], users[following])[distinct])
+        statuses.append(retweets[active][distinct])
+        offset += 1
+        active = active[active + offset < len(users)]
 
+    sources = np.concatenate(sources + [np.empty(0, dtype=users.dtype)])
+    targets = np.concatenate(targets + [np.empty(0, dtype=users.dtype)])
+    statuses = np.concatenate(statuses + [np.empty(0, dtype=retweets.dtype)])
+    order = np.lexsort((statuses, targets, sources))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (np.diff(sources[order]) != 0) | (np.diff(targets[order]) != 0) | (np.diff(statuses[order]) != 0)
+    order = order[first]
+    return sources[order], targets[order], statuses[order]
 
 
+def save_temporal_coretweet_similarities(index_dir, output_path, delta_t=60., blocksize=1 << 20, min_weight=0.):
+    """
+    Compute the temporal co-retweet similarity between users: the weight of an edge is the number of statuses retweeted by both users
+    within delta_t seconds of each other. The events are processed in blocks of statuses, each one swept with temporal_coretweet_pairs.
+    :param index_dir: (str) the directory of the event index of the users (see include/event_index.py)
+    :param output_path: (str) path of the output edge list (edge store directory, or csv file with header: source, target, weight)
+    :param delta_t: (float) maximum time between two retweets of the same status, in seconds
+    :param blocksize: (int) approximate number of events processed at once (the blocks contain whole statuses)
+    :param min_weight: (float) minimum number of co-retweets of the edges to save
+    :return: (str) output_path
+    """
+    my_print("Loading event index from {}...".format(index_dir))
+    ids, _, events = load_event_index(index_dir)
+    order = np.lexsort((events["timestamp"], events["retweet"]))
+    users = np.asarray(events["user"])[order].astype(np.int64)
+    retweets = np.asarray(events["retweet"])[order]
+    timestamps = np.asarray(events["timestamp"])[order]
 
+    # blocks end at the first event of a status, so that the retweets of a status are in the same block
+    status_starts = np.flatnonzero(np.r_[True, retweets[1:] != retweets[:-1]])
+    cuts = np.unique(np.r_[status_starts[np.searchsorted(status_starts, np.arange(0, len(users), blocksize))], len(users)])
 
+    pairs = []
+    counts = []
+    for start, stop in zip(cuts[:-1], cuts[1:]):
+        sources, targets, _ = temporal_coretweet_pairs(users[start:stop], retweets[start:stop], timestamps[start:stop], delta_t)
+        block_pairs, block_counts = np.unique(sources * len(ids) + targets, return_counts=True)
+        pairs.append(block_pairs)
+        counts.append(block_counts)
+        my_print("{0}/{1} retweets processed.".format(stop, len(users)))
 
+    pairs, inverse = np.unique(np.concatenate(pairs + [np.empty(0, dtype=np.int64)]), return_inverse=True)
+    weights = np.bincount(inverse, weights=np.concatenate(counts + [np.empty(0, dtype=np.int64)]), minlength=len(pairs))
+    keep = weights >= min_weight
 
+    my_print("Save similarities:")
+    save_edge_list(output_path, ids, [{"source": pairs[keep] // len(ids), "target": pairs[keep] % len(ids), "weight": weights[keep]}])
 
+    my_print("{0} edges saved, {1} edges pruned (delta_t={2}, min_weight={3}).".format(np.count_nonzero(keep), len(keep) - np.count_nonzero(keep), delta_t, min_weight))
+    return output_path
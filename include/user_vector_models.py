@@ -1,5 +1,24 @@
 from gensim.corpora import Dictionary
 from gensim.models import TfidfModel
+from collections import Counter
+import itertools
+
+# user vector models: sequence field of the parsed sequences, and whether it is a list of lists (one per tweet) to flatten
+MODALITIES = {"RT": ("retweeted_status_ids", False),
+              "hashtags": ("hashtags", True),
+              "mentions": ("mentions", True),
+              "urls": ("urls", True)}
+
+
+def user_document(user, modality):
+    """
+    Extract the document of a user vector model from a parsed user sequence.
+    :param user: (dict) the parsed user sequence
+    :param modality: (str) the user vector model, one of MODALITIES
+    :return: (list) the tokens of the document
+    """
+    field, nested = MODALITIES[modality]
+    return list(itertools.chain.from_iterable(user[field])) if nested else list(user[field])
 
 def compute_tf_idf_model(documents):
     """
@@ -14,6 +33,48 @@ def compute_tf_idf_model(documents):
     return dct, corpus, model
 
 
+def update_tf_idf_model(dct, corpus, documents, model=None):
+    """
+    Extend a fitted dictionary and BoW corpus with new documents and with the new tokens of existing documents,
+    then update the TF-IDF model from the document frequencies of the dictionary, without a pass over the corpus.
+    The ids of the existing tokens do not change, so the new vectors can be compared with the previous ones.
+    :param dct: (gensim.corpora.Dictionary) the dictionary, updated in place
+    :param corpus: (list) the BoW corpus, updated in place
+    :param documents: (dict) document index -> list of new tokens. Indices greater than or equal to len(corpus) are new documents,
+        appended in order of index
+    :param model: (gensim.models.TfidfModel) the previous TF-IDF model, updated in place: the IDF of the tokens it knows is frozen,
+        and only the new tokens get an IDF, from the updated document frequencies. So the vectors of the documents without new tokens
+        do not change. None refits the model on all the document frequencies (the IDF of all the tokens changes with the number of documents)
+    :return: (dct, corpus, model) the updated dictionary and corpus, and the updated (or refitted) TfidfModel
+    """
+    for index in sorted(documents):
+        tokens = documents[index]
+        if index >= len(corpus):
+            # new documents, with the same statistics of Dictionary.add_documents
+            corpus.extend([] for _ in range(index - len(corpus)))
+            corpus.append(dct.doc2bow(tokens, allow_update=True))
+            continue
 
+        counter = Counter(tokens)
+        for token in sorted(token for token in counter if token not in dct.token2id):
+            dct.token2id[token] = len(dct.token2id)
+        bow = dict(corpus[index])
+        for token, count in counter.items():
+            token_id = dct.token2id[token]
+            dct.cfs[token_id] = dct.cfs.get(token_id, 0) + count
+            if token_id not in bow:
+                dct.dfs[token_id] = dct.dfs.get(token_id, 0) + 1
+                dct.num_nnz += 1
+            bow[token_id] = bow.get(token_id, 0) + count
+        dct.num_pos += len(tokens)
+        corpus[index] = sorted(bow.items())
+    dct.id2token = {}  # rebuilt lazily by gensim
 
+    if model is None:
+        model = TfidfModel(dictionary=dct)
+        model.id2word = None
+    else:
+        for token_id in dct.dfs.keys() - model.idfs.keys():
+            model.idfs[token_id] = model.wglobal(dct.dfs[token_id], dct.num_docs)
 
+    return dct, corpus, model
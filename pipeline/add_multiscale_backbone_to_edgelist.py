@@ -1,9 +1,10 @@
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-from include.backbone import disparity_filter
-import networkx as nx
-import csv
+from include.backbone import disparity_filter_arrays, disparity_filter_edge_order
+from include.edge_store import load_edge_list, save_edge_list
+from include.user_index import intern_user_ids
 from include.lib import my_print
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -14,33 +15,36 @@ def add_multiscale_backbone_to_edgelist(node_csv_path, edge_csv_path):
 
         :param node_csv_path: the path of the csv containing the nodes (header: user_id)
             - (e.g., "output/example_output/network_raw/similarity_node_list.csv")
-        :param edge_csv_path: the path of the csv containing the edges (header: target, source, weight)
-            - (e.g., "output/example_output/network_raw/similarity_edge_list.csv")
-        :return: updates the csv of the edges with with a significance score (alpha) assigned to each edge (new header: target, source, weight, alpha) and returns the path of csv
-            - (e.g., "output/example_output/network_raw/similarity_edge_list.csv")
+        :param edge_csv_path: the path of the edge store (or csv) containing the edges (header: target, source, weight)
+            - (e.g., "output/example_output/network_raw/similarity_edge_list/" or "output/example_output/network_raw/similarity_edge_list.csv")
+        :return: updates the edge list with a significance score (alpha) assigned to each edge (new header: target, source, weight, alpha) and returns its path
+            - (e.g., "output/example_output/network_raw/similarity_edge_list/" or "output/example_output/network_raw/similarity_edge_list.csv")
     """
-    my_print("Loading graph...")
+    my_print("Loading edge list...")
 
     df_node = pd.read_csv(node_csv_path,  dtype={"user_id": str})
-    list_node = df_node['user_id'].tolist()
-    df_edge = pd.read_csv(edge_csv_path,  dtype={"source": str,"target": str})
-    df_edge = df_edge.set_index(['source', 'target'])
-    dict_edge = df_edge.to_dict('index')
-    dict_edge = [(s, t, attr) for (s, t), attr in dict_edge.items()]
-
-    G = nx.Graph()
-    G.add_nodes_from(list_node)
-    G.add_edges_from(dict_edge)
+    user_ids, columns = load_edge_list(edge_csv_path)
+    user_ids, node_indices = intern_user_ids(user_ids, df_node['user_id'])
+    # the backbone is computed on the nodes ranked in the order in which they would be added to a networkx graph (node list first, then edge endpoints),
+    # while the saved edges keep the indices of the user id table
+    nodes = pd.unique(np.concatenate([node_indices, np.arange(len(user_ids), dtype=np.int32)]))
+    rank = np.empty(len(user_ids), dtype=np.int64)
+    rank[nodes] = np.arange(len(nodes))
+    source = np.asarray(columns["source"])
+    target = np.asarray(columns["target"])
+    weight = np.asarray(columns["weight"])
 
     my_print("Applying multiscale backbone analysis...")
-    G = disparity_filter(G)
+    alpha = disparity_filter_arrays(rank[source], rank[target], weight, n_nodes=len(nodes))
+    order, swap = disparity_filter_edge_order(rank[source], rank[target], n_nodes=len(nodes))
 
     my_print(f"Saving results to {edge_csv_path}...")
-    with open(edge_csv_path, "w") as handle:
-        writer = csv.writer(handle, quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
-        writer.writerow(["source","target","weight","alpha"])
-        for source, target, data in G.edges(data=True):
-            writer.writerow([source.replace('"', ''), target.replace('"', ''), data["weight"], data["alpha"]])
+    save_edge_list(edge_csv_path, np.char.replace(user_ids, '"', ''), [{
+        "source": np.where(swap, target[order], source[order]),
+        "target": np.where(swap, source[order], target[order]),
+        "weight": weight[order],
+        "alpha": alpha[order]
+    }])
 
     my_print("Finished!")
     my_print(f"Saved user similarity edge list with bacbone info in {edge_csv_path}")
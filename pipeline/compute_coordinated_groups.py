@@ -7,19 +7,22 @@ import csv
 from pathlib import Path
 
 
-def compute_coordinated_groups(node_csv_path, edge_csv_path, seed_mod_path, outdir_communities, louvain_resolution, min_cardinality, quantile_start=0, quantile_stop=1, quantile_steps=101):
+def compute_coordinated_groups(node_csv_path, edge_csv_path, seed_mod_path, outdir_communities, louvain_resolution, min_cardinality, quantile_start=0, quantile_stop=1, quantile_steps=101,
+                               sweep="fixed", refine_tolerance=0.01, min_quantile_gap=0.0025, backend="python-louvain", check_parity=False,
+                               workers=1, stats_mode="batch", stats_workers=1, seed_mod=None):
     """ Here, we apply our coordination-aware community detection.
         In particular, we start from the communities extracted as seed, and then apply increansingly restrictive threshold to isolate nodes that survive, which correspond to users that are increasingly more coordinated.
         The moving threshold corresponds to the quantile of the edges weight, in order to adapt the computation to dense graphs as well as to sparse graphs.
 
         :param node_csv_path: the path of the csv with the nodes
             - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_node_list.csv")
-        :param edge_csv_path: the path of the csv with the edges
-            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
+        :param edge_csv_path: the path of the edge store (or csv) with the edges
+            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list/" or "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
         :param seed_mod_path: the path of a json file with the seed communities
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/seed_communities.json")
         :param outdir_communities: the path of the directory
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/") where a new subdirectory named f"coordinated_communities_quantile({quantile_start},{quantile_stop},{quantile_steps})_mincardinality{min_cardinality}/" to save the output results
+              (with the adaptive or segmented sweep and with a backend other than "python-louvain" before "_mincardinality", e.g. f"coordinated_communities_quantile(0,1,101)_csr_mincardinality2/")
         :param louvain_resolution: the resolution parameter of the louvain algorithm. Must be the same used for computing the seed communities
             -  (e.g., 1)
         :param min_cardinality: minimum size of communities to consider
@@ -30,6 +33,37 @@ def compute_coordinated_groups(node_csv_path, edge_csv_path, seed_mod_path, outd
             - (default=0)
         :param quantile_steps: Total steps of threshold.
             - (default=101 - corresponding to a single threshold step of 0.01 quantile)
+        :param sweep: how the thresholds are chosen:
+            - "fixed": the quantile_steps quantiles evenly spaced between quantile_start and quantile_stop
+            - "adaptive": the quantile_steps quantiles are a coarse grid, refined with the midpoint of two consecutive quantiles wherever the group memberships
+              changed by more than refine_tolerance between them, until the gap between the quantiles would be smaller than min_quantile_gap.
+              The output has the same format on the irregular grid of quantiles (e.g., quantile_steps=11 computes the partitions only where the groups change)
+            - "segmented": approximate parallel version of the "fixed" sweep. The quantiles are split in a segment per worker, each segment is warm-started from
+              a checkpoint of a coarse sequential pass and the segments are swept concurrently. The partitions generally differ from the "fixed" sweep, since the louvain
+              partitions depend on the warm start (including its label values and order): the fraction of the nodes whose group at the first quantile of each segment
+              differs from the continuation of the previous segment is saved in "sweep_segments.csv"
+            - (default="fixed")
+        :param refine_tolerance: maximum fraction of the nodes changing group between consecutive quantiles of the "adaptive" sweep
+            - (default=0.01)
+        :param min_quantile_gap: minimum gap between consecutive quantiles of the "adaptive" sweep
+            - (default=0.0025)
+        :param backend: the community detection backend of the partitions, "python-louvain", "csr" or "leiden" (see compute_seed_communities)
+            - (default="python-louvain")
+        :param check_parity: if True, each partition is compared with the python-louvain partition of the same network: the number of communities,
+                             the normalized mutual information of the two partitions and their modularity are logged
+            - (default=False)
+        :param workers: number of processes (and segments) of the "segmented" sweep, ignored by the other sweeps
+            - (default=1)
+        :param stats_mode: how the network metrics of the groups are computed at each threshold, "batch" (from scratch) or "incremental"
+                           (the triangles, degrees and strengths of the nodes are maintained across the thresholds, updating only the edges that leave or join the groups,
+                           see include/coord_group_stats.py)
+            - (default="batch")
+        :param stats_workers: number of processes of the network metrics. The thresholds are split in a shard per process, and the rows are merged in the order
+                              of the thresholds. It does not change the partitions (unlike workers)
+            - (default=1)
+        :param seed_mod: the seed communities already in memory (dict community -> user ids, as in seed_mod_path), used instead of loading seed_mod_path
+                         (e.g., returned by compute_seed_communities with return_seed=True when both stages run in the same process)
+            - (default=None)
         :return:
             - output_coordinated_groups_path: the path of the jsonl with the coordinated groups and their evolution at each threshold
                 - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/coordinated_communities_quantile(0,1,101)_mincardinality2/coordinated_groups.jsonl")
@@ -40,7 +74,9 @@ def compute_coordinated_groups(node_csv_path, edge_csv_path, seed_mod_path, outd
 
     """
 
-    outdir_coordination_aware = outdir_communities / Path(f"coordinated_communities_quantile({quantile_start},{quantile_stop},{quantile_steps})_mincardinality{min_cardinality}/")
+    sweep_name = {"adaptive": f"_adaptive({refine_tolerance},{min_quantile_gap})", "segmented": f"_segmented({workers})"}.get(sweep, "")
+    backend_name = f"_{backend}" if backend != "python-louvain" else ""
+    outdir_coordination_aware = outdir_communities / Path(f"coordinated_communities_quantile({quantile_start},{quantile_stop},{quantile_steps}){sweep_name}{backend_name}_mincardinality{min_cardinality}/")
     Path(outdir_coordination_aware).mkdir(parents = True, exist_ok = True)
     output_partitions_path = outdir_coordination_aware / Path("louvain_partitions.jsonl")
     output_coordinated_groups_path = outdir_coordination_aware / Path("coordinated_groups.jsonl")
@@ -51,15 +87,25 @@ def compute_coordinated_groups(node_csv_path, edge_csv_path, seed_mod_path, outd
                                                          quantile_start=quantile_start,
                                                          quantile_stop=quantile_stop,
                                                          quantile_steps=quantile_steps,
-                                                         seed_mod_path=seed_mod_path)
+                                                         seed_mod_path=seed_mod_path,
+                                                         sweep=sweep,
+                                                         refine_tolerance=refine_tolerance,
+                                                         min_quantile_gap=min_quantile_gap,
+                                                         backend=backend,
+                                                         check_parity=check_parity,
+                                                         workers=workers,
+                                                         report_path=outdir_coordination_aware / Path("sweep_segments.csv") if sweep == "segmented" else None,
+                                                         seed_mod=seed_mod)
 
     my_print("Tracking coordinated groups...")
     output_coordinated_groups_path = track_coordinated_groups(output_partitions_path, output_coordinated_groups_path, min_cardinality)
 
     my_print(f"Computing network metrics...")
-    df_stats = cb_network_stats(node_csv_path, edge_csv_path, output_coordinated_groups_path)
+    df_stats = cb_network_stats(node_csv_path, edge_csv_path, output_coordinated_groups_path, mode=stats_mode, workers=stats_workers)
 
-    df_stats.to_csv(output_coordinated_groups_stats_csv_path, index = False, header = True, quoting = csv.QUOTE_NONNUMERIC)
+    # the quantiles are exact in the stats (they are the x-axis of the coordination integral of compute_size_vs_coordination):
+    # the rounding only drops the floating point noise of the grid (e.g., 0.07000000000000001)
+    df_stats.assign(quantile=df_stats["quantile"].round(12)).to_csv(output_coordinated_groups_stats_csv_path, index = False, header = True, quoting = csv.QUOTE_NONNUMERIC)
     my_print(f"Saved coordinated groups with network metrics and statistics in csv {output_coordinated_groups_stats_csv_path}")
 
     my_print(f"Saved partitions in {output_partitions_path}")
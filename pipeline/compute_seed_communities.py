@@ -3,33 +3,51 @@ sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.par
 from include.lib import my_print, compute_seed_comm, parse_seed_comm
 from pathlib import Path
 
-def compute_seed_communities(node_csv_path, edge_csv_path, louvain_resolution, outdir_backbone):
+def compute_seed_communities(node_csv_path, edge_csv_path, louvain_resolution, outdir_backbone, backend="python-louvain", check_parity=False, return_seed=False):
     """
     Computes the communities of the network backbone. This communities will be used as seed for the coordination-aware community detection.
 
     :param node_csv_path: the path of the csv with the nodes
         - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_node_list.csv")
-    :param edge_csv_path: the path of the csv with the edges
-        - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
+    :param edge_csv_path: the path of the edge store (or csv) with the edges
+        - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list/" or "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
     :param louvain_resolution: the resolution parameter of the louvain algorithm
         - (e.g., 1)
     :param outdir_backbone: the path of the directory
         - (e.g., "output/example_output/network_backbone_alpha0.15/") where a new subdirectory named f"louvain_communities_res{louvain_resolution}/" will be created to save the output
+          (f"louvain_communities_res{louvain_resolution}_{backend}/" with a backend other than "python-louvain")
+    :param backend: the community detection backend:
+        - "python-louvain": louvain algorithm of the python-louvain package on the networkx graph
+        - "csr": louvain algorithm on the sparse (CSR) adjacency matrix, with the moves of batches of nodes computed at once (faster on large networks, see include/community_detection.py)
+        - "leiden": leiden algorithm of the leidenalg package (requires leidenalg and igraph). Unlike the other backends, it also stops on the modularity
+          with the resolution on the null model term, so its communities differ from the python-louvain ones when louvain_resolution is not 1
+        - (default="python-louvain")
+    :param check_parity: if True, the communities are compared with the python-louvain communities: the number of communities,
+                         the normalized mutual information of the two partitions and their modularity are logged
+        - (default=False)
+    :param return_seed: if True, the seed communities are also returned (dict community -> user ids), to pass them in memory to compute_coordinated_groups (seed_mod)
+        - (default=False)
     :return:
         - output_node_csv_path: the path of the csv with nodes and their corresponding community computed with the input louvain_resolution (csv header: "user_id", "modularity_def")
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/filtered_similarity_node_list_communities.csv")
         - output_seed_path: the path of a json file where the keys are the communities and the values are the user ids belonging to the community
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/seed_communities.json")
+        - outdir_communities: the path of the new subdirectory with the output
+            - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/")
+        - seed_mod: the seed communities, only with return_seed=True
     """
-    outdir_communities = outdir_backbone / Path(f"louvain_communities_res{louvain_resolution}/")
+    backend_name = f"_{backend}" if backend != "python-louvain" else ""
+    outdir_communities = outdir_backbone / Path(f"louvain_communities_res{louvain_resolution}{backend_name}/")
     Path(outdir_communities).mkdir(parents = True, exist_ok = True)
     output_node_csv_path = outdir_communities / Path("filtered_similarity_node_list_communities.csv")
     output_seed_path = outdir_communities / Path("seed_communities.json")
 
-    output_node_csv_path = compute_seed_comm(node_csv_path, edge_csv_path, louvain_resolution, output_node_csv_path)
+    output_node_csv_path = compute_seed_comm(node_csv_path, edge_csv_path, louvain_resolution, output_node_csv_path, backend=backend, check_parity=check_parity)
 
-    output_seed_path = parse_seed_comm(output_node_csv_path, output_seed_path)
+    output_seed_path, seed_mod = parse_seed_comm(output_node_csv_path, output_seed_path, return_seed=True)
 
+    if return_seed:
+        return output_node_csv_path, output_seed_path, outdir_communities, seed_mod
     return output_node_csv_path, output_seed_path, outdir_communities
 
 
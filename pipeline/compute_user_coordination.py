@@ -2,6 +2,7 @@ import sys, os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 import jsonlines
 import pandas as pd
+import numpy as np
 import itertools
 from include.lib import my_print
 import csv
@@ -32,25 +33,33 @@ def compute_user_coordination(coordinated_groups_path, node_csv_path, outdir_coo
 
     my_print(f"Loading user dataframe from {node_csv_path}...")
     user_df = pd.read_csv(node_csv_path, dtype={"user_id": str})[["user_id", "modularity_def"]]
-    user_df["quantile"] = None
-    user_df["threshold"] = None
-    user_df["coordinated_group"] = None
+    # users are interned once: the coordination of each user is kept in arrays indexed by user
+    user_codes, user_index = pd.factorize(user_df["user_id"])
+    user_index = pd.Index(user_index)
+    last_rows = np.full(len(user_index), -1, dtype=np.int64)
+    last_groups = np.full(len(user_index), -1, dtype=np.int64)
+    quantiles = []
+    thresholds = []
     my_print(f"Processing coordinated groups from {coordinated_groups_path}...")
     with jsonlines.open(coordinated_groups_path, mode="r") as handle:
-        assigned_groups = []
-        for row in handle:
-            quantile = row["quantile"]
-            threshold = row["threshold"]
-            group_to_assign = sorted(list(set(row["coordinated_groups"].keys()).difference(assigned_groups)))
-            for group in group_to_assign:
-                user_df.loc[user_df["user_id"].isin(row["coordinated_groups"][group]), "coordinated_group"] = int(group)
-
-
-
-            ids = list(itertools.chain.from_iterable(row["coordinated_groups"].values()))
-            user_df.loc[user_df["user_id"].isin(ids), "quantile"] = quantile
-            user_df.loc[user_df["user_id"].isin(ids), "threshold"] = threshold
+        for i, row in enumerate(handle):
+            quantiles.append(row["quantile"])
+            thresholds.append(row["threshold"])
+            groups = sorted(row["coordinated_groups"].keys())
+            ids = list(itertools.chain.from_iterable(row["coordinated_groups"][group] for group in groups))
+            codes = user_index.get_indexer(ids)
+            labels = np.repeat([int(group) for group in groups], [len(row["coordinated_groups"][group]) for group in groups]).astype(np.int64)
+            # the users of the groups survive at this quantile (the last group in label order wins, as the groups are assigned in order)
+            last_rows[codes[codes >= 0]] = i
+            last_groups[codes[codes >= 0]] = labels[codes >= 0]
 
+    # the users that never survive (row -1) get None, as the last value of the object arrays
+    rows = last_rows[user_codes]
+    user_df["quantile"] = np.array(quantiles + [None], dtype=object)[rows]
+    user_df["threshold"] = np.array(thresholds + [None], dtype=object)[rows]
+    coordinated_groups = np.array(last_groups[user_codes].tolist(), dtype=object)
+    coordinated_groups[rows < 0] = None
+    user_df["coordinated_group"] = coordinated_groups
 
     user_df.to_csv(output_path, index=False, header=True, quoting = csv.QUOTE_NONNUMERIC)
     my_print(f"User coordination info saved to {output_path}")
@@ -1,15 +1,16 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), os.path.pardir)))
-from include.user_vector_models import compute_tf_idf_model
+from include.user_vector_models import MODALITIES, compute_tf_idf_model, user_document
 from include.lib import *
+from include.user_index import USER_INDEX, save_user_index
 import jsonlines
 from pathlib import Path
 import csv
 
 
-def compute_user_vector_models(userseq_json_path, outdir):
+def compute_user_vector_models(userseq_json_path, outdir, modalities = ("RT", "hashtags")):
     """
-        Computes user vector models for retweets and hashtags using gensim
+        Computes user vector models for retweets, hashtags, mentions and urls using gensim, with a single pass over the user sequences
 
         :param userseq_json_path: jsonl file where every line is a json corresponding to a user.
                                   Each json contains:
@@ -30,57 +31,47 @@ def compute_user_vector_models(userseq_json_path, outdir):
                                             "mentions": [["user222"],["user222","user333"]],
                                             "urls": [["http://vote.com",[]]
             - (e.g., input_data/input_superspreaders_seqs.jsonl)
-        :param outdir: the path of the output directory (e.g., "output/example_output/") where new subdirectories will be crated ("tfidf_models/", "tfidf_models/RT/", "tfidf_models/hashtags/") to save and store the user vector models pickles
+        :param outdir: the path of the output directory (e.g., "output/example_output/") where new subdirectories will be crated ("tfidf_models/", and "tfidf_models/RT/", "tfidf_models/hashtags/", "tfidf_models/mentions/", "tfidf_models/urls/" for each model) to save and store the user id table ("tfidf_models/user_index.npy") and the user vector models pickles
             - (e.g., "output/example_output/")
-        :return: the path of the directory containing the saved pickles with information about the Dictionary, Corpora and TfidfModel for hashtags and retweets
+        :param modalities: the user vector models to compute, among "RT" (retweeted status ids), "hashtags", "mentions" and "urls".
+                           The default computes the models used by the following stages: the retweets for the similarity network and the hashtags
+                           for the metadata and the hashtag clouds of the communities. The "mentions" and "urls" models are used only by the
+                           "multimodal" model of save_user_similarities
+            - (default=("RT", "hashtags"))
+        :return: the path of the directory containing the saved pickles with information about the Dictionary, Corpora and TfidfModel of each model
             - (e.g., "output/example_output/tfidf_models/")
        """
 
     Path(outdir).mkdir(parents = True, exist_ok = True)  # create output directory
     outdir_tfidf = outdir / Path("tfidf_models/")
-    outdir_rt = outdir_tfidf / Path("RT/")
-    outdir_hashtag = outdir_tfidf / Path("hashtags/")
-
     Path(outdir_tfidf).mkdir(parents = True, exist_ok = True)
-    Path(outdir_rt).mkdir(parents=True, exist_ok=True)
-    Path(outdir_hashtag).mkdir(parents=True, exist_ok=True)
-
-    ids_path = outdir_tfidf / Path("ids.pickle")
-    dct_path_rt = outdir_rt / Path("dct.pickle")
-    corpus_path_rt = outdir_rt / Path("corpus.pickle")
-    model_path_rt = outdir_rt / Path("model.pickle")
-    dct_path_hashtags = outdir_hashtag / Path("dct.pickle")
-    corpus_path_hashtags = outdir_hashtag / Path("corpus.pickle")
-    model_path_hashtags = outdir_hashtag / Path("model.pickle")
+    user_index_path = outdir_tfidf / Path(USER_INDEX)
 
     user_ids = []
-    user_rts = []
-    user_hashtags = []
+    user_documents = {modality: [] for modality in modalities}
 
     my_print("Loading user sequences and saving nodes to CSV...")
 
+    # a single pass over the sequences collects the documents of all the user vector models
     with jsonlines.open(userseq_json_path, mode="r") as handle:
         for user in handle:
             user_ids.append(user["user_id"])
-            user_rts.append(user["retweeted_status_ids"])
-            user_hashtags.append(list(flatten_iterable(user["hashtags"])))
-
-    my_print("Saving user ids to pickle...")
-    save_pickle(user_ids, ids_path)  # e.g., ['1266801030643232768', '120157829']
-
-    my_print("Computing user RT TF-IDF model...")
-    dct, corpus, model = compute_tf_idf_model(user_rts)
-    my_print("Saving user RT TF-IDF model to pickle...")
-    save_pickle(dct, dct_path_rt)  # e.g., unique retweet ids - Dictionary(8 unique tokens: ['1312702345642496000', '1313285277276921859', '1313435619587231744', '1314190484705808386', '1315083733851148291']...)
-    save_pickle(corpus, corpus_path_rt)  # e.g., [[(0, 1), (1, 1), (2, 1), (3, 1), (4, 1)], [(5, 1), (6, 1), (7, 1)]]
-    save_pickle(model, model_path_rt)  # e.g., TfidfModel(num_docs=1, num_nnz=8)
-
-    my_print("Computing user hashtag TF-IDF model...")
-    dct, corpus, model = compute_tf_idf_model(user_hashtags)
-    my_print("Saving user hashtag TF-IDF model to pickle...")
-    save_pickle(dct, dct_path_hashtags)  # e.g., Dictionary(10 unique tokens: ['covid', 'eo', 'kag', 'prayer', 'prayformelania', 'prayfortrump', 'trump', 'election2020', 'remate', 'usa20unam'])
-    save_pickle(corpus, corpus_path_hashtags)  # e.g., [[(0, 1), (1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1)], [(7, 3), (8, 2), (9, 3)]] # e.g., user at index 1, uses hashtag at index 7 (election2020) three times
-    save_pickle(model, model_path_hashtags)  # e.g., TfidfModel(num_docs=1, num_nnz=10)
+            for modality in modalities:
+                user_documents[modality].append(user_document(user, modality))
+
+    my_print("Saving user id table...")
+    save_user_index(user_ids, user_index_path)  # e.g., ['1266801030643232768', '120157829'], user i is the i-th document of the corpora
+
+    for modality in modalities:
+        outdir_modality = outdir_tfidf / Path(f"{modality}/")
+        Path(outdir_modality).mkdir(parents = True, exist_ok = True)
+
+        my_print(f"Computing user {modality} TF-IDF model...")
+        dct, corpus, model = compute_tf_idf_model(user_documents.pop(modality))
+        my_print(f"Saving user {modality} TF-IDF model to pickle...")
+        save_pickle(dct, outdir_modality / Path("dct.pickle"))  # e.g., unique retweet ids - Dictionary(8 unique tokens: ['1312702345642496000', '1313285277276921859', '1313435619587231744', '1314190484705808386', '1315083733851148291']...)
+        save_pickle(corpus, outdir_modality / Path("corpus.pickle"))  # e.g., [[(0, 1), (1, 1), (2, 1), (3, 1), (4, 1)], [(5, 1), (6, 1), (7, 1)]] # e.g., user at index 1 retweets the status at index 5 once
+        save_pickle(model, outdir_modality / Path("model.pickle"))  # e.g., TfidfModel(num_docs=1, num_nnz=8)
 
     my_print(f"Saved user vector models in path {outdir_tfidf}")
 
@@ -0,0 +1,163 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+from include.event_index import update_event_index, load_event_index, window_bounds, window_panes, pane_counts, window_counts
+from include.user_similarities import tfidf_matrix_from_counts, save_matrix_cosine_similarities
+from include.lib import my_print
+from include.edge_store import load_edge_list
+from pipeline.add_multiscale_backbone_to_edgelist import add_multiscale_backbone_to_edgelist
+from pipeline.filter_edgelist import filter_edgelist
+from pipeline.compute_seed_communities import compute_seed_communities
+from pipeline.compute_coordinated_groups import compute_coordinated_groups
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import csv
+
+
+def compute_window_coordination(window_dir, ids, counts, alpha, louvain_resolution, min_cardinality, quantile_start, quantile_stop, quantile_steps,
+                                chunksize, norm, min_weight, edge_format):
+    """
+        Runs the similarity -> backbone -> coordinated groups chain on the retweet counts of a time window.
+        The output of the window is saved in window_dir with the same layout of the output of the whole pipeline.
+        :return: (dict) the number of users, edges and backbone edges of the window, and the path of its coordinated groups (empty if the window backbone has no edges)
+    """
+    outdir_network = window_dir / Path("network_raw/")
+    Path(outdir_network).mkdir(parents = True, exist_ok = True)
+    node_csv_path = outdir_network / Path("similarity_node_list.csv")
+    edge_csv_path = outdir_network / Path("similarity_edge_list" + (".csv" if edge_format == "csv" else ""))
+
+    pd.DataFrame({"user_id": ids}).to_csv(node_csv_path, index = False, header = True, quoting = csv.QUOTE_NONNUMERIC)
+    X = tfidf_matrix_from_counts(counts, norm = norm)
+    edges = save_matrix_cosine_similarities(ids, X, edge_csv_path, chunksize = chunksize, min_weight = min_weight)
+    summary = {"users": len(ids), "edges": edges, "backbone_edges": 0, "coordinated_groups_path": ""}
+    if edges == 0:
+        return summary
+
+    edge_csv_path = add_multiscale_backbone_to_edgelist(node_csv_path, edge_csv_path)
+    filtered_node_csv_path, filtered_edge_csv_path, outdir_backbone = filter_edgelist(edge_csv_path, alpha, window_dir)
+    _, filtered_columns = load_edge_list(filtered_edge_csv_path)
+    summary["backbone_edges"] = len(filtered_columns["source"])
+    if summary["backbone_edges"] == 0:
+        return summary
+
+    node_communities_csv_path, seed_mod_path, outdir_communities, seed_mod = compute_seed_communities(filtered_node_csv_path, filtered_edge_csv_path, louvain_resolution, outdir_backbone,
+                                                                                                      return_seed=True)
+    coordinated_groups_path, _, _ = compute_coordinated_groups(node_communities_csv_path, filtered_edge_csv_path, seed_mod_path, outdir_communities, louvain_resolution, min_cardinality,
+                                                               quantile_start = quantile_start, quantile_stop = quantile_stop, quantile_steps = quantile_steps,
+                                                               seed_mod = seed_mod)
+    summary["coordinated_groups_path"] = str(coordinated_groups_path)
+    return summary
+
+
+def compute_windowed_coordination(userseq_json_path, outdir, window, step = None, alpha = 0.15, louvain_resolution = 1, min_cardinality = 2,
+                                  quantile_start = 0, quantile_stop = 1, quantile_steps = 101, chunksize = 256, norm = "l2", min_weight = 0., edge_format = "store", workers = 1):
+    """
+        Applies the coordination analysis to each time window: the user similarity network, its backbone and the coordinated groups are computed
+        from the retweets of the users in the window, instead of their whole history.
+        The retweet events are read once from the parsed sequences into a time-sorted event index ("events/"), which is reused by the following runs
+        as long as the parsed sequences do not change (the index records the path, size and modification time of the file it was built from).
+        The time axis is split into panes delimited by the window boundaries: the retweet counts of each pane are computed once,
+        and the counts of a window are the sum of the counts of its panes, so overlapping sliding windows share their partial counts.
+        :param userseq_json_path: jsonl file with the parsed sequences (see parse_sequences)
+            - (e.g., "output/example_output/input_sequences.jsonl")
+        :param outdir: the path of the output directory (e.g., "output/example_output/") where the event index "events/" and a new subdirectory named
+                       f"windows_{window}_{step}/" will be created, with a subdirectory for each window (same layout of the output of the whole pipeline) and the summary "windows.csv"
+            - (e.g., "output/example_output/")
+        :param window: length of the windows in seconds
+            - (e.g., 86400 for daily windows)
+        :param step: distance in seconds between the starts of consecutive windows. None gives tumbling (non-overlapping) windows, a step shorter than window gives sliding windows
+            - (default=None)
+        :param alpha: alpha of the network backbone (see filter_edgelist)
+            - (default=0.15)
+        :param louvain_resolution: the resolution parameter of the louvain algorithm
+            - (default=1)
+        :param min_cardinality: minimum size of communities to consider
+            - (default=2)
+        :param quantile_start: Start threshold.
+            - (default=0)
+        :param quantile_stop: Stop threshold.
+            - (default=1)
+        :param quantile_steps: Total steps of threshold.
+            - (default=101)
+        :param chunksize: number of users processed at once by the similarity computation
+            - (default=256)
+        :param norm: normalization of the user vectors (l2 corresponds to the cosine similarity)
+            - (default="l2")
+        :param min_weight: minimum similarity of the edges to save
+            - (default=0.)
+        :param edge_format: the format of the edge lists of the windows, "store" or "csv" (see save_user_similarities)
+            - (default="store")
+        :param workers: number of windows processed in parallel
+            - (default=1)
+        :return:
+            - output_summary_csv_path: the path of the csv with a row for each window (header: window, start, stop, events, users, edges, backbone_edges, coordinated_groups_path)
+                - (e.g., "output/example_output/windows_86400_None/windows.csv")
+            - outdir_windows: the path of the new subdirectory containing the output of the windows
+                - (e.g., "output/example_output/windows_86400_None/")
+    """
+    if edge_format not in ["store", "csv"]:
+        raise ValueError(f"Unknown edge list format '{edge_format}'. Possible values: 'store', 'csv'.")
+    index_dir = outdir / Path("events/")
+    outdir_windows = outdir / Path(f"windows_{window}_{step}/")
+    Path(outdir_windows).mkdir(parents = True, exist_ok = True)
+    output_summary_csv_path = outdir_windows / Path("windows.csv")
+
+    update_event_index(userseq_json_path, index_dir)
+    user_ids, retweet_ids, events = load_event_index(index_dir)
+    if len(events["timestamp"]) == 0:
+        raise ValueError(f"No retweet events in {userseq_json_path}.")
+
+    bounds = window_bounds(events["timestamp"][0], events["timestamp"][-1], window, step)
+    cuts, ranges = window_panes(bounds)
+    my_print(f"Counting retweets in {len(cuts) - 1} panes for {len(bounds)} windows...")
+    panes = pane_counts(events, cuts, (len(user_ids), len(retweet_ids)))
+
+    def windows():
+        for i, ((start, stop), (first, last)) in enumerate(zip(bounds, ranges)):
+            counts = window_counts(panes, first, last)
+            active = np.flatnonzero(np.diff(counts.indptr))
+            yield i, start, stop, int(counts.sum()), user_ids[active], counts[active]
+
+    params = (alpha, louvain_resolution, min_cardinality, quantile_start, quantile_stop, quantile_steps, chunksize, norm, min_weight, edge_format)
+    with open(output_summary_csv_path, "w") as csv_file:
+        writer = csv.writer(csv_file, quotechar = '"', quoting = csv.QUOTE_NONNUMERIC)
+        writer.writerow(["window", "start", "stop", "events", "users", "edges", "backbone_edges", "coordinated_groups_path"])
+
+        def write(i, start, stop, n_events, summary):
+            writer.writerow([i, start, stop, n_events, summary["users"], summary["edges"], summary["backbone_edges"], summary["coordinated_groups_path"]])
+            my_print(f"Window {i + 1}/{len(bounds)} [{start}, {stop}): {n_events} retweets, {summary['users']} users, {summary['edges']} edges, {summary['backbone_edges']} backbone edges.")
+
+        if workers == 1:
+            for i, start, stop, n_events, ids, counts in windows():
+                write(i, start, stop, n_events, compute_window_coordination(outdir_windows / Path(f"window_{i:04d}/"), ids, counts, *params))
+        else:
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                # at most 2 windows per worker are in flight, so that the counts of all the windows are not in memory at once
+                pending = deque()
+                for i, start, stop, n_events, ids, counts in windows():
+                    pending.append(((i, start, stop, n_events), executor.submit(compute_window_coordination, outdir_windows / Path(f"window_{i:04d}/"), ids, counts, *params)))
+                    if len(pending) >= 2 * workers:
+                        window_info, future = pending.popleft()
+                        write(*window_info, future.result())
+                while pending:
+                    window_info, future = pending.popleft()
+                    write(*window_info, future.result())
+
+    my_print(f"Saved the summary of the windows in {output_summary_csv_path}")
+    my_print("Finished!")
+    return output_summary_csv_path, outdir_windows
+
+
+if __name__ == "__main__":
+    # Input example
+    userseq_json_path = Path("../output/example_output/input_sequences.jsonl")
+    outdir = Path("../output/example_output/")
+    window = 3600  # hourly windows
+    step = 1800    # sliding by half an hour
+    # Function call
+    summary_csv_path, outdir_windows = compute_windowed_coordination(userseq_json_path, outdir, window, step = step)
+    # Output example
+    print(summary_csv_path)  # "../output/example_output/windows_3600_1800/windows.csv"
+    print(outdir_windows)    # "../output/example_output/windows_3600_1800/"
@@ -2,6 +2,7 @@ import sys, os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 import pandas as pd
 from include.lib import my_print, load_pickle, compute_tfidf_tagclouds
+from include.user_index import load_user_index
 from gensim.corpora import Dictionary
 from gensim.models import TfidfModel
 import matplotlib as mpl
@@ -41,7 +42,7 @@ def coordinated_groups_of_interest_metadata(node_csv_path, coordinated_groups_pa
     Path(outdir_plots).mkdir(parents = True, exist_ok = True)
     output_path = outdir_plots / Path("coordinated_groups_metadata.json")
 
-    ids = load_pickle(outdir_tfidf / Path("ids.pickle"))
+    ids = load_user_index(outdir_tfidf)
     corpus = load_pickle(outdir_tfidf / Path("hashtags/corpus.pickle"))
     dictionary = Dictionary.load(str(outdir_tfidf / Path("hashtags/dct.pickle")))
     model = TfidfModel.load(str(outdir_tfidf / Path("hashtags/model.pickle")))
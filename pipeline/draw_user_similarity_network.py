@@ -18,8 +18,8 @@ def draw_user_similarity_network(node_csv_path, edge_csv_path, communities_metad
 
         :param node_csv_path: the path of the csv with the nodes
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/coordinated_communities_quantile(0,1,101)_mincardinality2/filtered_similarity_node_list_coordination.csv")
-        :param edge_csv_path: the path of the csv with the edges
-            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
+        :param edge_csv_path: the path of the edge store (or csv) with the edges
+            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list/" or "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
         :param communities_metadata_path: metadata about the communities under investigation
             - (e.g., "output/example_output/network_backbone_alpha0.15/louvain_communities_res1/coordinated_communities_quantile(0,1,101)_mincardinality2/plots_top10_coordinated_groups_mincardinality2/coordinated_groups_metadata.json")
         :param coordinated_groups_path: the path of the jsonl with the coordinated groups and their evolution at each threshold
@@ -0,0 +1,35 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+from include.lib import my_print
+from include.edge_store import export_edge_list_csv
+from pathlib import Path
+
+
+def export_edge_list(edge_store_path, output_csv_path=None):
+    """
+        Exports an edge store (the binary edge list exchanged by the stages of the pipeline) to a csv file
+
+        :param edge_store_path: the path of the edge store directory
+            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list/")
+        :param output_csv_path: the path of the csv file to create. If None, the csv is saved next to the edge store, with the same name and the ".csv" suffix
+            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
+        :return: the path of the csv with the edges (header: source, target, weight[, alpha])
+            - (e.g., "output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv")
+    """
+    if output_csv_path is None:
+        output_csv_path = Path(edge_store_path).with_suffix(".csv")
+
+    my_print(f"Exporting edge store {edge_store_path} to {output_csv_path}...")
+    output_csv_path = export_edge_list_csv(edge_store_path, output_csv_path)
+    my_print(f"Saved edge list csv in {output_csv_path}")
+
+    return output_csv_path
+
+
+if __name__ == "__main__":
+    # Input example
+    edge_store_path = Path("../output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list/")
+    # Function call
+    edge_csv_path = export_edge_list(edge_store_path)
+    # Output example
+    print(edge_csv_path)  # "../output/example_output/network_backbone_alpha0.15/filtered_similarity_edge_list.csv"
@@ -5,7 +5,7 @@ from include.lib import my_print
 from include.user_sequences import parse_raw_sequences
 from pathlib import Path
 
-def parse_sequences(raw_sequences_path, outdir):
+def parse_sequences(raw_sequences_path, outdir, workers = 1, chunksize = 64):
     """
     Parse a jsonl file of users and their twitter objects, and returns a jsonl file with parsed and formatted relevant information
 
@@ -15,9 +15,13 @@ def parse_sequences(raw_sequences_path, outdir):
                                 - "timestamps": the list of its tweets' timestamps ordered asc
                                 - "raw_sequences": the list of the user's tweet objs ordered asc (corresponding to the "timestamps" list)
                                Example: { "user_id": 111, "timestamps": [1601596899.0, 1601597248.0], "raw_sequences": [{"id":"tweet1", "timestamp": 1601596899.0,"entities": {...}, "retweeted_status": {"id":"retweet1"}, etc.},{"id":"tweet2", "timestamp":1601597248.0, "entities": {...}, "retweeted_status": {...}, etc.}] }
-        - (e.g., "input_data/input_superspreaders_raw_seqs.jsonl")
+        - (e.g., "input_data/input_superspreaders_raw_seqs.jsonl", or compressed "input_data/input_superspreaders_raw_seqs.jsonl.gz" / ".jsonl.zst")
     :param outdir: the path of the directory where the data will be saved:
         - (e.g., "output/example_output")
+    :param workers: number of worker processes parsing the users (1 parses the users in the current process)
+        - (default=1)
+    :param chunksize: number of users sent to a worker at once
+        - (default=64)
     :return: the path of jsonl file in which every line is a json user.
                                 Each json contains:
                                 - "user_id"
@@ -43,7 +47,7 @@ def parse_sequences(raw_sequences_path, outdir):
 
     my_print(f"Parsing raw sequences from {raw_sequences_path}...")
 
-    parse_raw_sequences(raw_sequences_path, output_path)
+    parse_raw_sequences(raw_sequences_path, output_path, workers=workers, chunksize=chunksize)
 
     my_print("Parsed sequences saved to {}.".format(output_path))
 
@@ -1,44 +1,116 @@
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-from include.user_similarities import save_cosine_similarities
+from include.user_similarities import save_cosine_similarities, save_sparse_cosine_similarities, save_lsh_cosine_similarities, save_temporal_coretweet_similarities, save_multimodal_cosine_similarities, save_inverted_index_similarities
+from include.event_index import update_event_index
+from include.user_vector_models import MODALITIES
 from include.lib import *
+from include.user_index import USER_INDEX, load_user_index
 from pathlib import Path
 
 
-def save_user_similarities(outdir_tfidf, outdir, chunksize = 256, shardsize = 32768, norm = "l2"):
+def save_user_similarities(outdir_tfidf, outdir, chunksize = 256, shardsize = 32768, norm = "l2", engine = "sparse", workers = 1, lsh_bands = None, lsh_rows = None, min_weight = 0., top_k_per_user = None, edge_format = "store", model = "RT", delta_t = None, modalities = None, fusion_weights = None, posting_cap = None, cap_policy = None):
     """
-        Computes the the user similarity network and saves in a csv file the nodes and edges,
+        Computes the the user similarity network and saves the nodes in a csv file and the edges in an edge store (or csv file),
         where the nodes are the users and the edges are weighted based on the retweet similarities of the user vector models.
 
         :param outdir_tfidf: the path of the directory where are stored the pickled of the user vector models
             - (e.g., "output/example_output/tfidf_models")
         :param outdir: the path of the output directory (e.g., "output/example_output/") where a new subdirectory named "network_raw/" will be created
             - (e.g., "output/example_output/")
-        :param chunksize: parameter of the gensim.similarities.docsim.Similarity class used for scalability.
+        :param chunksize: number of users processed at once (row block of the sparse engine, query chunk of the gensim engine).
             - default 256.
         :param shardsize: parameter of the gensim.similarities.docsim.Similarity class used for scalability.
             - default 32768.
-        :param norm: parameter of the gensim.similarities.docsim.Similarity class used for scalability.
+        :param norm: normalization of the user vectors (l2 corresponds to the cosine similarity).
             - default l2.
+        :param engine: the similarity engine:
+            - "sparse": blocked sparse matrix product of the normalized TF-IDF vectors, computing only the pairs of users sharing at least one retweet
+            - "gensim": gensim.similarities.docsim.Similarity index, querying every user against all users
+            - "inverted": inverted index of the retweets, accumulating the similarities only along the posting lists of the users who retweeted each status.
+              The posting lists longer than posting_cap are skipped or down-weighted (cap_policy), and the work per posting list size is saved in "network_raw/posting_work.csv"
+            - "lsh": approximate mode for large datasets, computing the similarity only for the candidate pairs of users found with MinHash-LSH on their retweet sets
+            - default "sparse".
+        :param workers: number of processes used by the sparse engine (the other engines support only 1). With more than one worker, the normalized user vectors are
+            memory-mapped and shared by the processes, each process writes its own edge shard and the shards are merged in the edge list.
+            - default 1.
+        :param lsh_bands: number of bands of the "lsh" engine. More bands find more pairs (higher recall) at a higher cost.
+            - default None (32 with the "lsh" engine).
+        :param lsh_rows: number of MinHash values per band of the "lsh" engine. More rows restrict the candidates to users with higher retweet overlap.
+            - default None (4 with the "lsh" engine: pairs with Jaccard similarity of their retweet sets above ~0.4 are likely to be found).
+        :param posting_cap: maximum length of the posting lists of the "inverted" engine processed with their full weight (e.g., to leave out viral retweets).
+            - default None (no cap).
+        :param cap_policy: the posting lists longer than posting_cap are skipped ("skip") or their contributions are scaled by posting_cap / length ("downweight").
+            - default None ("skip" with posting_cap).
+        :param min_weight: minimum similarity of the edges to save ("sparse", "inverted" and "lsh" engines). Edges below it are discarded while computing the similarities.
+            - default 0. (all the edges with positive similarity are saved).
+        :param top_k_per_user: if not None (at least 1), an edge is saved only if it is one of the top_k_per_user strongest edges (ties included) of at least one of its users ("sparse" and "lsh" engines).
+            - default None.
+        :param edge_format: the format of the edge list:
+            - "store": binary columnar edge store (see include/edge_store.py), read and written by the following stages without parsing
+            - "csv": csv file (header: source, target, weight)
+            - default "store".
+        :param model: the similarity model:
+            - "RT": similarity of the user vector models of retweets, computed with engine
+            - "RT_temporal": temporal co-retweet similarity, the weight of an edge is the number of statuses retweeted by both users within delta_t seconds.
+              It is computed from the time-sorted event index of the parsed sequences in outdir ("events/", built if missing or older than the parsed sequences), with a sweep over the retweets of each status
+            - "multimodal": similarities of several user vector models (modalities), computed with the "sparse" engine in a single job sharing the row blocks.
+              The edges of each model are saved in f"similarity_edge_list_{modality}", and the multiplex network is saved in "similarity_edge_list" when fusion_weights is given
+            - default "RT".
+        :param delta_t: maximum time in seconds between two retweets of the same status of the "RT_temporal" model.
+            - default None (60. with the "RT_temporal" model).
+        :param modalities: the user vector models of the "multimodal" model, computed by compute_user_vector_models (whose default computes only "RT" and "hashtags")
+            - (e.g., ("RT", "hashtags", "mentions", "urls"))
+            - default None (the user vector models saved in outdir_tfidf).
+        :param fusion_weights: weights of the modalities in the multiplex similarity of the "multimodal" model, i.e. the weighted sum of their similarities.
+            None saves only the edge list of each modality, and the edge list of the first modality is returned
+            - (e.g., {"RT": 0.7, "hashtags": 0.1, "mentions": 0.1, "urls": 0.1})
+            - default None.
         :return:
             - output_node_csv_path: the path of the csv with the nodes
                 - (e.g., "output/example_output/network_raw/similarity_node_list.csv")
-            - output_edge_csv_path: the path of the csv with the edges
-                - (e.g., "output/example_output/network_raw/similarity_edge_list.csv")
+            - output_edge_csv_path: the path of the edge store (or csv) with the edges
+                - (e.g., "output/example_output/network_raw/similarity_edge_list/" or "output/example_output/network_raw/similarity_edge_list.csv")
 
     """
 
+    if workers > 1 and engine != "sparse":
+        raise ValueError(f"workers > 1 is supported only by the 'sparse' engine, got engine '{engine}'.")
+    if (lsh_bands is not None or lsh_rows is not None) and (engine != "lsh" or model != "RT"):
+        raise ValueError("lsh_bands and lsh_rows are supported only by the 'lsh' engine of the 'RT' model.")
+    if (posting_cap is not None or cap_policy is not None) and (engine != "inverted" or model != "RT"):
+        raise ValueError("posting_cap and cap_policy are supported only by the 'inverted' engine of the 'RT' model.")
+    if cap_policy is not None and posting_cap is None:
+        raise ValueError("cap_policy requires posting_cap.")
+    if model == "RT_temporal" and (engine != "sparse" or workers > 1 or top_k_per_user is not None):
+        raise ValueError("The 'RT_temporal' model is computed from the event index, without engine, workers and top_k_per_user.")
+    if delta_t is not None and model != "RT_temporal":
+        raise ValueError("delta_t is supported only by the 'RT_temporal' model.")
+    if model == "multimodal":
+        if engine != "sparse" or top_k_per_user is not None:
+            raise ValueError("The 'multimodal' model supports only the 'sparse' engine, without top_k_per_user.")
+        saved = [modality for modality in MODALITIES if (outdir_tfidf / Path(modality) / Path("dct.pickle")).exists()]
+        if modalities is None:
+            modalities = saved
+        missing = [modality for modality in modalities if modality not in saved]
+        if len(missing) > 0 or len(modalities) == 0:
+            raise ValueError(f"The user vector models {missing} of the 'multimodal' model are not in {outdir_tfidf} (saved models: {saved}), see compute_user_vector_models.")
+
     outdir_network = outdir / Path("network_raw/")
     Path(outdir_network).mkdir(parents = True, exist_ok = True)
     output_node_csv_path = outdir_network / Path("similarity_node_list.csv")
-    output_edge_csv_path = outdir_network / Path("similarity_edge_list.csv")
+    if edge_format == "store":
+        output_edge_csv_path = outdir_network / Path("similarity_edge_list")
+    elif edge_format == "csv":
+        output_edge_csv_path = outdir_network / Path("similarity_edge_list.csv")
+    else:
+        raise ValueError(f"Unknown edge list format '{edge_format}'. Possible values: 'store', 'csv'.")
 
-    ids_path = outdir_tfidf / Path("ids.pickle")
+    user_index_path = outdir_tfidf / Path(USER_INDEX)
     dct_path_rt = outdir_tfidf / Path("RT/dct.pickle")
     corpus_path_rt = outdir_tfidf / Path("RT/corpus.pickle")
     model_path_rt = outdir_tfidf / Path("RT/model.pickle")
 
-    ids = load_pickle(ids_path)
+    ids = load_user_index(user_index_path)
     with open(output_node_csv_path, "w") as csv_file:
         writer = csv.writer(csv_file, quotechar = '"', quoting = csv.QUOTE_NONNUMERIC)
         writer.writerow(["user_id"])
@@ -46,7 +118,33 @@ def save_user_similarities(outdir_tfidf, outdir, chunksize = 256, shardsize = 32
             writer.writerow([user])
 
 
-    output_edge_csv_path= save_cosine_similarities(ids_path, dct_path_rt, corpus_path_rt, model_path_rt, output_edge_csv_path, chunksize=chunksize, shardsize=shardsize, norm=norm)
+    if model == "RT_temporal":
+        index_dir = outdir / Path("events/")
+        update_event_index(outdir / Path("input_sequences.jsonl"), index_dir)
+        output_edge_csv_path = save_temporal_coretweet_similarities(index_dir, output_edge_csv_path, delta_t=delta_t if delta_t is not None else 60., min_weight=min_weight)
+    elif model == "multimodal":
+        model_paths = {modality: tuple(outdir_tfidf / Path(modality) / Path(name) for name in ["dct.pickle", "corpus.pickle", "model.pickle"]) for modality in modalities}
+        output_paths = {modality: outdir_network / Path(f"similarity_edge_list_{modality}" + Path(output_edge_csv_path).suffix) for modality in modalities}
+        output_paths = save_multimodal_cosine_similarities(user_index_path, model_paths, output_paths, chunksize=chunksize, norm=norm, workers=workers, min_weight=min_weight,
+                                                           fusion_weights=fusion_weights, fused_output_path=output_edge_csv_path)
+        output_edge_csv_path = output_paths["multiplex"] if fusion_weights is not None else output_paths[modalities[0]]
+    elif model != "RT":
+        raise ValueError(f"Unknown similarity model '{model}'. Possible values: 'RT', 'RT_temporal', 'multimodal'.")
+    elif engine == "sparse":
+        output_edge_csv_path = save_sparse_cosine_similarities(user_index_path, dct_path_rt, corpus_path_rt, model_path_rt, output_edge_csv_path, chunksize=chunksize, norm=norm, workers=workers, min_weight=min_weight, top_k_per_user=top_k_per_user)
+    elif engine == "gensim":
+        if min_weight > 0 or top_k_per_user is not None:
+            raise ValueError("min_weight and top_k_per_user are not supported by the 'gensim' engine.")
+        output_edge_csv_path = save_cosine_similarities(user_index_path, dct_path_rt, corpus_path_rt, model_path_rt, output_edge_csv_path, chunksize=chunksize, shardsize=shardsize, norm=norm)
+    elif engine == "inverted":
+        if top_k_per_user is not None:
+            raise ValueError("top_k_per_user is not supported by the 'inverted' engine.")
+        output_edge_csv_path = save_inverted_index_similarities(user_index_path, dct_path_rt, corpus_path_rt, model_path_rt, output_edge_csv_path, chunksize=chunksize, norm=norm, min_weight=min_weight,
+                                                                posting_cap=posting_cap, cap_policy=cap_policy if cap_policy is not None else "skip", report_path=outdir_network / Path("posting_work.csv"))
+    elif engine == "lsh":
+        output_edge_csv_path = save_lsh_cosine_similarities(user_index_path, dct_path_rt, corpus_path_rt, model_path_rt, output_edge_csv_path, chunksize=chunksize, norm=norm, bands=lsh_bands if lsh_bands is not None else 32, rows=lsh_rows if lsh_rows is not None else 4, min_weight=min_weight, top_k_per_user=top_k_per_user)
+    else:
+        raise ValueError(f"Unknown similarity engine '{engine}'. Possible values: 'sparse', 'inverted', 'gensim', 'lsh'.")
 
     my_print("Finished!")
     my_print(f"Saved user similarity node list (user_id) in {output_node_csv_path}")
@@ -63,4 +161,4 @@ if __name__ == "__main__":
     node_csv_path, edge_csv_path = save_user_similarities(outdir_tfidf, outdir)
     # Output example
     print(node_csv_path)  # "../output/example_output/network_raw/similarity_node_list.csv"
-    print(edge_csv_path)  # "../output/example_output/network_raw/similarity_edge_list.csv"
+    print(edge_csv_path)  # "../output/example_output/network_raw/similarity_edge_list"
@@ -0,0 +1,136 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+from include.user_sequences import parse_raw_sequences, merge_user_sequences
+from include.user_vector_models import MODALITIES, update_tf_idf_model, user_document
+from include.user_similarities import load_tfidf_matrix, update_sparse_cosine_similarities
+from include.user_index import USER_INDEX, load_user_index, save_user_index
+from include.lib import *
+import jsonlines
+from pathlib import Path
+import csv
+
+
+def update_user_similarities(raw_sequences_path, outdir, chunksize = 256, norm = "l2", min_weight = 0., tolerance = 0., refresh_idf = False, workers = 1):
+    """
+        Incremental version of parse_sequences, compute_user_vector_models and save_user_similarities: appends new users and tweets
+        to the output of a previous run, without recomputing the whole pipeline.
+        Only the new raw sequences are parsed, the dictionaries and corpora of the user vector models (RT, hashtags, mentions and urls, when computed) are extended
+        (the IDF of the known features is kept, see refresh_idf), and the similarity edge list is patched by recomputing only the similarities
+        of the users whose vector changed (see update_sparse_cosine_similarities).
+        The following stages (from add_multiscale_backbone_to_edgelist on) must be run again on the updated network.
+
+        :param raw_sequences_path: jsonl file with the new raw sequences, in the same format of the input of parse_sequences.
+                                   It must contain only tweets that were not in the previous input: the tweets of existing users are appended to their sequences.
+            - (e.g., "input_data/input_superspreaders_raw_seqs_update.jsonl")
+        :param outdir: the path of the output directory of the previous run, with "input_sequences.jsonl", "tfidf_models/" and "network_raw/"
+            - (e.g., "output/example_output/")
+        :param chunksize: number of users (rows) processed at once
+            - (default=256)
+        :param norm: normalization of the user vectors. Must be the same used by save_user_similarities
+            - (default="l2")
+        :param min_weight: minimum similarity of the recomputed edges. Must be the same used by save_user_similarities
+            - (default=0.)
+        :param tolerance: a user is recomputed when an entry of its normalized vector changed by more than tolerance.
+                          With refresh_idf=True, new users change the IDF of all features, so with tolerance=0 adding users recomputes all the similarities,
+                          while a small tolerance (e.g., 1e-3) keeps the similarities between users whose vectors barely changed
+            - (default=0.)
+        :param refresh_idf: whether to refit the IDF of the TF-IDF models on the updated document frequencies:
+            - False: the IDF of the features of the previous run is frozen and only the new features get an IDF, so the vectors of the users
+                     without new tweets do not change and the cost of the update is proportional to the new users and tweets
+            - True: the IDF of all the features is refitted, as in a run from scratch on all the sequences. It changes the vectors of all the users
+                    (see tolerance), the update falls back to a full recompute of the similarities when all of them changed
+            - (default=False)
+        :param workers: number of worker processes parsing the new raw sequences
+            - (default=1)
+        :return:
+            - output_node_csv_path: the path of the updated csv with the nodes
+                - (e.g., "output/example_output/network_raw/similarity_node_list.csv")
+            - output_edge_csv_path: the path of the patched edge store (or csv) with the edges (header: source, target, weight),
+                                    None when the RT user vector model was not computed (the edge list is not patched)
+                - (e.g., "output/example_output/network_raw/similarity_edge_list/" or "output/example_output/network_raw/similarity_edge_list.csv")
+    """
+    sequences_path = outdir / Path("input_sequences.jsonl")
+    new_sequences_path = outdir / Path("input_sequences_update.jsonl")
+    outdir_tfidf = outdir / Path("tfidf_models/")
+    user_index_path = outdir_tfidf / Path(USER_INDEX)
+    outdir_network = outdir / Path("network_raw/")
+    output_node_csv_path = outdir_network / Path("similarity_node_list.csv")
+    output_edge_csv_path = outdir_network / Path("similarity_edge_list")
+    if not output_edge_csv_path.exists():
+        output_edge_csv_path = outdir_network / Path("similarity_edge_list.csv")
+
+    my_print(f"Parsing new raw sequences from {raw_sequences_path}...")
+    parse_raw_sequences(raw_sequences_path, new_sequences_path, workers=workers)
+
+    my_print("Loading new user sequences...")
+    user_ids = load_user_index(user_index_path)
+    user_index = {user_id: i for i, user_id in enumerate(user_ids.tolist())}
+    modalities = [modality for modality in MODALITIES if (outdir_tfidf / Path(modality) / Path("dct.pickle")).exists()]
+    new_ids = []
+    updated = set()
+    user_documents = {modality: {} for modality in modalities}
+    with jsonlines.open(new_sequences_path, mode="r") as handle:
+        for user in handle:
+            user_id = str(user["user_id"])
+            if user_id not in user_index:
+                user_index[user_id] = len(user_index)
+                new_ids.append(user_id)
+            i = user_index[user_id]
+            updated.add(i)
+            for modality in modalities:
+                user_documents[modality].setdefault(i, []).extend(user_document(user, modality))
+    my_print(f"{len(updated) - len(new_ids)} users with new tweets, {len(new_ids)} new users (user vector models: {', '.join(modalities)}).")
+
+    if "RT" in modalities:
+        my_print("Computing previous user RT vectors...")
+        X_old = load_tfidf_matrix(outdir_tfidf / Path("RT/dct.pickle"), outdir_tfidf / Path("RT/corpus.pickle"), outdir_tfidf / Path("RT/model.pickle"), norm=norm)
+
+    for name, documents in user_documents.items():
+        my_print(f"Updating user {name} TF-IDF model...")
+        dct_path = outdir_tfidf / Path(name) / Path("dct.pickle")
+        corpus_path = outdir_tfidf / Path(name) / Path("corpus.pickle")
+        model_path = outdir_tfidf / Path(name) / Path("model.pickle")
+        dct, corpus, model = update_tf_idf_model(load_pickle(dct_path), load_pickle(corpus_path), documents,
+                                                 model=None if refresh_idf else load_pickle(model_path))
+        save_pickle(dct, dct_path)
+        save_pickle(corpus, corpus_path)
+        save_pickle(model, model_path)
+
+    my_print("Saving user id table...")
+    user_ids = np.concatenate([user_ids, np.asarray(new_ids, dtype=str)])
+    save_user_index(user_ids, user_index_path)
+
+    my_print(f"Merging new sequences into {sequences_path}...")
+    merge_user_sequences(sequences_path, new_sequences_path)
+    os.remove(new_sequences_path)
+
+    with open(output_node_csv_path, "w") as csv_file:
+        writer = csv.writer(csv_file, quotechar = '"', quoting = csv.QUOTE_NONNUMERIC)
+        writer.writerow(["user_id"])
+        for user in user_ids:
+            writer.writerow([user])
+
+    if "RT" in modalities:
+        output_edge_csv_path = update_sparse_cosine_similarities(user_index_path, outdir_tfidf / Path("RT/dct.pickle"), outdir_tfidf / Path("RT/corpus.pickle"), outdir_tfidf / Path("RT/model.pickle"),
+                                                                 X_old, output_edge_csv_path, chunksize=chunksize, norm=norm, min_weight=min_weight, tolerance=tolerance)
+    else:
+        my_print("No user RT vector model: the similarity edge list is not patched.")
+        output_edge_csv_path = None
+
+    my_print("Finished!")
+    my_print(f"Saved user similarity node list (user_id) in {output_node_csv_path}")
+    if output_edge_csv_path is not None:
+        my_print(f"Saved user similarity edge list (source, target, weight) in {output_edge_csv_path}")
+
+    return output_node_csv_path, output_edge_csv_path
+
+
+if __name__ == "__main__":
+    # Input example
+    raw_sequences_path = Path("../input_data/input_superspreaders_raw_seqs_update.jsonl")
+    outdir = Path("../output/example_output/")
+    # Function call
+    node_csv_path, edge_csv_path = update_user_similarities(raw_sequences_path, outdir)
+    # Output example
+    print(node_csv_path)  # "../output/example_output/network_raw/similarity_node_list.csv"
+    print(edge_csv_path)  # "../output/example_output/network_raw/similarity_edge_list"
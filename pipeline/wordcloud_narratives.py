@@ -2,6 +2,7 @@ import sys, os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 import pandas as pd
 from include.lib import my_print, load_pickle, compute_tfidf_tagclouds
+from include.user_index import load_user_index
 from gensim.corpora import Dictionary
 from gensim.models import TfidfModel
 import matplotlib.pyplot as plt
@@ -32,7 +33,7 @@ def wordcloud_narratives(node_csv_path, communities_metadata_path, outdir_tfidf,
 
     my_print("Drawing hashtag cloud...")
 
-    ids = load_pickle(outdir_tfidf / Path("ids.pickle"))
+    ids = load_user_index(outdir_tfidf)
     corpus = load_pickle(outdir_tfidf / Path("hashtags/corpus.pickle"))
     dictionary = Dictionary.load(str(outdir_tfidf / Path("hashtags/dct.pickle")))
     model = TfidfModel.load(str(outdir_tfidf / Path("hashtags/model.pickle")))
@@ -38,11 +38,11 @@ def main(input_filepath, output_directory):
 
 	my_print("COMPUTING SEED COMMUNITIES")
 	louvain_resolution = 1
-	filtered_node_communities_csv_path, seed_mod_path, outdir_communities = compute_seed_communities(filtered_node_csv_path, filtered_edge_csv_path, louvain_resolution, outdir_backbone)
+	filtered_node_communities_csv_path, seed_mod_path, outdir_communities, seed_mod = compute_seed_communities(filtered_node_csv_path, filtered_edge_csv_path, louvain_resolution, outdir_backbone, return_seed=True)
 
 	my_print("COMPUTING COORDINATION-AWARE COMMUNITY DETECTION FROM SEEDS")
 	min_cardinality = 2
-	coordinated_groups_path, coordinated_groups_stats_csv_path, outdir_coordination_aware = compute_coordinated_groups(filtered_node_communities_csv_path, filtered_edge_csv_path, seed_mod_path, outdir_communities, louvain_resolution, min_cardinality)
+	coordinated_groups_path, coordinated_groups_stats_csv_path, outdir_coordination_aware = compute_coordinated_groups(filtered_node_communities_csv_path, filtered_edge_csv_path, seed_mod_path, outdir_communities, louvain_resolution, min_cardinality, seed_mod=seed_mod)
 
 	my_print("COMPUTE USER COORDINATION LEVELS")
 	filtered_node_coordination_csv_path = compute_user_coordination(coordinated_groups_path, filtered_node_communities_csv_path, outdir_coordination_aware)
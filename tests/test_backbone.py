@@ -0,0 +1,42 @@
+import networkx as nx
+import numpy as np
+import pytest
+from include.backbone import disparity_filter, disparity_filter_arrays, disparity_filter_edge_order
+
+
+def weighted_edges():
+    """
+    Random weighted edges between nodes 0..159, without duplicates, plus a few nodes of degree 1 (and edges between them).
+    """
+    rng = np.random.default_rng(3)
+    pairs = np.unique(rng.integers(0, 160, size=(800, 2)), axis=0)
+    pairs = pairs[(pairs[:, 0] != pairs[:, 1]) & (pairs[:, 0] < pairs[:, 1])]
+    pairs = pairs[rng.permutation(len(pairs))]
+    edges = [(int(u), int(v), float(w)) for (u, v), w in zip(pairs, rng.random(len(pairs)))]
+    return edges + [(160, 161, 0.5), (162, 163, 0.2), (164, 0, 0.7)]
+
+
+@pytest.mark.parametrize("directed", [False, True])
+def test_disparity_filter_parity(directed):
+    G = nx.DiGraph() if directed else nx.Graph()
+    # the nodes are added in order, so that the node indices follow the node order of G
+    G.add_nodes_from(range(200))
+    G.add_weighted_edges_from(weighted_edges())
+    # the directed edges are given in order of insertion, the undirected ones in the order of G.edges
+    edges = weighted_edges() if directed else list(G.edges(data="weight"))
+    source = np.array([edge[0] for edge in edges])
+    target = np.array([edge[1] for edge in edges])
+    weight = np.array([edge[2] for edge in edges])
+    B = disparity_filter(G)
+    order, swap = disparity_filter_edge_order(source, target, n_nodes=len(G), directed=directed)
+
+    # same edges, in the same order and with the same orientation
+    assert list(B.edges()) == list(zip(np.where(swap, target[order], source[order]).tolist(), np.where(swap, source[order], target[order]).tolist()))
+    if directed:
+        alpha_out, alpha_in = disparity_filter_arrays(source, target, weight, n_nodes=len(G), directed=True)
+        for attribute, alpha in [("alpha_out", alpha_out), ("alpha_in", alpha_in)]:
+            reference = np.array([attributes.get(attribute, np.nan) for _, _, attributes in B.edges(data=True)])
+            np.testing.assert_allclose(alpha[order], reference, atol=1e-4)
+    else:
+        alpha = disparity_filter_arrays(source, target, weight, n_nodes=len(G))
+        np.testing.assert_allclose(alpha[order], [attributes["alpha"] for _, _, attributes in B.edges(data=True)], atol=1e-4)
@@ -0,0 +1,43 @@
+import community.community_louvain as community_louvain
+import networkx as nx
+import numpy as np
+import pytest
+from include.community_detection import detect_communities, log_parity, normalized_mutual_information, leidenalg
+
+
+@pytest.fixture(scope="module")
+def block_graph():
+    G = nx.stochastic_block_model([40] * 30, np.where(np.eye(30), 0.3, 0.01), seed=1)
+    rng = np.random.default_rng(1)
+    for u, v in G.edges():
+        G[u][v]["weight"] = float(rng.random()) + 0.1
+    return G
+
+
+def test_normalized_mutual_information():
+    assert normalized_mutual_information([0, 0, 1, 1], [5, 5, 3, 3]) == pytest.approx(1.)
+    assert normalized_mutual_information([0, 0, 0, 0], [1, 1, 1, 1]) == pytest.approx(1.)
+    assert normalized_mutual_information([0, 0, 1, 1], [0, 1, 0, 1]) == pytest.approx(0.)
+
+
+@pytest.mark.parametrize("resolution", [0.25, 0.5, 1., 2.])
+def test_louvain_csr_parity(block_graph, resolution):
+    result = detect_communities(block_graph, resolution=resolution, backend="csr")
+    reference = community_louvain.best_partition(block_graph, resolution=resolution, randomize=False, random_state=0)
+    nodes = list(block_graph)
+    assert abs(len(set(result.values())) - len(set(reference.values()))) <= 2
+    assert normalized_mutual_information([result[node] for node in nodes], [reference[node] for node in nodes]) > 0.95
+
+
+def test_louvain_csr_warm_start(block_graph):
+    seed = community_louvain.best_partition(block_graph, randomize=False, random_state=0)
+    parity = log_parity(block_graph, detect_communities(block_graph, partition=seed, backend="csr"), seed, 1., 0, "csr")
+    assert parity["communities"] == parity["reference_communities"]
+    assert parity["nmi"] > 0.99
+
+
+@pytest.mark.skipif(leidenalg is None, reason="leidenalg is not installed")
+def test_leiden_csr_parity(block_graph):
+    parity = log_parity(block_graph, detect_communities(block_graph, backend="leiden"), None, 1., 0, "leiden")
+    assert abs(parity["communities"] - parity["reference_communities"]) <= 2
+    assert parity["nmi"] > 0.95
@@ -0,0 +1,79 @@
+import community as community_louvain
+import networkx as nx
+import numpy as np
+import pytest
+from include.coord_group_detection import match_groups, threshold_sweep
+
+
+@pytest.fixture(scope="module")
+def weighted_graph():
+    """
+    Block graph with random weights, whose nodes are not in order of their first edge.
+    """
+    G = nx.stochastic_block_model([30] * 8, np.where(np.eye(8), 0.3, 0.02), seed=6)
+    rng = np.random.default_rng(6)
+    H = nx.Graph()
+    H.add_nodes_from(rng.permutation(len(G)).tolist())
+    H.add_weighted_edges_from((u, v, float(w)) for (u, v), w in zip(G.edges(), rng.random(G.number_of_edges()).round(2)))
+    return H
+
+
+def thresholds(G):
+    weights = [weight for _, _, weight in G.edges(data="weight")]
+    return np.quantile(weights, np.linspace(0, 1, 21)).tolist()
+
+
+def filtered_graph(G, threshold):
+    return nx.Graph((source, target, attr) for source, target, attr in G.edges(data=True) if attr["weight"] >= threshold)
+
+
+def test_threshold_sweep_parity(weighted_graph):
+    graph_sweep = threshold_sweep(weighted_graph)
+    G_filtered = next(graph_sweep)
+    for threshold in thresholds(weighted_graph):
+        graph_sweep.send(threshold)
+        reference = filtered_graph(weighted_graph, threshold)
+        # same nodes and neighbors, in the same order
+        assert list(G_filtered) == list(reference)
+        assert all(list(G_filtered[node]) == list(reference[node]) for node in reference)
+        assert list(G_filtered.edges(data="weight")) == list(reference.edges(data="weight"))
+
+
+def test_threshold_sweep_partitions(weighted_graph):
+    graph_sweep = threshold_sweep(weighted_graph)
+    G_filtered = next(graph_sweep)
+    prev = None
+    for threshold in thresholds(weighted_graph):
+        graph_sweep.send(threshold)
+        partition = community_louvain.best_partition(G_filtered, partition=prev, randomize=False, random_state=0)
+        assert partition == community_louvain.best_partition(filtered_graph(weighted_graph, threshold), partition=prev, randomize=False, random_state=0)
+        prev = partition
+
+
+def reference_match_groups(groups, seed):
+    """
+    Matching of find_coordinated_groups before the contingency table: the set intersections of all the (group, seed group) pairs.
+    """
+    correspondences = {}
+    for m in groups:
+        intersection = 0
+        correspondence = -1
+        for m_seed in seed:
+            if len(set(groups[m]).intersection(seed[m_seed])) > intersection:
+                intersection = len(set(groups[m]).intersection(seed[m_seed]))
+                correspondence = m_seed
+        if correspondence >= 0:
+            correspondences[m] = {"to": [correspondence], "intersection": [intersection]}
+    return correspondences
+
+
+@pytest.mark.parametrize("seed_value", range(5))
+def test_match_groups_parity(seed_value):
+    rng = np.random.default_rng(seed_value)
+    # disjoint groups and seed groups over overlapping sets of users, with small groups to have ties
+    groups = dict(enumerate(np.array_split(rng.permutation(300)[:250].astype(str), 40)))
+    seed = dict(enumerate(np.array_split(rng.permutation(300)[:200].astype(str), 25)))
+    groups = {group: nodes.tolist() for group, nodes in groups.items()}
+    seed = {group: nodes.tolist() for group, nodes in seed.items()}
+    groups[40] = ["a", "b"]
+    assert match_groups(groups, seed) == reference_match_groups(groups, seed)
@@ -0,0 +1,74 @@
+import csv
+import jsonlines
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+from include.coord_group_stats import cb_network_stats
+
+COLUMNS = ["size", "weighted_clustering", "unweighted_clustering", "density", "weighted_assortativity", "unweighted_assortativity"]
+
+
+@pytest.fixture(scope="module")
+def sweep(tmp_path_factory):
+    """
+    Block graph with the coordinated groups of a sweep of 21 quantiles: the groups are the blocks, restricted to the nodes with an edge
+    above the threshold, and a few nodes change group at each quantile.
+    """
+    tmp_path = tmp_path_factory.mktemp("stats")
+    G = nx.stochastic_block_model([50] * 6, np.where(np.eye(6), 0.3, 0.01), seed=2)
+    rng = np.random.default_rng(2)
+    edges = pd.DataFrame([(str(u), str(v), float(rng.random())) for u, v in G.edges()], columns=["source", "target", "weight"])
+    edges.to_csv(tmp_path / "edges.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+    # the thresholds are computed on the weights as they are read from the csv
+    edges = pd.read_csv(tmp_path / "edges.csv", dtype={"source": str, "target": str})
+    pd.DataFrame({"user_id": [str(node) for node in G]}).to_csv(tmp_path / "nodes.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+    labels = np.repeat(np.arange(6), 50)
+    with jsonlines.open(tmp_path / "coordinated_groups.jsonl", mode="w") as handle:
+        for quantile in np.linspace(0, 1, 21):
+            threshold = float(np.quantile(edges["weight"], quantile))
+            above = edges[edges["weight"] >= threshold]
+            alive = set(above["source"]) | set(above["target"])
+            moved = rng.choice(len(labels), size=3, replace=False)
+            labels[moved] = rng.integers(0, 6, size=3)
+            groups = {str(group): [str(node) for node in np.flatnonzero(labels == group) if str(node) in alive] for group in range(6)}
+            handle.write({"quantile": quantile, "threshold": threshold, "coordinated_groups": groups})
+    return tmp_path, edges
+
+
+def stats(sweep, **kwargs):
+    tmp_path, _ = sweep
+    return cb_network_stats(tmp_path / "nodes.csv", tmp_path / "edges.csv", tmp_path / "coordinated_groups.jsonl", **kwargs)
+
+
+def test_batch_networkx_parity(sweep):
+    tmp_path, edges = sweep
+    df_stats = stats(sweep)
+    with jsonlines.open(tmp_path / "coordinated_groups.jsonl", mode="r") as handle:
+        rows = list(handle)
+    for row in rows[::5]:
+        for group, nodes in row["coordinated_groups"].items():
+            nodes = set(nodes)
+            group_edges = edges[(edges["weight"] >= row["threshold"]) & edges["source"].isin(nodes) & edges["target"].isin(nodes)]
+            stats_row = df_stats[(df_stats["quantile"] == row["quantile"]) & (df_stats["group"] == group)].iloc[0]
+            assert stats_row["size"] == len(nodes)
+            if len(group_edges) < 3:
+                continue
+            H = nx.Graph()
+            H.add_weighted_edges_from(group_edges.itertuples(index=False))
+            assert stats_row["density"] == pytest.approx(nx.density(H))
+            assert stats_row["unweighted_clustering"] == pytest.approx(nx.average_clustering(H))
+            assert stats_row["weighted_clustering"] == pytest.approx(nx.average_clustering(H, weight="weight"))
+            assert stats_row["unweighted_assortativity"] == pytest.approx(nx.degree_assortativity_coefficient(H), nan_ok=True)
+            assert stats_row["weighted_assortativity"] == pytest.approx(nx.degree_assortativity_coefficient(H, weight="weight"), nan_ok=True)
+
+
+def test_workers_parity(sweep):
+    pd.testing.assert_frame_equal(stats(sweep, workers=3), stats(sweep))
+
+
+def test_incremental_parity(sweep):
+    batch = stats(sweep)
+    incremental = stats(sweep, mode="incremental")
+    pd.testing.assert_frame_equal(incremental.drop(columns=COLUMNS), batch.drop(columns=COLUMNS))
+    np.testing.assert_allclose(incremental[COLUMNS].to_numpy(dtype=float), batch[COLUMNS].to_numpy(dtype=float), rtol=1e-9, atol=1e-12)
@@ -0,0 +1,36 @@
+import csv
+import json
+import numpy as np
+import pandas as pd
+from include.lib import parse_seed_comm
+
+
+def reference_parse_seed_comm(node_csv_path, output_path):
+    """
+    Relabelling of parse_seed_comm before the vectorized version: the nodes of each community are selected with a mask.
+    """
+    df = pd.read_csv(node_csv_path, dtype={"user_id": str})
+    df_count = df.groupby("modularity_class").size().sort_values(ascending=False).reset_index(name='count')
+    seed_mod_dict = dict()
+    df["modularity_def"] = -1
+    for i, row in df_count.iterrows():
+        seed_mod_dict.setdefault(i, df.loc[df["modularity_class"]==row["modularity_class"], "user_id"].to_list())
+        df.loc[df["modularity_class"]==row["modularity_class"], "modularity_def"] = i
+    df[["user_id","modularity_def"]].to_csv(node_csv_path, index=False, header=True, quoting=csv.QUOTE_NONNUMERIC)
+    with open(output_path, "w") as handle:
+        json.dump(seed_mod_dict, handle)
+
+
+def test_parse_seed_comm_parity(tmp_path):
+    rng = np.random.default_rng(8)
+    # communities with non-contiguous labels and tied sizes
+    classes = np.repeat(rng.permutation(60)[:30] * 3, rng.integers(1, 6, size=30))
+    nodes = pd.DataFrame({"user_id": [f"u{user}" for user in range(len(classes))], "modularity_class": rng.permutation(classes)})
+    for name in ["nodes", "reference_nodes"]:
+        nodes.to_csv(tmp_path / f"{name}.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    _, seed = parse_seed_comm(tmp_path / "nodes.csv", tmp_path / "seed.json", return_seed=True)
+    reference_parse_seed_comm(tmp_path / "reference_nodes.csv", tmp_path / "reference_seed.json")
+    assert (tmp_path / "nodes.csv").read_text() == (tmp_path / "reference_nodes.csv").read_text()
+    assert (tmp_path / "seed.json").read_text() == (tmp_path / "reference_seed.json").read_text()
+    assert seed == {int(community): users for community, users in json.loads((tmp_path / "reference_seed.json").read_text()).items()}
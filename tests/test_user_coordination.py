@@ -0,0 +1,42 @@
+import csv
+import itertools
+import jsonlines
+import numpy as np
+import pandas as pd
+from pipeline.compute_user_coordination import compute_user_coordination
+
+
+def reference_user_coordination(coordinated_groups_path, node_csv_path):
+    """
+    User coordination before the single pass: the users of each group are assigned with a pandas mask per row of the sweep.
+    """
+    user_df = pd.read_csv(node_csv_path, dtype={"user_id": str})[["user_id", "modularity_def"]]
+    user_df["quantile"] = None
+    user_df["threshold"] = None
+    user_df["coordinated_group"] = None
+    with jsonlines.open(coordinated_groups_path, mode="r") as handle:
+        for row in handle:
+            for group in sorted(row["coordinated_groups"].keys()):
+                user_df.loc[user_df["user_id"].isin(row["coordinated_groups"][group]), "coordinated_group"] = int(group)
+            ids = list(itertools.chain.from_iterable(row["coordinated_groups"].values()))
+            user_df.loc[user_df["user_id"].isin(ids), "quantile"] = row["quantile"]
+            user_df.loc[user_df["user_id"].isin(ids), "threshold"] = row["threshold"]
+    return user_df
+
+
+def test_user_coordination_parity(tmp_path):
+    rng = np.random.default_rng(7)
+    users = [f"u{user}" for user in range(200)]
+    pd.DataFrame({"user_id": users, "modularity_def": rng.integers(0, 5, size=200)}).to_csv(tmp_path / "nodes.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+    # the groups shrink along the sweep, with more than 10 groups (sorted as strings) and users missing from the node list
+    alive = np.array(users + [f"x{user}" for user in range(20)])
+    with jsonlines.open(tmp_path / "coordinated_groups.jsonl", mode="w") as handle:
+        for quantile in np.linspace(0, 1, 11):
+            alive = alive[rng.random(len(alive)) < 0.85]
+            labels = rng.integers(0, 12, size=len(alive))
+            groups = {str(group): alive[labels == group].tolist() for group in np.unique(labels)}
+            handle.write({"quantile": quantile, "threshold": quantile / 2, "coordinated_groups": groups})
+
+    output_path = compute_user_coordination(tmp_path / "coordinated_groups.jsonl", tmp_path / "nodes.csv", tmp_path)
+    reference = reference_user_coordination(tmp_path / "coordinated_groups.jsonl", tmp_path / "nodes.csv")
+    assert output_path.read_text() == reference.to_csv(index=False, header=True, quoting=csv.QUOTE_NONNUMERIC)
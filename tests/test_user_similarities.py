@@ -0,0 +1,123 @@
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline.parse_sequences import parse_sequences
+from pipeline.compute_user_vector_models import compute_user_vector_models
+from pipeline.save_user_similarities import save_user_similarities
+from pipeline.update_user_similarities import update_user_similarities
+from include.lib import save_pickle
+from include.edge_store import load_edge_list
+from include.user_index import save_user_index
+from include.user_vector_models import compute_tf_idf_model
+from include.user_similarities import save_cosine_similarities, save_sparse_cosine_similarities, save_lsh_cosine_similarities, lsh_candidate_pairs, \
+    load_tfidf_matrix
+
+INPUT_PATH = Path(__file__).resolve().parent.parent / "input_data" / "example_input_superspreaders_raw_seqs.jsonl"
+
+
+@pytest.fixture(scope="module")
+def tfidf_models(tmp_path_factory):
+    """
+    TF-IDF models of 300 users retweeting 150 statuses with a skewed popularity, with a few users without retweets
+    and a few pairs of users with the same retweets.
+    """
+    tmp_path = tmp_path_factory.mktemp("tfidf")
+    rng = np.random.default_rng(4)
+    popularity = 1. / np.arange(1, 151)
+    documents = [[f"s{status}" for status in rng.choice(150, size=rng.integers(1, 20), p=popularity / popularity.sum())] for _ in range(300)]
+    documents[10] = documents[20] = []
+    documents[30:33] = [documents[40]] * 3
+    dct, corpus, model = compute_tf_idf_model(documents)
+    paths = (tmp_path / "user_index.npy", tmp_path / "dct.pickle", tmp_path / "corpus.pickle", tmp_path / "model.pickle")
+    save_user_index([f"u{user}" for user in range(300)], paths[0])
+    for path, obj in zip(paths[1:], (dct, corpus, model)):
+        save_pickle(obj, path)
+    return tmp_path, paths
+
+
+def similarities(save_similarities, tfidf_models, name, **kwargs):
+    tmp_path, paths = tfidf_models
+    df = pd.read_csv(save_similarities(*paths, tmp_path / f"{name}.csv", **kwargs), dtype={"source": str, "target": str})
+    return dict(zip(zip(df["source"], df["target"]), df["weight"]))
+
+
+def test_sparse_gensim_parity(tfidf_models):
+    sparse = similarities(save_sparse_cosine_similarities, tfidf_models, "sparse", chunksize=64)
+    reference = similarities(save_cosine_similarities, tfidf_models, "gensim")
+    # same pairs in the same order, with the same weights
+    assert list(sparse) == list(reference)
+    np.testing.assert_allclose(list(sparse.values()), list(reference.values()), atol=1e-6)
+
+
+def test_lsh_candidate_pairs():
+    rng = np.random.default_rng(5)
+    signatures = rng.integers(0, 3, size=(200, 12)).astype(np.uint32)
+    signatures[[7, 9]] = (1 << 31) - 1
+    sources, targets = lsh_candidate_pairs(signatures, 4, 3)
+    # pairs of users with the same values in at least one band, except the users without features
+    reference = sorted({(u, v) for band in range(4) for u in range(200) for v in range(u + 1, 200)
+                        if u not in (7, 9) and v not in (7, 9) and (signatures[u, band * 3:(band + 1) * 3] == signatures[v, band * 3:(band + 1) * 3]).all()})
+    assert list(zip(sources.tolist(), targets.tolist())) == reference
+
+
+def test_lsh_edges_subset(tfidf_models):
+    lsh = similarities(save_lsh_cosine_similarities, tfidf_models, "lsh", bands=16, rows=2)
+    exact = similarities(save_sparse_cosine_similarities, tfidf_models, "exact")
+    assert len(lsh) > 0 and set(lsh) <= set(exact)
+    assert all(lsh[pair] == pytest.approx(exact[pair], abs=1e-6) for pair in lsh)
+    # the users with the same retweets are always candidates
+    assert lsh[("u30", "u31")] == pytest.approx(1.)
+
+
+@pytest.mark.parametrize("top_k, min_weight, workers", [(1, 0., 1), (3, 0., 1), (3, 0.2, 1), (3, 0., 2)])
+def test_top_k_parity(tfidf_models, top_k, min_weight, workers):
+    _, paths = tfidf_models
+    pruned = similarities(save_sparse_cosine_similarities, tfidf_models, f"top_{top_k}_{min_weight}_{workers}", chunksize=64,
+                          workers=workers, min_weight=min_weight, top_k_per_user=top_k)
+    # an edge is kept if it is one of the top_k strongest edges (ties included) of one of its users
+    X = load_tfidf_matrix(*paths[1:])
+    S = X.dot(X.T.tocsr()).toarray()
+    np.fill_diagonal(S, 0.)
+    S[S < min_weight] = 0.
+    thresholds = np.array([np.sort(row[row > 0])[::-1][:top_k].min(initial=np.inf) for row in S])
+    sources, targets = np.nonzero(np.triu((S > 0) & ((S >= thresholds[:, None]) | (S >= thresholds[None, :])), k=1))
+    assert list(pruned) == [(f"u{source}", f"u{target}") for source, target in zip(sources, targets)]
+    np.testing.assert_allclose(list(pruned.values()), S[sources, targets], atol=1e-6)
+
+
+def similarity_network(input_path, outdir):
+    outdir.mkdir(parents=True, exist_ok=True)
+    user_vector_models_path = compute_user_vector_models(parse_sequences(input_path, outdir), outdir)
+    return save_user_similarities(user_vector_models_path, outdir)[1]
+
+
+def edges(path):
+    user_ids, columns = load_edge_list(path)
+    return {frozenset((user_ids[source], user_ids[target])): weight for source, target, weight in zip(columns["source"], columns["target"], columns["weight"])}
+
+
+@pytest.fixture(scope="module")
+def updated_networks(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("update")
+    lines = INPUT_PATH.read_text().splitlines()
+    (tmp_path / "first.jsonl").write_text("\n".join(lines[:8]) + "\n")
+    (tmp_path / "second.jsonl").write_text("\n".join(lines[8:]) + "\n")
+    similarity_network(tmp_path / "first.jsonl", tmp_path / "frozen")
+    shutil.copytree(tmp_path / "frozen", tmp_path / "refreshed")
+    frozen = update_user_similarities(tmp_path / "second.jsonl", tmp_path / "frozen")[1]
+    refreshed = update_user_similarities(tmp_path / "second.jsonl", tmp_path / "refreshed", refresh_idf=True)[1]
+    scratch = similarity_network(INPUT_PATH, tmp_path / "scratch")
+    return edges(frozen), edges(refreshed), edges(scratch)
+
+
+def test_update_refresh_idf_parity(updated_networks):
+    _, refreshed, scratch = updated_networks
+    assert set(refreshed) == set(scratch)
+    assert all(refreshed[pair] == pytest.approx(scratch[pair], abs=1e-6) for pair in scratch)
+
+
+def test_update_frozen_idf_pairs(updated_networks):
+    frozen, _, scratch = updated_networks
+    assert set(frozen) == set(scratch)